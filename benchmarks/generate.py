@@ -0,0 +1,309 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains generators of synthetic data in each of the
+formats supported by export2hdf5. The data is random but reproducible
+(the generators are seeded), and the size of the data is set by the
+duration of the recording (in seconds) and, where the format allows
+it, the number of channels.
+
+Each generator writes the data files to a directory and returns the
+dataset for the configuration file, i.e., a dict with the filename,
+the data type and the maps.
+"""
+
+import os
+import json
+import struct
+import zipfile
+import datetime
+import numpy as np
+
+## The starting time of the generated recordings
+TIME_START = datetime.datetime(2017, 1, 1, 10, 0, 0)
+
+def get_rng(seed=0):
+    """ Return the random number generator used for the data. """
+    return np.random.default_rng(seed)
+
+def signal_map(path, channels=["*"], shared_group=1):
+    """ Return a map for a signal dataset. """
+    return {"path" : path, "channels" : channels, "shared_group" : shared_group}
+
+def generate_edf(dname, duration, n_channels, sampling_rate=256, rng=None):
+    """ Generate an EDF+ file with n_channels channels. """
+    import pyedflib
+
+    rng = rng or get_rng()
+    fname = os.path.join(dname, "recording.edf")
+    labels = ["EEG_" + str(i + 1) for i in range(n_channels)]
+
+    edf = pyedflib.EdfWriter(fname, n_channels, file_type=pyedflib.FILETYPE_EDFPLUS)
+    edf.setSignalHeaders([{"label" : label, "dimension" : "uV",
+                           "sample_frequency" : sampling_rate,
+                           "physical_max" : 3000, "physical_min" : -3000,
+                           "digital_max" : 32767, "digital_min" : -32768,
+                           "transducer" : "", "prefilter" : ""} for label in labels])
+    edf.setStartdatetime(TIME_START)
+
+    ## write the data in blocks of 60 s to limit the memory use
+    n_total = int(duration * sampling_rate)
+    block = 60 * sampling_rate
+    for start in range(0, n_total, block):
+        n = min(block, n_total - start)
+        edf.writeSamples([rng.standard_normal(n) * 100 for i in labels])
+    edf.close()
+
+    return {"filename" : fname, "data_type" : "edf", "maps" : [signal_map("EEG/EDF")]}
+
+def generate_neurone(dname, duration, n_channels, sampling_rate=1000, rng=None):
+    """ Generate a NeurOne measurement (Protocol.xml, Session.xml,
+    1/1.bin and 1/events.bin) with n_channels channels. """
+    rng = rng or get_rng()
+    fpath = os.path.join(dname, "neurone")
+    os.makedirs(os.path.join(fpath, "1"), exist_ok=True)
+
+    labels = ["Ch" + str(i + 1) for i in range(n_channels)]
+    inputs = "".join("<TableInput><PhysicalInputNumber>%d</PhysicalInputNumber><Name>%s</Name></TableInput>" % (i + 1, label)
+                     for i, label in enumerate(labels))
+
+    with open(os.path.join(fpath, "Protocol.xml"), "w") as file:
+        file.write('<?xml version="1.0"?><DataSetGeneralProtocol xmlns="http://www.megaemg.com/DataSetGeneralProtocol.xsd">' +
+                   inputs +
+                   "<TableProtocol><ActualSamplingFrequency>%d</ActualSamplingFrequency></TableProtocol></DataSetGeneralProtocol>" % sampling_rate)
+
+    time_stop = TIME_START + datetime.timedelta(seconds=duration)
+    with open(os.path.join(fpath, "Session.xml"), "w") as file:
+        file.write('<?xml version="1.0"?><DataSetGeneralSession xmlns="http://www.megaemg.com/DataSetGeneralSession.xsd"><TableSession>' +
+                   "<StartDateTime>%s+02:00</StartDateTime><StopDateTime>%s+02:00</StopDateTime>" % (TIME_START.isoformat(timespec="microseconds"), time_stop.isoformat(timespec="microseconds")) +
+                   "</TableSession></DataSetGeneralSession>")
+
+    ## write the samples in blocks of 60 s
+    n_total = int(duration * sampling_rate)
+    block = 60 * sampling_rate
+    with open(os.path.join(fpath, "1", "1.bin"), "wb") as file:
+        for start in range(0, n_total, block):
+            n = min(block, n_total - start)
+            rng.integers(-1000, 1000, (n, n_channels)).astype("<i4").tofile(file)
+
+    ## one trigger every 10 s, in the binary format of the events
+    with open(os.path.join(fpath, "1", "events.bin"), "wb") as file:
+        for i in range(int(duration / 10)):
+            index = 10 * i * sampling_rate
+            file.write(struct.pack("<6i6q4i", 5, 0, 4, 3, 0, i % 8, index, index + 10, 0, 0, 0, 0, 0, 0, 0, 0))
+
+    return [{"filename" : fpath, "data_type" : "neurone", "maps" : [signal_map("EEG/NeurOne")]},
+            {"filename" : fpath, "data_type" : "neurone_events", "maps" : [{"path" : "Events/NeurOne"}]}]
+
+def generate_empatica(dname, duration, rng=None):
+    """ Generate an Empatica E4 zip archive. The channels are fixed. """
+    rng = rng or get_rng()
+    t_start = TIME_START.timestamp()
+    fname = os.path.join(dname, "empatica.zip")
+
+    def signal(n_columns, sampling_rate, values):
+        header = ",".join(["%.1f" % t_start] * n_columns) + "\n" + ",".join(["%.6f" % sampling_rate] * n_columns) + "\n"
+        return header + "\n".join(",".join(i) for i in values.astype(str)) + "\n"
+
+    n = lambda rate: int(duration * rate)
+    with zipfile.ZipFile(fname, "w", zipfile.ZIP_DEFLATED) as zfile:
+        zfile.writestr("ACC.csv", signal(3, 32, rng.integers(-64, 64, (n(32), 3))))
+        zfile.writestr("BVP.csv", signal(1, 64, np.round(rng.standard_normal((n(64), 1)) * 50, 2)))
+        zfile.writestr("EDA.csv", signal(1, 4, np.round(rng.random((n(4), 1)), 6)))
+        zfile.writestr("TEMP.csv", signal(1, 4, np.round(rng.random((n(4), 1)) + 33, 2)))
+        zfile.writestr("HR.csv", signal(1, 1, np.round(rng.random((n(1), 1)) * 60 + 40, 2)))
+
+        ibi = rng.random(n(1)) * 0.5 + 0.6
+        zfile.writestr("IBI.csv", "%.1f, IBI\n" % t_start + "\n".join("%.6f,%.6f" % i for i in zip(np.cumsum(ibi), ibi)) + "\n")
+
+    return {"filename" : fname, "data_type" : "empatica", "maps" : [signal_map("Acc/E4", ["acc_x", "acc_y", "acc_z"]),
+                                                                      signal_map("BVP/E4", ["BVP"]),
+                                                                      signal_map("IBI/E4", ["IBI"], 0)]}
+
+def generate_shimmer(dname, duration, n_channels, sampling_rate=128, rng=None):
+    """ Generate a Shimmer csv file with n_channels channels in
+    addition to the timestamp. """
+    rng = rng or get_rng()
+    fname = os.path.join(dname, "shimmer.csv")
+
+    names = ["Accel_LN_X", "Accel_LN_Y", "Accel_LN_Z", "Gyro_X", "Gyro_Y", "Gyro_Z", "GSR_Skin_Resistance", "Pressure_BMP280", "Temperature_BMP280"]
+    labels = ["Shimmer_Timestamp_Unix_CAL"] + ["Shimmer_" + names[i % len(names)] + "_CAL" for i in range(n_channels)]
+
+    n_total = int(duration * sampling_rate)
+    block = 60 * sampling_rate
+    with open(fname, "w") as file:
+        file.write('"sep=,"\n')
+        file.write(",".join(labels) + ",\n")
+        file.write(",".join(["ms"] + ["u"] * n_channels) + ",\n")
+        for start in range(0, n_total, block):
+            n = min(block, n_total - start)
+            tstamp = TIME_START.timestamp() * 1000 + (start + np.arange(n)) * 1000.0 / sampling_rate
+            data = np.column_stack([tstamp, rng.standard_normal((n, n_channels))])
+            np.savetxt(file, data, fmt="%.6f", delimiter=",", newline=",\n")
+
+    return {"filename" : fname, "data_type" : "shimmer", "maps" : [signal_map("Shimmer")]}
+
+def generate_actigraph(dname, duration, rng=None):
+    """ Generate an Actigraph CSV export of raw data (3 channels, 50 Hz). """
+    rng = rng or get_rng()
+    fname = os.path.join(dname, "actigraph.csv")
+
+    header = ["------------ Data File Created By ActiGraph -----",
+              "Serial Number: 0",
+              "Start Time " + TIME_START.strftime("%H:%M:%S"),
+              "Start Date " + TIME_START.strftime("%d.%m.%Y"),
+              "Epoch Period (hh:mm:ss) 00:00:00",
+              "Download Time 10:00:00",
+              "Download Date 02.01.2017",
+              "Current Memory Address: 0",
+              "Current Battery Voltage: 4",
+              "Mode = 12",
+              "Accelerometer X,Accelerometer Y,Accelerometer Z"]
+
+    n_total = int(duration * 50)
+    with open(fname, "w") as file:
+        file.write("\n".join(header) + "\n")
+        for start in range(0, n_total, 3000):
+            np.savetxt(file, rng.standard_normal((min(3000, n_total - start), 3)), fmt="%.3f", delimiter=",")
+
+    return {"filename" : fname, "data_type" : "actigraph", "maps" : [signal_map("Acc/Actigraph")]}
+
+def generate_bodyguard(dname, duration, n_channels, rng=None):
+    """ Generate the Firstbeat Bodyguard files: features (n_channels
+    features at 1 Hz), miscellaneous features, acceleration and IBI. """
+    rng = rng or get_rng()
+    out = []
+    n = int(duration)
+
+    fname = os.path.join(dname, "bodyguard_features.csv")
+    labels = ["Feature" + str(i + 1) + "Vector" for i in range(n_channels)]
+    with open(fname, "w") as file:
+        file.write("Header;0\nSessionStartDate;%s;\nSessionStartTime;%s;\nVECTORS\n" % (TIME_START.strftime("%d.%m.%Y"), TIME_START.strftime("%H:%M:%S")))
+        file.write(";".join(["Seconds", "Time"] + labels) + "\n")
+        values = np.round(rng.random((n, n_channels)) * 100, 2)
+        for i in range(n):
+            file.write("%d;%s;" % (i, (TIME_START + datetime.timedelta(seconds=i)).strftime("%H:%M:%S")) +
+                       ";".join(("%.2f" % v).replace(".", ",") for v in values[i]) + "\n")
+    out += [{"filename" : fname, "data_type" : "bodyguard_features", "maps" : [signal_map("Features/Firstbeat")]}]
+
+    fname = os.path.join(dname, "bodyguard_misc.csv")
+    with open(fname, "w") as file:
+        file.write("Misc\n0\n0\nEnergyVector;StressVector;TimeVector;RecoveryVector\n")
+        for i in range(n):
+            energy = ("%.1f" % (i % 60)).replace(".", ",") if i % 2 else ""
+            file.write("%s;%d,0;%d;%d,5\n" % (energy, i % 7, i, i % 11))
+    out += [{"filename" : fname, "data_type" : "bodyguard_features_misc", "maps" : [signal_map("Misc/Firstbeat", shared_group=0)]}]
+
+    fname = os.path.join(dname, "bodyguard_acc.csv")
+    n_acc = int(duration * 25)
+    with open(fname, "w") as file:
+        file.write("StartTime;%s\nGScale;4G\nSampleRate;25Hz\nSampleSize;8bit\nms;x;y;z\n" % TIME_START.strftime("%d.%m.%Y %H:%M.%S"))
+        data = np.column_stack([np.arange(n_acc) * 40, rng.integers(-128, 128, (n_acc, 3))])
+        np.savetxt(file, data, fmt="%d", delimiter=";")
+    out += [{"filename" : fname, "data_type" : "bodyguard_acc", "maps" : [signal_map("Acc/Firstbeat")]}]
+
+    fname = os.path.join(dname, "bodyguard_ibi.csv")
+    with open(fname, "w") as file:
+        file.write("IBI\nStart time: %s\n0\n0\nIbiVector;ArtifactVector\n" % TIME_START.strftime("%d.%m.%Y %H:%M:%S"))
+        data = np.column_stack([rng.integers(600, 1100, n), rng.integers(0, 2, n)])
+        np.savetxt(file, data, fmt="%d", delimiter=";")
+    out += [{"filename" : fname, "data_type" : "bodyguard_ibi", "maps" : [signal_map("IBI/Firstbeat")]}]
+
+    return out
+
+def generate_mydarwin(dname, duration, rng=None):
+    """ Generate the MyDarwin IBI and summary csv exports. """
+    rng = rng or get_rng()
+    n = int(duration)
+
+    fname_ibi = os.path.join(dname, "mydarwin_ibi.csv")
+    np.savetxt(fname_ibi, np.column_stack([rng.integers(600, 1100, n), rng.integers(0, 3, n)]), fmt="%d", delimiter=",")
+
+    fname_summary = os.path.join(dname, "mydarwin_summary.csv")
+    n_summary = max(1, n // 60)
+    data = np.column_stack([np.arange(n_summary) * 60, np.arange(n_summary) * 60 + 60,
+                            rng.integers(50, 90, n_summary), rng.integers(20, 60, n_summary)])
+    np.savetxt(fname_summary, data, fmt="%d", delimiter=",", header="start,end,hr,rmssd", comments="")
+
+    return [{"filename" : fname_ibi, "data_type" : "mydarwin_ibi", "maps" : [signal_map("IBI/MyDarwin")]},
+            {"filename" : fname_summary, "data_type" : "mydarwin_summary", "maps" : [signal_map("Summary/MyDarwin")]}]
+
+def generate_psg(dname, duration, rng=None):
+    """ Generate a PSG event XML file with one sleep stage per 30 s epoch
+    and arousals. """
+    rng = rng or get_rng()
+    fname = os.path.join(dname, "psg.xml")
+
+    stages = ["SLEEP-S0", "SLEEP-S1", "SLEEP-S2", "SLEEP-S3", "SLEEP-REM", "SLEEP-MT"]
+    fmt = lambda t: t.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    event = lambda ev_type, start, stop: "<Event><Type>%s</Type><Location>0</Location><StartTime>%s</StartTime><StopTime>%s</StopTime></Event>" % (ev_type, fmt(start), fmt(stop))
+
+    with open(fname, "w") as file:
+        file.write('<?xml version="1.0"?><EventExport><Events>')
+        for i, stage in enumerate(rng.integers(0, len(stages), int(duration / 30))):
+            start = TIME_START + datetime.timedelta(seconds=30 * i)
+            file.write(event(stages[stage], start, start + datetime.timedelta(seconds=30)))
+            if rng.random() < 0.2:
+                onset = start + datetime.timedelta(seconds=float(rng.random() * 20))
+                file.write(event("AROUSAL", onset, onset + datetime.timedelta(seconds=float(3 + rng.random() * 10))))
+        file.write("</Events></EventExport>")
+
+    return [{"filename" : fname, "data_type" : "psg_hypnogram", "maps" : [signal_map("Hypnogram/PSG")]},
+            {"filename" : fname, "data_type" : "psg_events", "maps" : [{"path" : "Events/PSG"}]}]
+
+def generate_text(dname, duration, rng=None):
+    """ Generate a text file with one line of notes per minute. """
+    fname = os.path.join(dname, "notes.txt")
+    with open(fname, "w") as file:
+        for i in range(max(1, int(duration / 60))):
+            file.write("%d min: nothing to report\n" % i)
+    return {"filename" : fname, "data_type" : "text", "maps" : [{"path" : "Notes/Text"}]}
+
+## The generators for each benchmark case. Each generator is called
+## as generator(directory, duration, n_channels, rng).
+GENERATORS = {"edf"       : lambda d, duration, n_channels, rng : generate_edf(d, duration, n_channels, rng=rng),
+              "neurone"   : lambda d, duration, n_channels, rng : generate_neurone(d, duration, n_channels, rng=rng),
+              "empatica"  : lambda d, duration, n_channels, rng : generate_empatica(d, duration, rng=rng),
+              "shimmer"   : lambda d, duration, n_channels, rng : generate_shimmer(d, duration, n_channels, rng=rng),
+              "actigraph" : lambda d, duration, n_channels, rng : generate_actigraph(d, duration, rng=rng),
+              "bodyguard" : lambda d, duration, n_channels, rng : generate_bodyguard(d, duration, n_channels, rng=rng),
+              "mydarwin"  : lambda d, duration, n_channels, rng : generate_mydarwin(d, duration, rng=rng),
+              "psg"       : lambda d, duration, n_channels, rng : generate_psg(d, duration, rng=rng),
+              "text"      : lambda d, duration, n_channels, rng : generate_text(d, duration, rng=rng)}
+
+def generate_case(case, dname, duration, n_channels, seed=0):
+    """
+    Generate the data of one benchmark case and its configuration file.
+
+    Arguments:
+       - case : the name of the case (a key in GENERATORS)
+       - dname : the directory the data is written to
+       - duration : the duration of the recording in seconds
+       - n_channels : the number of channels (if the format allows it)
+       - seed : the seed of the random number generator
+
+    Returns:
+       - the name of the configuration file. The output file of the
+         configuration is dname/out.h5.
+    """
+    os.makedirs(dname, exist_ok=True)
+
+    datasets = GENERATORS[case](dname, duration, n_channels, get_rng(seed))
+    if not isinstance(datasets, list):
+        datasets = [datasets]
+
+    config = {"output" : {"filename" : os.path.join(dname, "out.h5")}, "datasets" : datasets}
+    fname = os.path.join(dname, "config.json")
+    with open(fname, "w") as file:
+        json.dump(config, file, indent=1)
+
+    return fname
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+Benchmarks for export2hdf5.
+
+For each supported format, synthetic data is generated (see generate.py)
+and exported end-to-end with export2hdf5 in a separate process with
+profiling enabled. The wall time, the throughput, the peak memory, the
+size of the output and the time used in each stage (reading, converting,
+writing, metadata) are recorded.
+
+The results can be stored as a baseline and later runs compared with it:
+
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py
+
+Everything runs offline.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+
+import generate
+
+## The directory of the benchmarks and the root of the repository
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+
+## The default baseline file
+BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+## The relative increase of a measure that is reported as a regression
+TOLERANCE = 0.25
+
+## The measures compared with the baseline
+MEASURES = ["wall_time", "peak_rss", "output_bytes"]
+
+def get_environment():
+    """ Return a description of the machine and the libraries. """
+    import numpy
+    import h5py
+    return {"python" : platform.python_version(),
+            "platform" : platform.platform(),
+            "processor" : platform.processor(),
+            "numpy" : numpy.__version__,
+            "h5py" : h5py.__version__,
+            "hdf5" : h5py.version.hdf5_version}
+
+def summarize_stages(rep):
+    """ Return the time used in each stage of the export from the
+    profile report rep. """
+    out = {"read" : 0, "convert" : 0, "write" : 0, "metadata" : 0}
+    for rec in rep["stages"]:
+        if rec["stage"] == "read":
+            out["read"] += rec["wall_time"]
+        if rec["stage"] == "metadata":
+            out["metadata"] += rec["wall_time"]
+        if rec["stage"] == "dataset":
+            out["convert"] += rec["convert_time"]
+            out["write"] += rec["write_time"]
+    return out
+
+def run_case(fname_config, dname):
+    """
+    Export the data defined in the configuration file in a separate
+    process with profiling enabled.
+
+    Returns:
+       - a dict with the results
+    """
+    fname_report = os.path.join(dname, "profile.json")
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+
+    subprocess.run([sys.executable, "-m", "export2hdf5.export_hdf5",
+                    "--config", fname_config,
+                    "--profile", "--profile-report", fname_report],
+                   env=env, check=True, stdout=subprocess.DEVNULL)
+
+    with open(fname_report, "r") as file:
+        rep = json.load(file)
+
+    total = rep["total"]
+    return {"wall_time" : total["wall_time"],
+            "cpu_time" : total["cpu_time"],
+            "peak_rss" : total["peak_rss"],
+            "source_bytes" : total["bytes_in"],
+            "raw_bytes" : total["raw_bytes"],
+            "output_bytes" : os.path.getsize(rep["output"]),
+            "throughput" : total["bytes_in"] / max(total["wall_time"], 1e-9),
+            "stages" : summarize_stages(rep)}
+
+def run_benchmarks(cases, duration, n_channels, repeat=3, dname=None):
+    """
+    Run the benchmarks.
+
+    Arguments:
+       - cases : the names of the benchmark cases (see generate.GENERATORS)
+       - duration : the duration of the generated recordings in seconds
+       - n_channels : the number of channels in the generated recordings
+       - repeat : the number of times each case is exported. The
+                  fastest run is reported.
+       - dname : the directory for the data. A temporary directory is
+                 used (and removed) if not given.
+
+    Returns:
+       - a dict with the parameters, the environment and the results
+    """
+    tmp = None
+    if dname is None:
+        tmp = dname = tempfile.mkdtemp(prefix="export2hdf5_benchmark_")
+
+    results = {}
+    try:
+        for case in cases:
+            print("Running:\t", case)
+            dname_case = os.path.join(dname, case)
+            ## the data is generated in a separate process, since the
+            ## export processes would inherit the peak memory of this one
+            with multiprocessing.get_context("spawn").Pool(1) as pool:
+                fname_config = pool.apply(generate.generate_case, (case, dname_case, duration, n_channels))
+            runs = [run_case(fname_config, dname_case) for i in range(repeat)]
+            results[case] = min(runs, key=lambda i: i["wall_time"])
+            results[case]["peak_rss"] = max(i["peak_rss"] or 0 for i in runs)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+
+    return {"parameters" : {"duration" : duration, "n_channels" : n_channels, "repeat" : repeat},
+            "environment" : get_environment(),
+            "results" : results}
+
+def compare(res, baseline, tolerance=TOLERANCE):
+    """
+    Compare benchmark results with a baseline.
+
+    Returns:
+       - a list of regressions (strings), i.e., measures that have
+         increased more than the tolerance
+    """
+    if res["parameters"]["duration"] != baseline["parameters"]["duration"] or \
+       res["parameters"]["n_channels"] != baseline["parameters"]["n_channels"]:
+        print("Warning! The parameters differ from those of the baseline.\n")
+
+    regressions = []
+    for case, values in res["results"].items():
+        if case not in baseline["results"]:
+            continue
+        for measure in MEASURES:
+            old = baseline["results"][case][measure]
+            new = values[measure]
+            if old and new > old * (1 + tolerance):
+                regressions += ["%s: %s increased from %.4g to %.4g (%+.0f %%)" % (case, measure, old, new, 100.0 * (new / old - 1))]
+    return regressions
+
+def print_results(res, baseline=None):
+    """ Print the results, relative to the baseline if given. """
+    print("\n%-10s %10s %12s %10s %12s %8s %8s %8s %8s" % ("case", "time (s)", "MB/s", "RSS (MB)", "output (MB)", "read", "convert", "write", "meta"))
+    for case, values in res["results"].items():
+        line = "%-10s %10.3f %12.1f %10.1f %12.2f" % (case, values["wall_time"], values["throughput"] / 1e6,
+                                                       (values["peak_rss"] or 0) / 1e6, values["output_bytes"] / 1e6)
+        line += " %8.3f %8.3f %8.3f %8.3f" % tuple(values["stages"][i] for i in ["read", "convert", "write", "metadata"])
+        if baseline is not None and case in baseline["results"]:
+            line += "   (baseline %.3f s)" % baseline["results"][case]["wall_time"]
+        print(line)
+    print("")
+
+def main():
+    """ Command line interface for the benchmarks. """
+    parser = argparse.ArgumentParser(description="export2hdf5 benchmarks")
+    parser.add_argument("--cases", nargs="+", default=sorted(generate.GENERATORS.keys()),
+                        help="The benchmark cases (default: all).")
+    parser.add_argument("--duration", type=float, default=3600,
+                        help="Duration of the generated recordings in seconds.")
+    parser.add_argument("--channels", type=int, default=8, dest="n_channels",
+                        help="Number of channels in the generated recordings.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of runs of each case.")
+    parser.add_argument("--data-dir", dest="data_dir",
+                        help="Directory for the generated data (default: a temporary directory).")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="The baseline file.")
+    parser.add_argument("--save-baseline", action="store_true", dest="save_baseline",
+                        help="Store the results as the baseline.")
+    parser.add_argument("--output", help="Also write the results to this file.")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Relative increase reported as a regression.")
+
+    args = parser.parse_args()
+
+    res = run_benchmarks(args.cases, args.duration, args.n_channels, args.repeat, args.data_dir)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(res, file, indent=1)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(res, file, indent=1)
+        print_results(res)
+        print("Baseline written to:\t", args.baseline)
+        return
+
+    baseline = None
+    if os.path.isfile(args.baseline):
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+
+    print_results(res, baseline)
+
+    if baseline is not None:
+        regressions = compare(res, baseline, args.tolerance)
+        for i in regressions:
+            print("Regression!", i)
+        if regressions:
+            sys.exit(1)
+        print("No regressions compared with the baseline.")
+
+if __name__ == "__main__":
+    main()
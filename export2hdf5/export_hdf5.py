@@ -20,68 +20,317 @@ import os
 import sys
 import argparse
 import json
-import jsonschema
-import pkg_resources
-
-from . import utilities_h5 as h5utils
-from . import utilities_general as utils
-from . import utilities_edf as edfutils
-from . import utilities_empatica as empaticautils
-from . import utilities_firstbeat as firstbeatutils
-from . import utilities_mydarwin as mydarwinutils
-from . import utilities_psg as psgutils
-from . import utilities_shimmer as shimmerutils
-from . import utilities_neurone as neuroneutils
-from . import utilities_actigraph as actigraphutils
-
-def export_hdf5(fname):
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import utilities_readers as readerutils
+from . import utilities_profile as profutils
+from . import utilities_memory as memutils
+
+def get_readerlist():
+    """
+    Return the map of data types to data reading functions.
+    The modules of the readers are imported when they are
+    first used (see utilities_readers).
+    """
+    return readerutils.get_readerlist()
+
+
+def export_hdf5(fname, profile=False, profile_h5=False, max_memory=None, shards=None, jobs=1, live=False,
+                catalog=None, fletcher32=None):
     """
     Export data defined in a configuration file to an HDF5 file.
 
     Arguments:
        - fname : full path to the configuration file
 
+       - profile : if True, the stages of the export are profiled
+                   (see utilities_profile)
+
+       - profile_h5 : if True, the profile is also added as attributes
+                      to the HDF5 file
+
+       - max_memory : the memory budget of the export in bytes (or,
+                      e.g., "512M"). The readers and writers then
+                      process the data in blocks fitting the budget
+                      (see utilities_memory), and the export fails with
+                      a MemoryError for datasets estimated to exceed it.
+
+       - shards : if True, each dataset is written to its own HDF5 file
+                  (a shard) and the output file is a master file
+                  presenting the shards (see utilities_shards). By
+                  default the option shards in the output section of
+                  the configuration file is used.
+
+       - jobs : the number of datasets exported in parallel processes
+                in sharded output. The memory budget is divided
+                between the processes.
+
+       - live : if True, the file can be read by other processes while
+                the signals are written (in SWMR mode, see
+                utilities_live and create_live). With shards each
+                shard is live.
+
+       - catalog : the name of an SQLite catalog (see
+                   utilities_catalog), to which the output file, its
+                   sources and its channels are added after the export
+
+       - fletcher32 : if True, the datasets are written with fletcher32
+                      checksums. By default the option fletcher32 in
+                      the output section of the configuration file is
+                      used.
+
     Returns:
-       - Nothing. All data is written to the HDF5 fle, the filename
+       - The profile report as a dict if profile is True, otherwise
+         nothing. All data is written to the HDF5 fle, the filename
          of which is specified in the configuration file.
     """
-    # Map for data reading functions
-    readerlist = {"edf"                     : {'function' : edfutils.read_edf_file,                      'reader_type' : 'signal'}, 
-                  "edf_faros"               : {'function' : edfutils.read_faros,                         'reader_type' : 'signal'},
-                  "mydarwin_ibi"            : {'function' : mydarwinutils.read_mydarwin_data_ibi,        'reader_type' : 'signal'},
-                  "mydarwin_summary"        : {'function' : mydarwinutils.read_mydarwin_data_summary,    'reader_type' : 'signal'},
-                  "empatica"                : {'function' : empaticautils.read_empatica,                 'reader_type' : 'signal'},
-                  "bodyguard_features"      : {'function' : firstbeatutils.read_bodyguard_features,      'reader_type' : 'signal'},
-                  "bodyguard_features_misc" : {'function' : firstbeatutils.read_bodyguard_features_misc, 'reader_type' : 'signal'},
-                  "bodyguard_ibi"           : {'function' : firstbeatutils.read_bodyguard_ibi,           'reader_type' : 'signal'},
-                  "bodyguard_acc"           : {'function' : firstbeatutils.read_bodyguard_acc,           'reader_type' : 'signal'},
-                  "psg_hypnogram"           : {'function' : psgutils.read_hypnogram,                     'reader_type' : 'signal'},
-                  "psg_arousal"             : {'function' : psgutils.read_arousal,                       'reader_type' : 'signal'},
-                  "shimmer"                 : {'function' : shimmerutils.read_shimmer,                   'reader_type' : 'signal'},
-                  "neurone"                 : {'function' : neuroneutils.read_neurone_data_hdf5,         'reader_type' : 'signal'},
-                  "neurone_events"          : {'function' : neuroneutils.read_neurone_events_hdf5,       'reader_type' : 'events'},
-                  "actigraph"               : {'function' : actigraphutils.read_actigraph,               'reader_type' : 'signal'},
-                  "text"                    : {'function' : utils.read_text,                 'reader_type' : 'text'},
-                  }
+    from . import utilities_catalog as catalogutils
+    readerlist = get_readerlist()
 
     config = load_json_file(fname)
+
+    if shards is None:
+        shards = bool(config["output"].get("shards", False))
+    if fletcher32 is not None:
+        config["output"] = dict(config["output"], fletcher32=fletcher32)
+
+    memutils.set_budget(max_memory)
+    try:
+        if shards:
+            rep = export_sharded(config, profile, profile_h5, jobs, live)
+        else:
+            rep = export_datasets(config, readerlist, profile, profile_h5, live)
+    finally:
+        memutils.set_budget(None)
+
+    if catalog is not None:
+        print("\nAdding to catalog:\t", catalog)
+        catalogutils.add_file(catalog, config["output"]["filename"], config["datasets"])
+
+    return rep
+
+def export_datasets(config, readerlist, profile=False, profile_h5=False, live=False):
+    """
+    Export the datasets in a configuration (a dict) to the HDF5 file
+    given in it. See export_hdf5 for the arguments.
+
+    In a live export the objects of the signals are first created from
+    the headers of the data sources, and the signals are then read and
+    written in SWMR mode (see create_live).
+    """
+    from . import utilities_h5 as h5utils
+    from . import utilities_live as liveutils
     fname_out = config["output"]["filename"]
 
     print("Creating new HDF5 file:\t", fname_out, "\n\n")
-    fid = h5utils.init_h5(fname_out)
+    fid = h5utils.init_h5(fname_out, live)
 
     dataset_list = config["datasets"]
+    rep = None
 
-    for dataset in dataset_list:
-        data = readerlist[dataset["data_type"]]['function'](dataset["filename"])
+    try:
+        if profile:
+            profutils.start()
+        h5utils.set_checksums(config["output"].get("fletcher32", False))
+
+        if live:
+            dataset_list = create_live(dataset_list, readerlist, fid)
+            print("\nWriting the signals in SWMR mode.\n")
+            liveutils.start_swmr(fid)
+
+        for dataset in dataset_list:
+            export_dataset(dataset, readerlist[dataset["data_type"]], fid)
+
+        if profile:
+            rep = profutils.report(profutils.stop(), fname_out)
+            if memutils.get_budget() is not None:
+                rep["total"]["max_memory"] = memutils.get_budget()
+                rep["total"]["memory_usage"] = memutils.usage(rep["total"]["peak_rss"])
+            if profile_h5 and live:
+                ## new attributes are not seen by the readers in SWMR mode
+                print("\nWarning! The profile is not added to the HDF5 file in a live export.")
+            elif profile_h5:
+                profutils.add_report_h5(fid, rep)
+    finally:
+        liveutils.set_phase(None)
+        h5utils.set_checksums(False)
+        ## if the export failed, stop the sampling of the RSS and
+        ## discard the stages, so they do not leak into the next export
+        if profile and profutils.enabled():
+            profutils.stop()
+        h5utils.close_h5(fid)
+
+    if memutils.get_budget() is not None:
+        print_memory_usage()
+
+    return rep
+
+def export_dataset(dataset, reader, fid):
+    """
+    Read a dataset of a configuration and write it into an HDF5 file.
+
+    Arguments:
+       - dataset : a dictionary describing the dataset to be exported
+       - reader : the reader of the data type (see get_readerlist)
+       - fid : file handle to the HDF5 file
+    """
+    from . import utilities_plan as planutils
+    if memutils.get_budget() is not None:
+        check_memory(dataset, reader)
+
+    with profutils.stage("dataset", dataset=dataset["filename"], data_type=dataset["data_type"]):
+        with profutils.stage("read") as rec:
+            data = reader['function'](dataset["filename"])
+            if rec is not None:
+                profutils.add(rec, bytes_in=planutils.source_size(dataset["filename"]))
 
-        if 'signal' == readerlist[dataset["data_type"]]['reader_type']:
+        if 'signal' == reader['reader_type']:
             export_hdf5_signal(dataset, data, fid)
-        if 'events' == readerlist[dataset["data_type"]]['reader_type']:
+        if 'events' == reader['reader_type']:
             export_hdf5_events(dataset, data, fid)
-        if 'text' == readerlist[dataset["data_type"]]['reader_type']:
+        if 'text' == reader['reader_type']:
             export_hdf5_text(dataset, data, fid)
 
+        ## release the data, and the files kept open by lazily read
+        ## channels, before reading the next dataset
+        data = None
+
+def create_live(dataset_list, readerlist, fid):
+    """
+    Create the objects of a live export (see utilities_live) in the
+    HDF5 file with handle fid, before it is switched to SWMR mode. The
+    groups, metadata and empty datasets of the signals are created from
+    the headers read by the probes of the readers, so no samples are
+    read. The other datasets (events, text and the signals of readers
+    without a probe) are read and written in full.
+
+    Returns:
+       - the datasets whose signals are written in SWMR mode
+    """
+    from . import utilities_live as liveutils
+    out = []
+    for dataset in dataset_list:
+        reader = readerlist[dataset["data_type"]]
+        if reader['reader_type'] == 'signal' and reader.get('probe') is not None:
+            liveutils.set_phase(liveutils.CREATE)
+            with profutils.stage("create", dataset=dataset["filename"], data_type=dataset["data_type"]):
+                export_hdf5_signal(dataset, reader['probe'](dataset["filename"]), fid)
+            out += [dataset]
+        else:
+            liveutils.set_phase(None)
+            export_dataset(dataset, reader, fid)
+    return out
+
+def export_shard(config, index, fname_shard, profile=False, max_memory=None, live=False):
+    """
+    Export one dataset of a configuration (a dict) to a shard, e.g.,
+    in a worker process.
+
+    Arguments:
+       - config : the configuration
+       - index : the index of the dataset in the configuration
+       - fname_shard : the name of the shard
+       - profile : if True, the export is profiled
+       - max_memory : the memory budget of the export
+       - live : if True, the shard is written in SWMR mode
+
+    Returns:
+       - the profile report if profile is True, otherwise None
+    """
+    config_shard = dict(config)
+    config_shard["output"] = dict(config["output"], filename=fname_shard)
+    config_shard["datasets"] = [config["datasets"][index]]
+
+    memutils.set_budget(max_memory)
+    return export_datasets(config_shard, get_readerlist(), profile, live=live)
+
+def export_sharded(config, profile=False, profile_h5=False, jobs=1, live=False):
+    """
+    Export the datasets in a configuration (a dict) to shards, one per
+    dataset, and create the master file of the shards at the output
+    file given in the configuration. See export_hdf5 for the arguments.
+    """
+    from . import utilities_h5 as h5utils
+    from . import utilities_shards as shardutils
+    fname_out = config["output"]["filename"]
+    shards = shardutils.get_shard_names(fname_out, len(config["datasets"]))
+    os.makedirs(shardutils.get_shard_dir(fname_out), exist_ok=True)
+
+    ## the memory budget is divided between the processes
+    max_memory = memutils.get_budget()
+    if max_memory is not None:
+        max_memory = max_memory // max(jobs, 1)
+
+    args = [(config, i, shards[i], profile, max_memory, live) for i in range(len(shards))]
+
+    wall = time.perf_counter()
+    if jobs <= 1:
+        reps = [export_shard(*i) for i in args]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            reps = list(executor.map(export_shard, *zip(*args)))
+
+    print("\nCreating master file:\t", fname_out)
+    fid = shardutils.build_master(fname_out, shards)
+
+    rep = None
+    try:
+        if profile:
+            rep = profutils.merge_reports(reps, fname_out, time.perf_counter() - wall)
+            if profile_h5:
+                profutils.add_report_h5(fid, rep)
+    finally:
+        h5utils.close_h5(fid)
+
+    return rep
+
+def verify_hdf5(fname, sample=None, jobs=1, max_memory=None):
+    """
+    Verify the output file of a configuration file against the data
+    sources (see utilities_verify).
+
+    Arguments:
+       - fname : full path to the configuration file
+       - sample : the fraction of the blocks of each signal compared
+                  (default: all blocks)
+       - jobs : the number of datasets verified in parallel processes
+       - max_memory : the memory budget of the verification
+
+    Returns:
+       - the report as a dict
+    """
+    from . import utilities_verify as verifyutils
+    config = load_json_file(fname)
+
+    memutils.set_budget(max_memory)
+    try:
+        return verifyutils.verify_export(config, sample, jobs)
+    finally:
+        memutils.set_budget(None)
+
+def check_memory(dataset, reader):
+    """
+    Raise a MemoryError if reading the dataset is estimated to need
+    more memory than the budget (see utilities_memory). Only the
+    header of the data is read for the estimate.
+    """
+    from . import utilities_plan as planutils
+    if reader.get('probe') is None:
+        return
+    try:
+        plan = planutils.plan_dataset(dataset, reader)
+    except Exception:
+        ## the error is reported when the data is read
+        return
+    memutils.check(dataset["filename"], plan["memory"])
+
+def print_memory_usage():
+    """ Print the peak memory use of the export relative to the budget. """
+    peak = profutils.peak_rss()
+    if peak is None:
+        return
+    print("\nPeak memory:\t %.1f MB of %.1f MB (%.0f %% of the budget)" % (peak / 1e6, memutils.get_budget() / 1e6, 100 * memutils.usage(peak)))
             
 def export_hdf5_text(dataset, data, fid):
     """
@@ -98,18 +347,21 @@ def export_hdf5_text(dataset, data, fid):
     Returns:
        - Nothing
     """
+    from . import utilities_h5 as h5utils
 
     for dset_map in dataset["maps"]:
         print("Processing path:\t", dset_map["path"])
-        
-        h5utils.add_text_h5(fid,
-                              dset_map["path"],
-                              data = data['text'])
 
-        if "meta" in dset_map.keys():
-            h5utils.add_metadata_h5(fid,
-                                    dset_map["path"],
-                                    dset_map["meta"])
+        with profutils.stage("map", path=dset_map["path"]):
+            h5utils.add_text_h5(fid,
+                                dset_map["path"],
+                                data = data['text'],
+                                encoding = data.get('encoding', "utf-8"))
+
+            if "meta" in dset_map.keys():
+                h5utils.add_metadata_h5(fid,
+                                        dset_map["path"],
+                                        dset_map["meta"])
 
             
 def export_hdf5_events(dataset, data, fid):
@@ -127,19 +379,22 @@ def export_hdf5_events(dataset, data, fid):
     Returns:
        - Nothing
     """
+    from . import utilities_h5 as h5utils
 
     for dset_map in dataset["maps"]:
         print("Processing path:\t", dset_map["path"])
-        
-        h5utils.add_events_h5(fid,
-                              dset_map["path"],
-                              data = data['events'],
-                              dtype = data['dtype'])
 
-        if "meta" in dset_map.keys():
-            h5utils.add_metadata_h5(fid,
-                                    dset_map["path"],
-                                    dset_map["meta"])
+        with profutils.stage("map", path=dset_map["path"]):
+            h5utils.add_events_h5(fid,
+                                  dset_map["path"],
+                                  data = data['events'],
+                                  dtype = data['dtype'],
+                                  meta = data.get('meta'))
+
+            if "meta" in dset_map.keys():
+                h5utils.add_metadata_h5(fid,
+                                        dset_map["path"],
+                                        dset_map["meta"])
 
             
 def export_hdf5_signal(dataset, data, fid):
@@ -157,26 +412,114 @@ def export_hdf5_signal(dataset, data, fid):
     Returns:
        - Nothing
     """
+    from . import utilities_h5 as h5utils
+    from . import utilities_general as utils
+    from . import utilities_transform as transformutils
+    from . import utilities_live as liveutils
     
     for dset_map in dataset["maps"]:
         print("Processing path:\t", dset_map["path"])
 
-        if dset_map["channels"] == ["*"]:
-            dset_map["channels"] = utils.get_channels_in_set(data)
+        channels = dset_map["channels"]
+        if channels == ["*"]:
+            channels = utils.get_channels_in_set(data)
+
+        for channel in get_missing_channels(dset_map, data):
+            print("\tWarning! Channel not found in data:\t", channel)
+
+        ## filter and decimate the channels while they are written
+        data_map = data
+        if "transform" in dset_map:
+            data_map = transformutils.transform_channels(data, channels, dset_map["transform"])
+
+        with profutils.stage("map", path=dset_map["path"]):
+            h5utils.add_data_h5(fid,
+                                dset_map["path"],
+                                data_map,
+                                channels,
+                                shared_group=dset_map["shared_group"],
+                                pyramid=dset_map.get("pyramid"),
+                                statistics=bool(dset_map.get("statistics", True)))
+
+            if "meta" in dset_map.keys():
+                h5utils.add_metadata_h5(fid,
+                                        dset_map["path"],
+                                        dset_map["meta"],
+                                        channels)
+
+        ## in SWMR mode the readers see the map once the file is flushed
+        if liveutils.is_writing():
+            fid.flush()
+
+                
+def get_missing_channels(dset_map, data):
+    """
+    Return the channels in the map dset_map that are not
+    in the data (a ChannelSet) as a list.
+    """
+    from . import utilities_general as utils
+    if dset_map.get("channels", ["*"]) == ["*"]:
+        return []
+    names = set(utils.get_channels_in_set(data))
+    return [i for i in dset_map["channels"] if i not in names]
+
+def validate_sources(fname):
+    """
+    Check that the channels given in the maps of a configuration
+    file exist in the data sources. Only the headers of the sources
+    are read, using the probes of the readers, so no samples are
+    read. Sources whose reader has no probe are read in full.
+
+    Arguments:
+       - fname : full path to the configuration file
+
+    Returns:
+       - A list of error messages, which is empty if all
+         channels were found.
+    """
+    readerlist = get_readerlist()
+    config = load_json_file(fname)
+
+    res = []
+    for dataset in config["datasets"]:
+        if dataset["data_type"] not in readerlist:
+            res += ["Unknown data type: " + dataset["data_type"]]
+            continue
+        reader = readerlist[dataset["data_type"]]
+        if reader['reader_type'] != 'signal':
+            continue
+
+        try:
+            if reader.get('probe') is not None:
+                data = reader['probe'](dataset["filename"])
+            else:
+                data = reader['function'](dataset["filename"])
+        except Exception as e:
+            res += ["Unable to read " + dataset["filename"] + ": " + str(e)]
+            continue
+
+        for dset_map in dataset["maps"]:
+            for channel in get_missing_channels(dset_map, data):
+                res += ["Channel " + channel + " not found in " + dataset["filename"] + " (path " + dset_map["path"] + ")"]
+        data = None
 
-        h5utils.add_data_h5(fid,
-                            dset_map["path"],
-                            data,
-                            dset_map["channels"],
-                            shared_group=dset_map["shared_group"])
+    return res
 
-        if "meta" in dset_map.keys():
-            h5utils.add_metadata_h5(fid,
-                                    dset_map["path"],
-                                    dset_map["meta"],
-                                    dset_map["channels"])
+def plan_export(fname):
+    """
+    Plan the export defined in a configuration file without exporting
+    any data. Only the headers of the data sources are read.
+
+    Arguments:
+       - fname : full path to the configuration file
+
+    Returns:
+       - The plan as a dict (see utilities_plan.plan_export).
+    """
+    from . import utilities_plan as planutils
+    config = load_json_file(fname)
+    return planutils.plan_export(config, get_readerlist())
 
-                
 def load_json_file(fname):
     """
     Read the contents of a json file.
@@ -201,9 +544,12 @@ def validate_config(fname):
     """
     Validate configuration file in json format.
     """
+    import jsonschema
+    from importlib import resources
+
     # Load schema
-    schema_fname = pkg_resources.resource_filename('export2hdf5', "config_schema.json")
-    schema = load_json_file(schema_fname)
+    with resources.as_file(resources.files(__package__).joinpath("config_schema.json")) as schema_fname:
+        schema = load_json_file(schema_fname)
     config = load_json_file(fname)
 
     res = None
@@ -228,9 +574,130 @@ def export2hdf5_cli():
                         action="store_true",
                         dest="validate_only",
                         help="Just validate configuration file but do not process data.")
+    parser.add_argument("--plan",
+                        action="store_true",
+                        dest="plan",
+                        help="Estimate the size, memory use and duration of the export without processing data.")
+    parser.add_argument("--verify",
+                        action="store_true",
+                        dest="verify",
+                        help="Verify the output file against the data sources instead of exporting.")
+    parser.add_argument("--verify-sample",
+                        type=float,
+                        dest="verify_sample",
+                        help="Fraction of the blocks of each signal compared with --verify (default: all).")
+    parser.add_argument("--verify-report",
+                        dest="verify_report",
+                        help="File for the verification report in json-format.")
+    parser.add_argument("--fletcher32",
+                        action="store_true",
+                        default=None,
+                        dest="fletcher32",
+                        help="Write the datasets with fletcher32 checksums.")
+    parser.add_argument("--shards",
+                        action="store_true",
+                        dest="shards",
+                        help="Write each dataset to its own HDF5 file, and a master file presenting them.")
+    parser.add_argument("--jobs",
+                        type=int,
+                        dest="jobs",
+                        help="Number of datasets exported in parallel with --shards (default 1), or number of threads recompressing with --merge (default: the number of processors).")
+    parser.add_argument("--live",
+                        action="store_true",
+                        dest="live",
+                        help="Write the signals in SWMR mode, so that the file can be read during the export.")
+    parser.add_argument("--max-memory",
+                        dest="max_memory",
+                        help="Memory budget of the export, e.g., 512M or 2G.")
+    parser.add_argument("--catalog",
+                        dest="catalog",
+                        help="SQLite catalog to which the output file is added, or which is queried with --query.")
+    parser.add_argument("--catalog-add",
+                        nargs="+",
+                        dest="catalog_add",
+                        help="Add existing HDF5 files to the catalog given with --catalog.")
+    parser.add_argument("--query",
+                        action="store_true",
+                        dest="query",
+                        help="List the channels in the catalog matching --channel, --min-rate, --start and --stop.")
+    parser.add_argument("--channel",
+                        dest="channel",
+                        help="Pattern of the channel names in a query, e.g., 'ECG*'.")
+    parser.add_argument("--min-rate",
+                        type=float,
+                        dest="min_rate",
+                        help="Lowest sampling rate (Hz) in a query.")
+    parser.add_argument("--start",
+                        dest="start",
+                        help="Start of the time window of a query, e.g., 2017-01-01 or 2017-01-01T10:00:00.")
+    parser.add_argument("--stop",
+                        dest="stop",
+                        help="End of the time window of a query.")
+    parser.add_argument("--merge",
+                        nargs="+",
+                        dest="merge",
+                        metavar="FILE",
+                        help="Merge (or repack) HDF5 files: the output file followed by the input files.")
+    parser.add_argument("--compression",
+                        choices=["gzip", "lzf", "none"],
+                        dest="compression",
+                        help="Compression of the output of --merge (default: as in the input).")
+    parser.add_argument("--compression-level",
+                        type=int,
+                        dest="compression_level",
+                        help="Level of gzip compression of the output of --merge.")
+    parser.add_argument("--shuffle",
+                        action="store_true",
+                        default=None,
+                        dest="shuffle",
+                        help="Use the shuffle filter in the output of --merge.")
+    parser.add_argument("--profile",
+                        action="store_true",
+                        dest="profile",
+                        help="Profile the stages of the export and write a report in json-format.")
+    parser.add_argument("--profile-report",
+                        dest="profile_report",
+                        help="File for the profile report (default: the output file with the suffix .profile.json).")
+    parser.add_argument("--profile-h5",
+                        action="store_true",
+                        dest="profile_h5",
+                        help="Also add the profile as attributes to the HDF5 file.")
 
     args = parser.parse_args()
 
+    if (args.query or args.catalog_add) and args.catalog is None:
+        print("\nCatalog not given!\n")
+        sys.exit(1)
+
+    if args.catalog_add:
+        from . import utilities_catalog as catalogutils
+        for fname in args.catalog_add:
+            n = catalogutils.add_file(args.catalog, fname)
+            print("Added to catalog:\t", fname, "(%d channels)" % n)
+        sys.exit(0)
+
+    if args.query:
+        from . import utilities_catalog as catalogutils
+        catalogutils.print_query(catalogutils.query(args.catalog, channel=args.channel, min_rate=args.min_rate,
+                                                    start=args.start, stop=args.stop))
+        sys.exit(0)
+
+    if args.merge:
+        if len(args.merge) < 2:
+            print("\nGive the output file and the input files to merge!\n")
+            sys.exit(1)
+        from . import utilities_repack as repackutils
+        try:
+            counts = repackutils.merge_files(args.merge[1:], args.merge[0], compression=args.compression,
+                                             level=args.compression_level, shuffle=args.shuffle, jobs=args.jobs)
+        except ValueError as e:
+            print("\nError!", e, "\n")
+            sys.exit(1)
+        print("\nDatasets copied to:\t", args.merge[0])
+        for key, value in counts.items():
+            print("\t" + key + ":\t", value)
+        sys.exit(0)
+
     if args.config_file is None:
         print("\nConfiguration file not given!\n")
         sys.exit(1)
@@ -248,11 +715,53 @@ def export2hdf5_cli():
         else:
             print("\nWarning! Errors in configuration file!\n")
             print(res)
+            sys.exit(0)
+
+        # Check the channels against the data sources
+        res = validate_sources(args.config_file)
+        if res:
+            print("\nWarning! Errors in data sources!\n")
+            for i in res:
+                print("\t", i)
+        else:
+            print("All channels found in the data sources.\n")
         sys.exit(0)
 
+    if args.plan:
+        if res is not None:
+            print("\nWarning! Errors in configuration file!\n")
+            print(res)
+            sys.exit(0)
+        from . import utilities_plan as planutils
+        planutils.print_plan(plan_export(args.config_file))
+        sys.exit(0)
+
+    if args.verify:
+        if res is not None:
+            print("\nWarning! Errors in configuration file!\n")
+            print(res)
+            sys.exit(1)
+        from . import utilities_verify as verifyutils
+        rep = verify_hdf5(args.config_file, sample=args.verify_sample, jobs=args.jobs or 1,
+                          max_memory=args.max_memory)
+        verifyutils.print_report(rep)
+        if args.verify_report is not None:
+            verifyutils.write_report(rep, args.verify_report)
+            print("\nVerification report written to:\t", args.verify_report)
+        sys.exit(0 if rep["passed"] else 1)
+
     # Export data
     print("\nExporting data.\n")
-    export_hdf5(args.config_file)
+    rep = export_hdf5(args.config_file, profile=args.profile, profile_h5=args.profile_h5, max_memory=args.max_memory,
+                      shards=args.shards or None, jobs=args.jobs or 1, live=args.live, catalog=args.catalog,
+                      fletcher32=args.fletcher32)
+
+    if rep is not None:
+        fname_report = args.profile_report
+        if fname_report is None:
+            fname_report = rep["output"] + ".profile.json"
+        profutils.write_report(rep, fname_report)
+        print("\nProfile report written to:\t", fname_report)
 
 if __name__ == "__main__":
     export2hdf5_cli()
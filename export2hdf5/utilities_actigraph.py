@@ -19,35 +19,27 @@ import io
 import sys
 from datetime import datetime, timedelta
 import numpy as np
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
+from . import utilities_memory as memutils
 
-def read_actigraph(fname):
-    """
-    Read three-axis accelerometer data recorded using the actigraph.
-    The sampling rate is 50 Hz.
+## Number of header lines in the CSV file
+N_HEADER = 11
 
-    Arguments:
-       - fname : the name of the file containing the data
+## Number of rows read at a time
+BLOCK_SIZE = 65536
 
-    Returns:
-       - a list of dictionaries, where each dictionary
-         represents a feature as a time series ("signal")
+def parse_actigraph_header(header):
+    """
+    Parse the header lines of an Actigraph CSV file.
 
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+    Returns:
+       - a tuple (channel names, meta), where meta contains the
+         starting time and the sampling rate
 
+    Raises a ValueError if the file is neither raw data (3 columns)
+    nor imu data (11 columns).
     """
-
-    # Read the header
-    header = []
-    n_header = 11
-    i = 0
-    with open(fname, "r", encoding="utf-8") as file:
-        for line in file:
-            if i >= n_header:
-                break
-            header.append(line)
-            i += 1
-    
     # Extract the start date and time
     start_time = header[2].strip()[11:]
     start_date = header[3].strip()[11:]
@@ -58,32 +50,86 @@ def read_actigraph(fname):
 
     # Create the meta information
     meta = {}
-   
-    # Read the data
-    # Reading depends on how many channels are present, i.e., on the data format (raw sampled at 50 Hz
-    # or imu sampled at 100 Hz).
+
+    # The raw data is sampled at 50 Hz and the imu data at 100 Hz,
+    # and the first column of the imu data is not exported
     if (len(channels) == 3):
-        data = np.genfromtxt(fname, delimiter = ",", skip_header = 11, dtype = None)
         meta["sampling_rate"] = 50
-    if (len(channels) == 11):
-        data = np.genfromtxt(fname, delimiter = ",", skip_header = 11, dtype = None, usecols = range(1,11))
+    elif (len(channels) == 11):
         channels = channels[1:]
         meta["sampling_rate"] = 100
-    
-    # Create a time vector for the data which has been sampled at 50Hz
-    timevec = np.array(range(data.shape[0])) / meta["sampling_rate"]
+    else:
+        raise ValueError("Unknown Actigraph format with %d columns (expected 3 or 11)." % len(channels))
 
-    # Create the meta information
     meta["time_start"] = datetime.strptime(start_date + " " + start_time, "%d.%m.%Y %H:%M:%S")
-    meta["time_stop"] = meta["time_start"] + timedelta(seconds = data.shape[0] / meta["sampling_rate"])
+
+    return channels, meta
+
+def read_actigraph(fname):
+    """
+    Read three-axis accelerometer data recorded using the actigraph.
+    The sampling rate is 50 Hz.
+
+    Arguments:
+       - fname : the name of the file containing the data
+
+    Returns:
+       - a ChannelSet (see utilities_channels)
+
+    The file is parsed in blocks, and the blocks are written to
+    temporary files (see utilities_io.ColumnStore), so the channels
+    are memory maps and the data is not held in memory.
+
+    """
+
+    with ioutils.open_input(fname, "r") as file:
+        # Read the header
+        header = [file.readline() for i in range(N_HEADER)]
+        channels, meta = parse_actigraph_header(header)
+
+        # Read the data in blocks
+        # Reading depends on how many channels are present, i.e., on the data format (raw sampled at 50 Hz
+        # or imu sampled at 100 Hz).
+        if (len(channels) == 10):
+            usecols = range(1,11)
+        else:
+            usecols = None
+        block_size = memutils.get_block_size(BLOCK_SIZE, len(channels) * memutils.TEXT_VALUE_BYTES)
+
+        store = ioutils.ColumnStore(len(channels))
+        for block in ioutils.iter_blocks(file, ",", usecols, block_size):
+            store.append(block)
+
+    columns = store.columns()
     
-    # Put the data in a container
-
-    out = [0] * data.shape[1]
-    for i, label in enumerate(channels):
-        data_out = {}
-        data_out[label] = data[:,i]
-        data_out["time"] = timevec
-        out[i] = {"meta" : meta, "data" : data_out}
+    # Create the meta information
+    meta["time_stop"] = meta["time_start"] + timedelta(seconds = store.length / meta["sampling_rate"])
+    
+    # Put the data in a container, the channels share a regular time axis
+    out = chutils.ChannelSet()
+    axis = out.add_axis(sampling_rate=meta["sampling_rate"], length=store.length)
+    for channel, column in zip(channels, columns):
+        out.add_channel(channel, column, meta, axis)
+
+    return out
+
+def probe_actigraph(fname):
+    """
+    Read only the header of an Actigraph CSV file. The number of
+    samples, and the stopping time, are estimated from the size of
+    the file.
+
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    header, n_rows = ioutils.read_header(fname, N_HEADER)
+    channels, meta = parse_actigraph_header(header)
+    meta["time_stop"] = meta["time_start"] + timedelta(seconds = n_rows / meta["sampling_rate"])
+
+    out = chutils.ChannelSet()
+    axis = out.add_axis(sampling_rate=meta["sampling_rate"], length=n_rows)
+    for channel in channels:
+        out.add_lazy_channel(channel, None, n_rows, np.float64, meta, axis)
 
     return out
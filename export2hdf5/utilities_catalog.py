@@ -0,0 +1,339 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for a catalog of HDF5 files created by
+export2hdf5. The catalog is an SQLite database with the tables
+
+- files : the HDF5 files (path, size, modification time, time of
+  cataloging)
+- sources : the data sources of each file (path, data type, size and
+  SHA-256 hash), if the file was cataloged when it was exported
+- channels : the channels, events and text of each file (path in the
+  file, group, name, kind, sampling rate, time_start, time_stop,
+  number of samples, dtype, raw and stored size in bytes)
+
+The times are stored in ISO format (YYYY-MM-DDTHH:MM:SS), so that they
+can be compared as strings. A file is cataloged again if it is added
+again (the earlier rows of the file are replaced), so the catalog can
+be updated after each export.
+
+Example:
+
+    rows = query("catalog.db", channel="ECG*", min_rate=250,
+                 start="2017-01-01", stop="2017-02-01")
+"""
+
+import os
+import hashlib
+import sqlite3
+import datetime
+import h5py
+from . import utilities_io as ioutils
+from . import utilities_h5 as h5utils
+from . import utilities_plan as planutils
+from . import utilities_query as queryutils
+
+## The format of the times in the attributes (see utilities_h5.add_metadata)
+TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+## The format of the times in the catalog
+CATALOG_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+## Number of bytes hashed at a time
+HASH_BLOCK_SIZE = 1 << 20
+
+## The columns of the results of query
+QUERY_COLUMNS = ["file", "path", "name", "kind", "sampling_rate", "time_start", "time_stop", "n_samples"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    cataloged TEXT);
+
+CREATE TABLE IF NOT EXISTS sources (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    path TEXT,
+    data_type TEXT,
+    size INTEGER,
+    sha256 TEXT);
+
+CREATE TABLE IF NOT EXISTS channels (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    path TEXT,
+    group_path TEXT,
+    name TEXT,
+    kind TEXT,
+    sampling_rate REAL,
+    time_start TEXT,
+    time_stop TEXT,
+    n_samples INTEGER,
+    dtype TEXT,
+    raw_bytes INTEGER,
+    stored_bytes INTEGER);
+
+CREATE INDEX IF NOT EXISTS channels_name ON channels(name);
+CREATE INDEX IF NOT EXISTS channels_time ON channels(time_start, time_stop);
+CREATE INDEX IF NOT EXISTS channels_file ON channels(file_id);
+CREATE INDEX IF NOT EXISTS sources_file ON sources(file_id);
+"""
+
+def connect(fname):
+    """ Open the catalog in the file fname, creating the tables if
+    needed, and return the connection. """
+    con = sqlite3.connect(fname)
+    con.execute("PRAGMA foreign_keys = ON")
+    con.executescript(SCHEMA)
+    return con
+
+def hash_source(fname):
+    """
+    Return the SHA-256 hash of a data source. The hash of a directory
+    (e.g., a NeurOne measurement) covers the relative names and the
+    contents of the files in it.
+    """
+    h = hashlib.sha256()
+
+    if os.path.isdir(fname):
+        files = []
+        for root, dirs, names in os.walk(fname):
+            files += [os.path.join(root, i) for i in names]
+        for i in sorted(files):
+            h.update(os.path.relpath(i, fname).encode("utf-8"))
+            hash_file(h, i)
+    else:
+        hash_file(h, ioutils.resolve_input(fname))
+
+    return h.hexdigest()
+
+def hash_file(h, fname):
+    """ Update the hash h with the contents of the file fname. """
+    with open(fname, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            h.update(block)
+
+def parse_time(value):
+    """ Return the time in an attribute (e.g., time_start) as a datetime,
+    or None if it is not a time. """
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.datetime.strptime(value, TIME_FORMAT)
+    except ValueError:
+        return None
+
+def format_time(value):
+    """ Format a datetime (or None) for the catalog. """
+    if value is None:
+        return None
+    return value.strftime(CATALOG_TIME_FORMAT)
+
+def parse_query_time(value):
+    """ Return a time given in ISO format (e.g., 2017-01-01 or
+    2017-01-01T10:00:00) in the format of the catalog. """
+    if value is None:
+        return None
+    return format_time(datetime.datetime.fromisoformat(value))
+
+def get_attribute(obj, key):
+    """ Return the attribute key of the HDF5 object obj, or of its
+    parent group if obj does not have it. """
+    if key in obj.attrs:
+        return obj.attrs[key]
+    return obj.parent.attrs.get(key)
+
+def get_signal_row(name, data, time):
+    """
+    Return the row of the channels table (without the file) of a
+    signal with the given name, the dataset data of the samples and
+    the dataset time of the time vector.
+    """
+    n = len(data)
+    sampling_rate = float(get_attribute(data, "sampling_rate") or 0)
+    time_start = parse_time(get_attribute(data, "time_start"))
+    time_stop = parse_time(get_attribute(data, "time_stop"))
+
+    ## the duration of the signal, from its time vector
+    if time_start is not None and time_stop is None and n > 0:
+        if sampling_rate > 0:
+            duration = n / sampling_rate
+        else:
+            duration = float(time[n - 1])
+        time_stop = time_start + datetime.timedelta(seconds=duration)
+
+    return {"path" : data.name, "group_path" : data.parent.name, "name" : name, "kind" : "signal",
+            "sampling_rate" : sampling_rate or None,
+            "time_start" : format_time(time_start), "time_stop" : format_time(time_stop),
+            "n_samples" : n, "dtype" : str(data.dtype),
+            "raw_bytes" : int(data.size * data.dtype.itemsize),
+            "stored_bytes" : int(data.id.get_storage_size())}
+
+def get_dataset_row(dset, kind):
+    """ Return the row of the channels table (without the file) of
+    events or text in the dataset dset. """
+    time_start = parse_time(dset.attrs.get("time_start"))
+    return {"path" : dset.name, "group_path" : dset.parent.name, "name" : dset.name.split("/")[-1],
+            "kind" : kind, "sampling_rate" : None,
+            "time_start" : format_time(time_start), "time_stop" : None,
+            "n_samples" : len(dset), "dtype" : str(dset.dtype),
+            "raw_bytes" : int(dset.size * dset.dtype.itemsize),
+            "stored_bytes" : int(dset.id.get_storage_size())}
+
+def is_auxiliary(name):
+    """ Return True if the group with the given name contains the
+    downsampled levels or the index of a signal (see utilities_h5). """
+    return name.split("/")[-1].startswith("pyramid_") or name.split("/")[-1] == "index"
+
+def get_rows(fid):
+    """
+    Return the rows of the channels table (without the file) of the
+    signals, events and text in the HDF5 file with handle fid. The
+    signals are found in both layouts of utilities_h5.add_data_h5.
+    """
+    rows = []
+    signals = set()
+
+    def visit(name, obj):
+        if not isinstance(obj, h5py.Group) or is_auxiliary(name):
+            return
+        datasets = [key for key, dset in obj.items() if isinstance(dset, h5py.Dataset)]
+        if sorted(datasets) == ["data", "time"]:
+            ## the group of a channel that does not share the time vector
+            rows.append(get_signal_row(name.split("/")[-1], obj["data"], obj["time"]))
+            signals.update([obj["data"].name, obj["time"].name])
+        elif queryutils.is_shared_group(obj):
+            for key in datasets:
+                if key != "time" and obj[key].dtype.names is None:
+                    rows.append(get_signal_row(key, obj[key], obj["time"]))
+                    signals.add(obj[key].name)
+            signals.add(obj["time"].name)
+
+    def visit_other(name, obj):
+        if not isinstance(obj, h5py.Dataset) or obj.name in signals:
+            return
+        if any(is_auxiliary(i) for i in name.split("/")[:-1]):
+            return
+        if obj.dtype.names is not None:
+            rows.append(get_dataset_row(obj, "events"))
+        elif h5utils.is_text_h5(obj):
+            rows.append(get_dataset_row(obj, "text"))
+
+    fid.visititems(visit)
+    fid.visititems(visit_other)
+    return rows
+
+def add_file(catalog, fname, datasets=None, hashes=True):
+    """
+    Add (or update) an HDF5 file created by export2hdf5 in the catalog.
+
+    Arguments:
+       - catalog : the name of the catalog file
+       - fname : the name of the HDF5 file
+       - datasets : the datasets of the configuration file used in the
+                    export, which are recorded as the sources of the file
+       - hashes : if True, the SHA-256 hashes of the sources are computed
+
+    Returns:
+       - the number of channels (including events and text) cataloged
+    """
+    fname = os.path.abspath(fname)
+    with h5py.File(fname, "r") as fid:
+        rows = get_rows(fid)
+
+    sources = []
+    for dataset in (datasets or []):
+        source = dataset["filename"]
+        sources += [(os.path.abspath(source), dataset["data_type"],
+                     planutils.source_size(source),
+                     hash_source(source) if hashes else None)]
+
+    con = connect(catalog)
+    try:
+        with con:
+            con.execute("INSERT INTO files (path, size, mtime, cataloged) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(path) DO UPDATE SET size = excluded.size, "
+                        "mtime = excluded.mtime, cataloged = excluded.cataloged",
+                        (fname, os.path.getsize(fname), os.path.getmtime(fname),
+                         format_time(datetime.datetime.now())))
+            file_id = con.execute("SELECT id FROM files WHERE path = ?", (fname,)).fetchone()[0]
+
+            con.execute("DELETE FROM channels WHERE file_id = ?", (file_id,))
+            con.executemany("INSERT INTO channels VALUES (:file_id, :path, :group_path, :name, :kind, "
+                            ":sampling_rate, :time_start, :time_stop, :n_samples, :dtype, "
+                            ":raw_bytes, :stored_bytes)",
+                            [dict(i, file_id=file_id) for i in rows])
+
+            if datasets is not None:
+                con.execute("DELETE FROM sources WHERE file_id = ?", (file_id,))
+                con.executemany("INSERT INTO sources VALUES (?, ?, ?, ?, ?)",
+                                [(file_id,) + i for i in sources])
+    finally:
+        con.close()
+
+    return len(rows)
+
+def query(catalog, channel=None, min_rate=None, start=None, stop=None, kind=None):
+    """
+    Return the channels in the catalog matching the conditions.
+
+    Arguments:
+       - catalog : the name of the catalog file
+       - channel : a pattern of the names of the channels, e.g., ECG*
+                   (as in SQLite GLOB, case-sensitive)
+       - min_rate : the lowest sampling rate in Hz
+       - start, stop : the channels overlapping the time window from
+                       start to stop (in ISO format, e.g., 2017-01-01)
+       - kind : "signal", "events" or "text"
+
+    Returns:
+       - a list of dicts with the keys QUERY_COLUMNS
+    """
+    where = []
+    args = []
+    if channel is not None:
+        where += ["channels.name GLOB ?"]
+        args += [channel]
+    if min_rate is not None:
+        where += ["channels.sampling_rate >= ?"]
+        args += [float(min_rate)]
+    if start is not None:
+        where += ["channels.time_stop >= ?"]
+        args += [parse_query_time(start)]
+    if stop is not None:
+        where += ["channels.time_start <= ?"]
+        args += [parse_query_time(stop)]
+    if kind is not None:
+        where += ["channels.kind = ?"]
+        args += [kind]
+
+    sql = "SELECT files.path, " + ", ".join("channels." + i for i in QUERY_COLUMNS[1:]) + \
+          " FROM channels JOIN files ON channels.file_id = files.id"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY files.path, channels.path"
+
+    con = connect(catalog)
+    try:
+        return [dict(zip(QUERY_COLUMNS, i)) for i in con.execute(sql, args)]
+    finally:
+        con.close()
+
+def print_query(rows):
+    """ Print the results of query. """
+    print("\t".join(QUERY_COLUMNS))
+    for row in rows:
+        print("\t".join("" if row[i] is None else str(row[i]) for i in QUERY_COLUMNS))
+    print("\n%d channels in %d files" % (len(rows), len(set(i["file"] for i in rows))))
@@ -0,0 +1,331 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains the channel set, which is the data returned by
+the readers for signal data. A channel set contains
+
+- the channels, each having a name, the data and the metadata. The
+  data of a channel can be read lazily: the channel then only knows
+  the number of samples and the data type, and the samples are read
+  in blocks using read(start, stop) when they are needed
+- an index from the channel names to the channels
+- the time axes. Channels sampled together share one time axis,
+  which is either a vector of time points or, for regularly sampled
+  data, only the sampling rate and the number of samples
+- optionally, two-dimensional arrays holding the samples of several
+  channels (one channel per column)
+
+Datasets in the older format, i.e., lists where each element is a
+dictionary of the form
+
+    {"meta" : <dict with metadata>,
+     "data" : {"time" : [...], "<channelname" : [...] }}
+
+can be converted using as_channel_set.
+"""
+
+import numpy as np
+
+class TimeAxis(object):
+    """
+    The time axis shared by the channels in a sampling group. The time
+    points are either given explicitly (values), or the axis is regular
+    and the time points are computed from the sampling rate and the
+    number of samples (length).
+    """
+    __slots__ = ("explicit", "sampling_rate", "length")
+
+    def __init__(self, values=None, sampling_rate=0, length=None):
+        self.explicit = values
+        self.sampling_rate = sampling_rate
+        self.length = len(values) if values is not None else length
+
+    @property
+    def values(self):
+        """ The time points (in seconds from the start) as an array. """
+        if self.explicit is not None:
+            return self.explicit
+        return np.arange(0, self.length) / self.sampling_rate
+
+    def read(self, start=0, stop=None):
+        """ Return the time points from index start to stop. """
+        if self.explicit is not None:
+            return self.explicit[start:stop]
+        if stop is None:
+            stop = self.length
+        return np.arange(start, stop) / self.sampling_rate
+
+    def is_regular(self):
+        """ Return True if the time points are computed from the sampling
+        rate. An axis without time points and with the sampling rate 0
+        is irregular, with the time points not known (e.g., read by a
+        probe). """
+        return self.explicit is None and bool(self.sampling_rate)
+
+
+class Channel(object):
+    """
+    One channel: the name, the data, the metadata and the time axis.
+
+    The data is either an array, or it is read lazily using the
+    function reader(start, stop), which returns the samples from
+    index start to stop. The number of samples (length) and the data
+    type (dtype) are known without reading the data.
+    """
+    __slots__ = ("name", "meta", "axis", "array", "reader", "length", "dtype")
+
+    def __init__(self, name, data, meta, axis, reader=None, length=None, dtype=None):
+        self.name = name
+        self.meta = meta
+        self.axis = axis
+        self.reader = reader
+        self.array = None
+        self.length = length
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+
+        if data is not None:
+            self.data = data
+
+    @property
+    def data(self):
+        """ All samples of the channel as an array. """
+        if self.array is not None:
+            return self.array
+        return self.read(0, self.length)
+
+    @data.setter
+    def data(self, data):
+        self.array = np.asarray(data)
+        self.reader = None
+        self.length = len(self.array)
+        self.dtype = self.array.dtype
+
+    @property
+    def sampling_rate(self):
+        """ The sampling rate of the channel (0 if irregular). """
+        return self.axis.sampling_rate
+
+    def is_lazy(self):
+        """ Return True if the data has not been read. """
+        return self.array is None
+
+    def read(self, start=0, stop=None):
+        """ Return the samples from index start to stop. """
+        if stop is None:
+            stop = self.length
+        if self.array is not None:
+            return self.array[start:stop]
+        if self.reader is None:
+            raise ValueError("Only the header of channel " + self.name + " has been read.")
+        return self.reader(start, stop)
+
+    def map(self, func):
+        """
+        Apply the function func to the data of the channel. For lazily
+        read channels func is applied to each block when it is read.
+        """
+        if self.array is not None:
+            self.data = func(self.array)
+        else:
+            reader = self.reader
+            self.reader = lambda start, stop: func(reader(start, stop))
+
+    @property
+    def time(self):
+        """ The time points of the channel. """
+        return self.axis.values
+
+    def as_dict(self):
+        """ Return the channel in the older dictionary format. """
+        return {"meta" : self.meta, "data" : {self.name : self.data, "time" : self.time}}
+
+
+class ChannelSet(object):
+    """ A collection of channels indexed by their names. """
+    __slots__ = ("channels", "index", "axes", "samples", "axis_lookup")
+
+    def __init__(self):
+        self.channels = []
+        self.index = {}
+        self.axes = []
+        self.samples = []
+        ## maps the ids of time axes and time vectors to the time axes
+        self.axis_lookup = {}
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __getitem__(self, name):
+        return self.index[name]
+
+    def __getstate__(self):
+        return {"channels" : self.channels, "axes" : self.axes, "samples" : self.samples}
+
+    def __setstate__(self, state):
+        ## the lookups use object ids, so they are rebuilt
+        self.channels = state["channels"]
+        self.axes = state["axes"]
+        self.samples = state["samples"]
+        self.index = {ch.name : ch for ch in self.channels}
+        self.axis_lookup = {}
+        for axis in self.axes:
+            self.axis_lookup[id(axis)] = axis
+            if axis.explicit is not None:
+                self.axis_lookup[id(axis.explicit)] = axis
+
+    def names(self):
+        """ Return the names of the channels as a list. """
+        return [ch.name for ch in self.channels]
+
+    def add_axis(self, time=None, sampling_rate=0, length=None):
+        """
+        Add a time axis and return it.
+
+        Arguments:
+           - time : the time points, or None for a regular axis
+           - sampling_rate : the sampling rate of a regular axis
+           - length : the number of samples of a regular axis
+
+        If time is an array that is already used by a time axis in
+        this set, that time axis is returned instead.
+        """
+        if id(time) in self.axis_lookup:
+            return self.axis_lookup[id(time)]
+
+        if isinstance(time, TimeAxis):
+            axis = time
+        else:
+            axis = TimeAxis(time, sampling_rate, length)
+            if time is not None:
+                self.axis_lookup[id(time)] = axis
+
+        self.axis_lookup[id(axis)] = axis
+        self.axes += [axis]
+        return axis
+
+    def add_channel(self, name, data, meta, time=None, sampling_rate=0):
+        """
+        Add a channel to the set and return it.
+
+        Arguments:
+           - name : the name of the channel
+           - data : the samples of the channel
+           - meta : a dict with the metadata of the channel
+           - time : the time points of the channel (array) or a TimeAxis
+                    shared with other channels. If None, the time axis is
+                    regular with the given sampling rate.
+           - sampling_rate : the sampling rate of a regular time axis
+        """
+        if time is None:
+            time = self.add_axis(sampling_rate=sampling_rate, length=len(data))
+        axis = self.add_axis(time)
+
+        return self.append(Channel(name, data, meta, axis))
+
+    def add_lazy_channel(self, name, reader, length, dtype, meta, time=None, sampling_rate=0):
+        """
+        Add a channel whose data is read when needed and return it.
+
+        Arguments:
+           - name : the name of the channel
+           - reader : a function reader(start, stop) returning the
+                      samples from index start to stop, or None if
+                      only the header of the data has been read
+           - length : the number of samples in the channel
+           - dtype : the data type of the samples
+           - meta, time, sampling_rate : as in add_channel
+        """
+        if time is None:
+            time = self.add_axis(sampling_rate=sampling_rate, length=length)
+        axis = self.add_axis(time)
+
+        return self.append(Channel(name, None, meta, axis, reader, length, dtype))
+
+    def append(self, ch):
+        """ Add the Channel ch to the set and return it. """
+        ch.axis = self.add_axis(ch.axis)
+        self.channels += [ch]
+        self.index[ch.name] = ch
+        return ch
+
+    def add_samples(self, names, samples, meta, time=None, sampling_rate=0):
+        """
+        Add channels stored in a two-dimensional array (one column per
+        channel), all sharing the same time axis and metadata.
+
+        Arguments:
+           - names : the names of the channels (one per column)
+           - samples : the two-dimensional array
+           - meta, time, sampling_rate : as in add_channel
+
+        Returns:
+           - the added channels as a list
+        """
+        if time is None:
+            time = self.add_axis(sampling_rate=sampling_rate, length=samples.shape[0])
+        axis = self.add_axis(time)
+
+        self.samples += [(names, samples)]
+        return [self.add_channel(name, samples[:, i], meta, axis) for i, name in enumerate(names)]
+
+    def extend(self, other):
+        """ Add the channels in the channel set other to this set. """
+        self.samples += other.samples
+        for ch in other:
+            self.append(ch)
+
+    def select(self, names):
+        """ Return the channels with the given names, in the order of the set. """
+        names = set(names)
+        return [ch for ch in self.channels if ch.name in names]
+
+    def to_dicts(self):
+        """ Return the channels in the older format (a list of dicts). """
+        times = {}
+        out = []
+        for ch in self.channels:
+            if id(ch.axis) not in times:
+                times[id(ch.axis)] = ch.axis.values
+            out += [{"meta" : ch.meta, "data" : {ch.name : ch.data, "time" : times[id(ch.axis)]}}]
+        return out
+
+    @classmethod
+    def from_dicts(cls, dataset):
+        """
+        Create a channel set from a list of dicts in the older format.
+        Channels having the same time vector share one time axis.
+        """
+        if not isinstance(dataset, list):
+            dataset = [dataset]
+
+        out = cls()
+        for ch_data in dataset:
+            for ch_name, data in ch_data["data"].items():
+                if ch_name != "time":
+                    out.add_channel(ch_name, data, ch_data["meta"], ch_data["data"]["time"])
+        return out
+
+
+def as_channel_set(dataset):
+    """
+    Return the dataset as a ChannelSet. Datasets in the older format
+    (a list of dicts, or one dict) are converted.
+    """
+    if isinstance(dataset, ChannelSet):
+        return dataset
+    return ChannelSet.from_dicts(dataset)
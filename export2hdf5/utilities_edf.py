@@ -14,12 +14,34 @@ This module wraps some of the functions in pyedflib and provides
 some convenience functions.
 """
 
+import os
+import weakref
 import pyedflib
 import numpy as np
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
+
+## The open edf-objects by file name. pyedflib opens each file only
+## once, so the channels of several datasets reading the same file
+## (e.g., in a live export) share the edf-object.
+OPEN_FILES = weakref.WeakValueDictionary()
 
 def read_edf(fname):
-    """Read EDF file with the name fname and returns an edf-object."""
-    return pyedflib.EdfReader(fname)
+    """
+    Read EDF file with the name fname and returns an edf-object.
+    If the file is already open, the open edf-object is returned.
+
+    pyedflib only reads regular files, so a compressed file is
+    decompressed to a temporary file first. The temporary file is
+    removed immediately, the open edf-object keeps it readable.
+    """
+    key = os.path.abspath(fname)
+    edf = OPEN_FILES.get(key)
+    if edf is None:
+        with ioutils.input_path(fname) as fname_edf:
+            edf = pyedflib.EdfReader(fname_edf)
+        OPEN_FILES[key] = edf
+    return edf
 
 def get_channel_list(edf):
     """ Return a list containing the channel names in the EDF file. """
@@ -35,6 +57,15 @@ def get_signal_header(edf, i):
 
     return signal_header
 
+def get_sampling_rate(signal_header):
+    """
+    Return the sampling rate from a signal header. Newer versions
+    of pyedflib call this field sample_frequency.
+    """
+    if "sample_frequency" in signal_header:
+        return signal_header["sample_frequency"]
+    return signal_header["sample_rate"]
+
 def read_channel(edf, channel_name):
     """
     Read the channel with name channel_name from
@@ -88,55 +119,83 @@ def print_channel_info(edf):
 def read_edf_file(fname):
     """
     Read all channels in the EDF file and return the
-    result as an array where where each element is a channel.
-    Each channel is a dictionary:
+    result as a ChannelSet (see utilities_channels).
+
+    Only the header is read here. The channels are read lazily,
+    so that the samples are read (in blocks) only for the channels
+    that are exported.
 
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+    Channels with the same sampling rate and number of
+    samples share one time axis.
 
     """
+    return get_channel_set(read_edf(fname))
+
+def probe_edf(fname):
+    """
+    Read only the header of the EDF file and return the channels
+    as a ChannelSet (see utilities_channels) without the data. The
+    file is closed (unless lazily read channels use it), so the
+    channels cannot be read.
+    """
+    shared = os.path.abspath(fname) in OPEN_FILES
     edf = read_edf(fname)
+    if shared:
+        return get_channel_set(edf, lazy=False)
+    try:
+        return get_channel_set(edf, lazy=False)
+    finally:
+        edf.close()
+
+def get_channel_set(edf, lazy=True):
+    """
+    Return the channels in the edf file as a ChannelSet. If lazy is
+    True, the channels are read from the file when they are needed,
+    otherwise the channels only contain the header information.
+    """
     channels = get_channel_list(edf)
+    n_samples = edf.getNSamples()
     time_start = get_starttime(edf)
-    out = [0] * len(channels)
+    out = chutils.ChannelSet()
+    axes = {}
 
     for i, channel in enumerate(channels):
-        tmp = read_channel(edf, channel)
-
         meta = {}
         meta["time_start"] = time_start
-        meta["sampling_rate"] = tmp["properties"]["sample_rate"]
+        meta["sampling_rate"] = get_sampling_rate(get_signal_header(edf, i))
 
-        data = {}
-        data[channel] = tmp["data"]
-        data["time"] = np.arange(0, len(tmp["data"])) / meta["sampling_rate"]
+        key = (meta["sampling_rate"], n_samples[i])
+        if key not in axes:
+            axes[key] = out.add_axis(sampling_rate=meta["sampling_rate"], length=n_samples[i])
 
-        out[i] = {"data" : data, "meta" : meta}
+        reader = get_channel_reader(edf, i) if lazy else None
+        out.add_lazy_channel(channel, reader, n_samples[i], np.float64, meta, axes[key])
 
     return out
 
+def get_channel_reader(edf, i):
+    """
+    Return a function reader(start, stop) that reads the samples
+    from index start to stop of the i:th signal in the edf file.
+    """
+    def reader(start, stop):
+        return edf.readSignal(i, start, stop - start)
+    return reader
+
 def read_faros(fname):
     """
     Read all channels in the EDF file recorded using the Faros device 
-    and return the result as an array where where each element is a channel.
+    and return the result as a ChannelSet (see utilities_channels).
     
     This function automatically converts accelerometer values
     from mG (milli G) to G.
 
-    Each channel is a dictionary:
-
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
-
     """
     res = read_edf_file(fname)
 
     # scale data from mG to G
-    for i in range(len(res)):
-        tmp = list(res[i]["data"].keys())
-        del tmp[tmp.index("time")]
-        channel = tmp[0]
-        if channel[:-2] == "Accelerometer":
-            res[i]["data"][channel] = res[i]["data"][channel] / 1000
+    for ch in res:
+        if ch.name[:-2] == "Accelerometer":
+            ch.map(lambda x: x / 1000)
             
     return res
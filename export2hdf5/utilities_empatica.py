@@ -15,10 +15,78 @@ Empatica E4 device.
 https://www.empatica.com/e4-wristband
 """
 
+import io
+import os
 import glob
+import zipfile
 import datetime
+import contextlib
 import numpy as np
 
+from concurrent.futures import ProcessPoolExecutor
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
+from . import utilities_memory as memutils
+
+## The signal files in an E4 export and how they are read
+EMPATICA_SIGNALS = {"ACC"  : {"labels" : ["acc_x", "acc_y", "acc_z"], "scalefactor" : 1.0 / 64.0},
+                    "BVP"  : {"labels" : ["BVP"]},
+                    "EDA"  : {"labels" : ["EDA"]},
+                    "HR"   : {"labels" : ["HR"]},
+                    "TEMP" : {"labels" : ["temperature"]},
+                    "IBI"  : {"labels" : ["IBI"]}}
+
+## Memory used for parsing a signal file, per byte of the file
+PARSE_MEMORY = 4
+
+@contextlib.contextmanager
+def open_source(source):
+    """
+    Open a text stream for an Empatica csv file.
+
+    Arguments:
+       - source : the name of the csv file, or a tuple
+                  (archive, member) naming a file inside
+                  an E4 zip archive. Archive members are
+                  streamed without extracting them to disk.
+    """
+    if isinstance(source, tuple):
+        archive, member = source
+        with zipfile.ZipFile(archive) as zfile:
+            with zfile.open(member) as file:
+                yield io.TextIOWrapper(file, encoding="utf-8")
+    else:
+        with ioutils.open_input(source, "r") as file:
+            yield file
+
+def source_size(source):
+    """ Return the (uncompressed) size of an Empatica csv file in bytes. """
+    if isinstance(source, tuple):
+        archive, member = source
+        with zipfile.ZipFile(archive) as zfile:
+            return zfile.getinfo(member).file_size
+    return ioutils.input_size(source)
+
+def parse_empatica_file(fname, n_header):
+    """
+    Parse an Empatica csv file.
+
+    Arguments:
+       - fname : the name of the csv file, or a tuple
+                 (archive, member) (see open_source)
+       - n_header : the number of header lines
+
+    Returns:
+       - a tuple (the header lines, the data as a two-dimensional
+         array with one column per column of the file)
+    """
+    with open_source(fname) as file:
+        ## read only the header lines, then parse the rest of the
+        ## stream in bulk
+        header = [file.readline() for i in range(n_header)]
+        data = np.loadtxt(file, delimiter=",", ndmin=2)
+    return header, data
+
 def read_empatica_ibi(fname, labels):
     """
     Read the IBI series from the Empatica csv file.
@@ -26,36 +94,31 @@ def read_empatica_ibi(fname, labels):
     function since the data header is slightly different.
 
     Arguments:
-       - fname : the name of the csv file
+       - fname : the name of the csv file, or a tuple
+                 (archive, member) (see open_source)
        - labels : array containing the name that the
                   returned data will have
 
     Returns:
-
-    A dictionary with the following format:
-
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+       - A ChannelSet (see utilities_channels).
 
     """
-    header = open(fname, "r", encoding="utf-8").readlines()
+    header, data_tmp = parse_empatica_file(fname, 1)
+    return get_empatica_ibi(header, data_tmp, labels)
 
+def get_empatica_ibi(header, data_tmp, labels):
+    """ Return the IBI series parsed using parse_empatica_file as a
+    ChannelSet (see read_empatica_ibi). """
     meta = {}
-    data = {}
 
     t_start = header[0].split(",")[0].strip()
     meta["time_start"] = datetime.datetime.fromtimestamp(float(t_start))
     meta["sampling_rate"] = 0
 
-    ## read the signal data and repack the data
-    data_tmp = np.genfromtxt(fname, delimiter=",", skip_header=1)
+    out = chutils.ChannelSet()
+    out.add_channel(labels[0], data_tmp[:, 1] * 1000, meta, time=data_tmp[:, 0])
 
-    data[labels[0]] = data_tmp[:, 1] * 1000
-
-    ## ceate a time vector for the data
-    data["time"] = data_tmp[:, 0]
-
-    return [{"data" : data, "meta" : meta}]
+    return out
 
 def read_empatica_gen(fname, labels, scalefactor = 1.0):
     """
@@ -63,83 +126,191 @@ def read_empatica_gen(fname, labels, scalefactor = 1.0):
     an Empatica csv file.
 
     Arguments:
-       - fname : the name of the csv file
+       - fname : the name of the csv file, or a tuple
+                 (archive, member) (see open_source)
        - labels : array containing the name that the
                   returned data will have
 
-    The data is returned as a list with as many elements
-    as there are channels in the data.
-
-    The
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+    The data is returned as a ChannelSet (see utilities_channels)
+    with as many channels as there are columns in the data.
 
     """
-    header = open(fname, "r", encoding="utf-8").readlines()
+    header, data_tmp = parse_empatica_file(fname, 2)
+    return get_empatica_gen(header, data_tmp, labels, scalefactor)
 
+def get_empatica_gen(header, data_tmp, labels, scalefactor = 1.0):
+    """ Return the signal parsed using parse_empatica_file as a
+    ChannelSet (see read_empatica_gen). """
     meta = {}
 
     t_start = header[0].split(",")[0].strip()
     meta["time_start"] = datetime.datetime.fromtimestamp(float(t_start))
     meta["sampling_rate"] = float(header[1].split(",")[0].strip())
 
-    data_tmp = np.genfromtxt(fname, delimiter=",", skip_header=2)
+    ## the channels share a regular time axis
+    out = chutils.ChannelSet()
+    out.add_samples(labels, data_tmp[:, 0:len(labels)] * scalefactor, meta, sampling_rate=meta["sampling_rate"])
+
+    return out
+
+def parse_empatica_signal(signal_type, source):
+    """
+    Parse one signal file (e.g., ACC or IBI) from an Empatica
+    recording (see parse_empatica_file). This runs in the worker
+    processes of read_empatica, so the parsed data is returned as one
+    array, which is sent to the parent process as a whole.
+
+    Arguments:
+       - signal_type : the type of the signal, i.e., a key in
+                       EMPATICA_SIGNALS
+       - source : the name of the csv file, or a tuple
+                  (archive, member) (see open_source)
+
+    Returns:
+       - a tuple (signal_type, the header lines, the data)
+    """
+    header, data = parse_empatica_file(source, 1 if signal_type == "IBI" else 2)
+    return signal_type, header, data
+
+def get_empatica_signal(signal_type, header, data):
+    """ Return a signal parsed using parse_empatica_signal as a
+    ChannelSet (see utilities_channels). """
+    spec = EMPATICA_SIGNALS[signal_type]
+
+    if signal_type == "IBI":
+        return get_empatica_ibi(header, data, labels=spec["labels"])
+    return get_empatica_gen(header, data, labels=spec["labels"], scalefactor=spec.get("scalefactor", 1.0))
+
+def read_empatica_signal(signal_type, source):
+    """
+    Read one signal file (e.g., ACC or IBI) from an Empatica recording.
+
+    Arguments:
+       - signal_type : the type of the signal, i.e., a key in
+                       EMPATICA_SIGNALS
+       - source : the name of the csv file, or a tuple
+                  (archive, member) (see open_source)
 
-    out = [0] * len(labels)
+    Returns:
+       - A ChannelSet (see utilities_channels).
+    """
+    return get_empatica_signal(*parse_empatica_signal(signal_type, source))
 
-    ## ceate a time vector for the data
-    timevec = np.arange(0, len(data_tmp)) / meta["sampling_rate"]
+def list_empatica_sources(fname):
+    """
+    List the signal files in an Empatica recording.
 
-    if len(labels) == 1:
-        data = {}
-        data[labels[0]] = data_tmp * scalefactor
-        data["time"] = timevec
-        out = [{"meta": meta, "data" : data}]
+    Arguments:
+        - fname: the folder containing the csv data files
+                 or the zip archive exported from E4 connect
+
+    Returns:
+        - A list of tuples (signal_type, source), where source
+          is accepted by open_source.
+    """
+    if os.path.isdir(fname):
+        members = glob.glob(os.path.join(fname, "*.csv"))
+        sources = members
     else:
-        for ind, lab in enumerate(labels):
-            data = {}
-            data[lab] = data_tmp[:, ind] * scalefactor
-            data["time"] = timevec
-            out[ind] = {"meta": meta, "data" : data}
+        with zipfile.ZipFile(fname) as zfile:
+            members = [i for i in zfile.namelist() if i.endswith(".csv")]
+        sources = [(fname, i) for i in members]
 
+    out = []
+    for member, source in zip(members, sources):
+        signal_type = os.path.basename(member).replace(".csv", "")
+        if signal_type in EMPATICA_SIGNALS:
+            out += [(signal_type, source)]
     return out
 
-
-def read_empatica(folder):
+def read_empatica(fname, max_workers=None):
     """
     Read all channels from an an Empatica recording.
 
     Arguments:
-        - folder: the folder containing the csv data files
+        - fname: the folder containing the csv data files
+                 or the zip archive exported from E4 connect
 
-    Returns:
-        - A list where each element represent a channel.
-          Each channel is a dictionary of the form:
+        - max_workers : the number of worker processes used to
+                        parse the signal files concurrently. The
+                        default is one per signal file, limited
+                        by the number of CPUs and, if a memory
+                        budget has been set, by the memory needed
+                        for parsing the largest file (see
+                        utilities_memory).
 
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+    Returns:
+        - A ChannelSet (see utilities_channels).
 
     The metadata contains at least the starting time as a datetime
     object and the sampling rate.
 
     """
-    file_list = glob.glob(folder + "*.csv")
-    out = []
+    sources = list_empatica_sources(fname)
+
+    if max_workers is None:
+        max_workers = min(len(sources), os.cpu_count() or 1)
+        if memutils.get_budget() is not None and sources:
+            worker_bytes = memutils.BASE_MEMORY + PARSE_MEMORY * max(source_size(i[1]) for i in sources)
+            max_workers = memutils.get_max_workers(max_workers, worker_bytes)
+
+    out = chutils.ChannelSet()
+    if max_workers <= 1:
+        for i in sources:
+            out.extend(read_empatica_signal(*i))
+    else:
+        ## the workers return the parsed arrays, and the channels
+        ## (views of the arrays) are created here
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for i in executor.map(parse_empatica_signal, *zip(*sources)):
+                out.extend(get_empatica_signal(*i))
+
+    return out
 
-    for i, f in enumerate(file_list):
-        signal_type = f.split("/")[-1].replace(".csv", "")
-
-        if signal_type == "ACC":
-            out += read_empatica_gen(f, labels=["acc_x", "acc_y", "acc_z"], scalefactor = 1.0 / 64.0)
-        if signal_type == "BVP":
-            out += read_empatica_gen(f, labels=["BVP"])
-        if signal_type == "EDA":
-            out += read_empatica_gen(f, labels=["EDA"])
-        if signal_type == "HR":
-            out += read_empatica_gen(f, labels=["HR"])
-        if signal_type == "TEMP":
-            out += read_empatica_gen(f, labels=["temperature"])
-        if signal_type == "IBI":
-            out += read_empatica_ibi(f, labels=["IBI"])
+def probe_empatica_signal(signal_type, source):
+    """
+    Read only the header of one signal file from an Empatica recording.
+    The number of samples is estimated from the size of the file.
+
+    Arguments:
+       - signal_type : the type of the signal, i.e., a key in
+                       EMPATICA_SIGNALS
+       - source : the name of the csv file, or a tuple
+                  (archive, member) (see open_source)
+
+    Returns:
+       - A ChannelSet (see utilities_channels) with the channels
+         but without the data.
+    """
+    spec = EMPATICA_SIGNALS[signal_type]
+    n_header = 1 if signal_type == "IBI" else 2
+
+    with open_source(source) as file:
+        header = [file.readline() for i in range(n_header)]
+        n_rows = ioutils.count_rows(file, header, source_size(source))
+
+    meta = {}
+    meta["time_start"] = datetime.datetime.fromtimestamp(float(header[0].split(",")[0].strip()))
+    meta["sampling_rate"] = 0 if signal_type == "IBI" else float(header[1].split(",")[0].strip())
+
+    out = chutils.ChannelSet()
+    axis = out.add_axis(sampling_rate=meta["sampling_rate"], length=n_rows)
+    for label in spec["labels"]:
+        out.add_lazy_channel(label, None, n_rows, np.float64, meta, axis)
+
+    return out
+
+def probe_empatica(fname):
+    """
+    Read only the headers of the signal files in an Empatica recording
+    (see read_empatica).
+
+    Returns:
+        - A ChannelSet (see utilities_channels) with the channels
+          but without the data.
+    """
+    out = chutils.ChannelSet()
+    for i in list_empatica_sources(fname):
+        out.extend(probe_empatica_signal(*i))
 
     return out
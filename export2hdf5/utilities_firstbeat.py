@@ -18,6 +18,15 @@ import io
 import sys
 from datetime import datetime
 import numpy as np
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
+
+def parse_features_misc_labels(header):
+    """ Return the feature names (without the time column) from the
+    four header lines of a miscellaneous features file. """
+    labels = [x.strip().replace("Vector", "") for x in header[3].split(";")]
+    del labels[2]
+    return labels
 
 def read_bodyguard_features_misc(fname, time_start=""):
     """
@@ -30,71 +39,49 @@ def read_bodyguard_features_misc(fname, time_start=""):
          The startimg time is not contained in the file.
 
     Returns:
-       - a list of dictionaries, where each dictionary
+       - a ChannelSet (see utilities_channels), where each channel
          represents a feature as a time series ("signal")
 
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
-
     """
     ## Read header of misc vectors
-    tmp = open(fname, "r", encoding="utf-8")
-    for i, line in enumerate(tmp):
-        if i == 3:
-            labels = [x.strip().replace("Vector", "") for x in line.split(";")]
+    tmp = ioutils.open_input(fname, "r")
+    header = [tmp.readline() for i in range(4)]
+    labels = parse_features_misc_labels(header)
 
-    labels[2] = "time"
-
-    ## Read the misc vectors
-    tmp.seek(0)
+    ## Read the misc vectors from the rest of the stream
     tmp_data = tmp.read().replace(",", ".")
     tmp.close()
-    features = np.genfromtxt(io.BytesIO(tmp_data.encode()), delimiter=";", skip_header=4)
+    features = np.genfromtxt(io.StringIO(tmp_data), delimiter=";")
 
     ## get the entire cumulative time vector and then remove it from the main data
     timevec = features[:, 2]
     features = np.delete(features, 2, 1)
-    del labels[2]
 
     ## create the metadata
     meta = {}
 
-    ## create output as array since the sampling rate is different for different channels
-    out = [0] * len(labels)
+    ## each channel has its own time vector since the sampling rate is different for different channels
+    out = chutils.ChannelSet()
 
     meta["time_start"] = time_start
     meta["sampling_rate"] = 0
 
     for i, label in enumerate(labels):
-        data = {}
-        ind = np.isnan(features[:, i])
-
-        data["time"] = timevec[np.logical_not(ind)]
-        data[label] = features[np.logical_not(ind), i]
-
-        out[i] = {"data" : data, "meta" : meta}
+        ind = np.logical_not(np.isnan(features[:, i]))
+        out.add_channel(label, features[ind, i], meta, time=timevec[ind])
 
     return out
 
-def read_bodyguard_features(fname):
+def read_features_header(tmp):
     """
-    Read features exported from the Firstbeat analysis
-    programme.
-
-    Arguments:
-       - fname : the name of the file containing the data
+    Read the header of a features file from the stream tmp, up to and
+    including the line with the names of the vectors.
 
     Returns:
-       - a list of dictionaries, where each dictionary
-         represents a feature as a time series ("signal")
-
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
-
+       - a tuple (header lines, feature names, meta)
     """
-    tmp = open(fname, "r", encoding="utf-8")
-
     meta = {}
+    header = []
 
     tmp_start_date = ''
     tmp_start_time = ''
@@ -103,7 +90,8 @@ def read_bodyguard_features(fname):
     # Get the start time and the index where the data begins
     # Read data until we encounter the word "VECTORS", where
     # the data starts
-    for i, line in enumerate(tmp):
+    for line in iter(tmp.readline, ""):
+        header += [line]
         if line.startswith('SessionStartDate'):
             tmp_start_date = line.split(";")[1]
         if line.startswith('SessionStartTime'):
@@ -115,31 +103,44 @@ def read_bodyguard_features(fname):
     meta["time_start"] = datetime.strptime(time_start, timeformat)
     meta["sampling_rate"] = 1
 
-    ## Read the names of the vectors
-    labels = tmp.readlines(1)[0]
-    labels = labels.split(";")
+    ## Read the names of the vectors, the first two columns are the
+    ## cumulative seconds and the time
+    header += [tmp.readline()]
+    labels = header[-1].split(";")
+    labels = labels[2:]
+    labels = [lab.strip().replace("Vector", "") for lab in labels]
+
+    return header, labels, meta
+
+def read_bodyguard_features(fname):
+    """
+    Read features exported from the Firstbeat analysis
+    programme.
+
+    Arguments:
+       - fname : the name of the file containing the data
+
+    Returns:
+       - a ChannelSet (see utilities_channels), where each channel
+         represents a feature as a time series ("signal")
+
+    """
+    tmp = ioutils.open_input(fname, "r")
+    header, labels, meta = read_features_header(tmp)
 
-    tmp.seek(0)
+    ## Read the data from the rest of the stream
     tmp_data = tmp.read().replace(",", ".")
     tmp.close()
 
     ## Read the data and prepare the time vector
-    ## Note! Uses the variable i from the for-loop over tmp above.
-    features = np.genfromtxt(io.BytesIO(tmp_data.encode()), delimiter=";", skip_header=(i + 2))
+    features = np.genfromtxt(io.StringIO(tmp_data), delimiter=";")
 
     timevec = features[:, 0]
     features = np.delete(features, 0, 1) ## delete the cumulative seconds column
     features = np.delete(features, 0, 1) ## delete the time column
-    labels = labels[2:]
-    labels = [lab.strip().replace("Vector", "") for lab in labels]
-
-    out = [0] * len(labels)
 
-    for i, label in enumerate(labels):
-        data = {}
-        data["time"] = timevec
-        data[label] = features[:, i]
-        out[i] = {"meta" : meta, "data" : data}
+    out = chutils.ChannelSet()
+    out.add_samples(labels, features, meta, time=timevec)
 
     return out
 
@@ -151,11 +152,7 @@ def read_bodyguard_acc(fname):
        - fname : the name of the file containing the data
 
     Returns:
-       - a list of dictionaries, where each dictionary
-         contains the channel data.
-
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+       - a ChannelSet (see utilities_channels)
 
     """
 
@@ -165,8 +162,8 @@ def read_bodyguard_acc(fname):
     meta = {}
 
     ## Read the header
-    tmp = open(fname, "r", encoding="utf-8").readlines()
-    header = tmp[0:5]
+    tmp = ioutils.open_input(fname, "r")
+    header = [tmp.readline() for i in range(5)]
 
     meta["time_start"] = datetime.strptime(header[0].split(";")[1].strip(), timeformat)
     meta["sampling_rate"] = float(header[2].split(";")[1].strip().replace("Hz", ""))
@@ -178,21 +175,17 @@ def read_bodyguard_acc(fname):
         print("Warning!\nIncompatible gscale and/or samplesize!\n\n")
         sys.exit(1)
 
-    ## Read the signals
-    data_tmp = np.genfromtxt(fname, delimiter=";", skip_header=5)
+    ## Read the signals from the rest of the stream
+    data_tmp = np.genfromtxt(tmp, delimiter=";")
+    tmp.close()
 
     ## Pack signals and data
-    out = [0] * 3
+    out = chutils.ChannelSet()
     labels = ["acc_x", "acc_y", "acc_z"]
 
     ## Divide data by 32 to scale to g-values (assuming 4g range and 8-bit resolution)
     ## Divide the time values by 1000 to convert to seconds from milliseconds.
-    for i, lab in enumerate(labels):
-        data = {}
-        data["time"] = data_tmp[:, 0] / 1000.0
-        data[lab] = data_tmp[:, (i+1)] / 32
-
-        out[i] = {"meta" : meta, "data" : data}
+    out.add_samples(labels, data_tmp[:, 1:4] / 32, meta, time=data_tmp[:, 0] / 1000.0)
 
     return out
 
@@ -204,16 +197,13 @@ def read_bodyguard_ibi(fname):
        - fname : the name of the file containing the data
 
     Returns:
-       - a list of dictionaries, where each dictionary
-         contains the channel data.
-
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+       - a ChannelSet (see utilities_channels)
 
     """
 
     ## Read the header
-    header = open(fname, "r", encoding="utf-8").readlines()
+    tmp = ioutils.open_input(fname, "r")
+    header = [tmp.readline() for i in range(5)]
 
     timeformat = "%d.%m.%Y %H:%M:%S"
 
@@ -226,18 +216,104 @@ def read_bodyguard_ibi(fname):
     meta["time_start"] = datetime.strptime(time_start, timeformat)
     meta["sampling_rate"] = 0
 
-    data_tmp = np.genfromtxt(fname, delimiter=";", skip_header=5)
+    data_tmp = np.genfromtxt(tmp, delimiter=";")
+    tmp.close()
     ind = np.isnan(data_tmp[:, 0])
 
-    out = [0] * len(labels)
-
     timevec = np.concatenate(([0], np.cumsum(data_tmp[np.logical_not(ind), 0] / 1000)))
     timevec = timevec[0:-1]
 
-    for i, lab in enumerate(labels):
-        data = {}
-        data[lab] = data_tmp[np.logical_not(ind), i]
-        data["time"] = timevec
-        out[i] = {"meta" : meta, "data" : data}
+    out = chutils.ChannelSet()
+    out.add_samples(labels, data_tmp[np.logical_not(ind), 0:len(labels)], meta, time=timevec)
+
+    return out
+
+
+def probe_bodyguard_features(fname):
+    """
+    Read only the header of a features file. The number of samples
+    is estimated from the size of the file.
+
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    with ioutils.open_input(fname, "r") as tmp:
+        header, labels, meta = read_features_header(tmp)
+        n_rows = ioutils.count_rows(tmp, header, ioutils.input_size(fname))
+
+    out = chutils.ChannelSet()
+    axis = out.add_axis(length=n_rows)
+    for label in labels:
+        out.add_lazy_channel(label, None, n_rows, np.float64, meta, axis)
+
+    return out
+
+def probe_bodyguard_features_misc(fname):
+    """
+    Read only the header of a miscellaneous features file. The
+    number of samples of each feature is at most the number of rows,
+    which is estimated from the size of the file.
+
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    header, n_rows = ioutils.read_header(fname, 4)
+
+    meta = {}
+    meta["time_start"] = ""
+    meta["sampling_rate"] = 0
+
+    ## each channel has its own time vector
+    out = chutils.ChannelSet()
+    for label in parse_features_misc_labels(header):
+        out.add_lazy_channel(label, None, n_rows, np.float64, meta, out.add_axis(length=n_rows))
+
+    return out
+
+def probe_bodyguard_acc(fname):
+    """
+    Read only the header of a Bodyguard acceleration file. The number
+    of samples is estimated from the size of the file.
+
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    header, n_rows = ioutils.read_header(fname, 5)
+
+    meta = {}
+    meta["time_start"] = datetime.strptime(header[0].split(";")[1].strip(), "%d.%m.%Y %H:%M.%S")
+    meta["sampling_rate"] = float(header[2].split(";")[1].strip().replace("Hz", ""))
+
+    out = chutils.ChannelSet()
+    axis = out.add_axis(length=n_rows)
+    for label in ["acc_x", "acc_y", "acc_z"]:
+        out.add_lazy_channel(label, None, n_rows, np.float64, meta, axis)
+
+    return out
+
+def probe_bodyguard_ibi(fname):
+    """
+    Read only the header of a Bodyguard IBI file. The number of beats
+    is estimated from the size of the file.
+
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    header, n_rows = ioutils.read_header(fname, 5)
+
+    meta = {}
+    meta["time_start"] = ""
+    meta["sampling_rate"] = 0
+
+    labels = [i.strip().replace("Vector", "") for i in header[4].split(";")]
+
+    out = chutils.ChannelSet()
+    axis = out.add_axis(length=n_rows)
+    for label in labels:
+        out.add_lazy_channel(label, None, n_rows, np.float64, meta, axis)
 
     return out
@@ -15,19 +15,26 @@ handling datasets (lists containg the data from a
 recording using some device.
 """
 
+import numpy as np
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
+
 def get_channels_in_set(dataset):
     """
     Return list of all channels in the dataset.
 
-    The dataset is a list, where each element
-    represents a channel. Each channel is
-    a dictionary of the form
+    The dataset is a ChannelSet, or a list where
+    each element represents a channel. Each channel
+    is then a dictionary of the form
 
     {"meta" : <dict with metadata>,
     "data" : {"time" : [...], "<channelname" : [...] }}
 
     """
 
+    if isinstance(dataset, chutils.ChannelSet):
+        return dataset.names()
+
     if not isinstance(dataset, list):
         dataset = [dataset]
 
@@ -41,20 +48,33 @@ def get_channels_in_set(dataset):
     return channels
 
 
-def read_text(fname):
+def read_text(fname, encoding="utf-8"):
     """
     Read text data from a file.
 
     Arguments:
        - fname : the name of the file containing the data
+       - encoding : the encoding of the text
 
     Returns:
        - a dictionary with the data
 
-    {"text" : <the text data as a string> }
+    {"text" : <the encoded text as an array of bytes (numpy.uint8)>,
+     "encoding" : <the encoding of the text>}
+
+    The text is not read into memory: the array is a memory map of the
+    file (compressed files are first decompressed in blocks to a
+    temporary file), which is read in blocks when it is written.
+    """
+
+    return {'text' : ioutils.open_input_memmap(fname, np.uint8), 'encoding' : encoding}
+
 
+def probe_text(fname):
     """
+    Get the size of a text file without reading it.
 
-    with open(fname, "r") as file:
-        data = file.read()
-    return {'text' : data}
+    Returns:
+       - a dictionary {"n_bytes" : <the size of the text in bytes>}
+    """
+    return {'n_bytes' : ioutils.input_size(fname)}
@@ -20,12 +20,61 @@ file using the h5py module. The functions here allow
   allowing the selection of data channels from a dataset
 """
 
+import time
+import hashlib
+import warnings
 import datetime
 import h5py
-from . import utilities_general as utils
-
-def init_h5(fname):
-    """ Open a HDF5 file and return handle to it. """
+import numpy as np
+from . import utilities_channels as chutils
+from . import utilities_memory as memutils
+from . import utilities_statistics as statutils
+from . import utilities_profile as profutils
+from . import utilities_live as liveutils
+
+## Number of samples written at a time
+BLOCK_SIZE = 1 << 20
+
+## The largest number of entries in the time index of events, which
+## is stored as an attribute
+MAX_EVENT_INDEX = 4096
+
+## Number of bytes in the chunks of text
+TEXT_CHUNK_SIZE = 1 << 16
+
+## Number of lines between the entries of the line index of text
+LINE_INDEX_FACTOR = 1024
+
+## The largest number of entries in the line index of text, which is
+## stored as an attribute
+MAX_LINE_INDEX = 4096
+
+## The columns of the downsampled levels of a signal (see write_signal_h5)
+PYRAMID_COLUMNS = ["min", "max", "mean"]
+
+## If True, the datasets are written with fletcher32 checksums (see
+## set_checksums)
+CHECKSUMS = False
+
+def set_checksums(enabled):
+    """ Write the datasets (except variable-length data, e.g., text)
+    with fletcher32 checksums, which HDF5 verifies when the data is
+    read. """
+    global CHECKSUMS
+    CHECKSUMS = bool(enabled)
+
+def use_checksums(dtype):
+    """ Return True if datasets of the given type are written with
+    fletcher32 checksums. """
+    dtype = np.dtype(dtype)
+    fields = [dtype.fields[i][0] for i in (dtype.names or [])]
+    return CHECKSUMS and all(h5py.check_vlen_dtype(i) is None for i in [dtype] + fields)
+
+def init_h5(fname, live=False):
+    """ Open a HDF5 file and return handle to it. If live is True, the
+    file can be switched to SWMR mode (see utilities_live). """
+    if live:
+        return liveutils.open_h5(fname)
     return h5py.File(fname, "w")
 
 def close_h5(fid):
@@ -46,34 +95,74 @@ def get_group(fid, path):
 
 
 def add_metadata(path, meta):
-    """ Add the metadata in the dict meta to the HDF5 object obj. """
+    """ Add the metadata in the dict meta to the HDF5 object obj. In
+    SWMR mode (see utilities_live) the existing attributes are
+    modified in place. """
     for meta_tag in meta.keys():
         val = meta[meta_tag]
 
         if isinstance(val, datetime.datetime):
             val = val.strftime("%Y%m%dT%H%M%S")
 
-        path.attrs[meta_tag] = val
+        if liveutils.is_writing():
+            liveutils.modify_attr(path, meta_tag, val)
+        else:
+            path.attrs[meta_tag] = val
 
-def add_metadata_h5(fid, path, meta, channels):
+def add_metadata_h5(fid, path, meta, channels=None):
     """
     Add the metadata contained in the dict 'meta' to the given path in
     the HDF5 file with handle fid.
+
+    Arguments:
+       - fid is the file handle to the HDF5 file
+
+       - path is the path of the map
+
+       - meta is the list of metadata blocks of the map, each a dict
+         {"channels" : <list of channel names or ["*"]>,
+          "info" : <dict with metadata>}
+
+       - channels is the list of the channels of the map. If None
+         (e.g., events or text), the blocks for all channels ("*")
+         are added to the object at path.
+
+    The blocks are first resolved into the attributes of each object
+    (see resolve_metadata), and the attributes of each object are
+    then written using one handle to the object. The blocks in meta
+    are not modified.
     """
     print("\tSetting metadata")
 
-    for group in meta:
-        if ["*"] == group["channels"]:
-            group["channels"] = channels
-        for channel in group["channels"]:
-            path_tmp = path + "/" + channel
-            for attr in group["info"].keys():
-                obj = get_group(fid, path_tmp)
-                obj.attrs[attr] = group["info"][attr]
+    with profutils.stage("metadata"):
+        for path_obj, attrs in resolve_metadata(path, meta, channels).items():
+            ## no objects can be created in SWMR mode
+            if liveutils.is_writing() and path_obj not in fid:
+                continue
+            add_metadata(get_group(fid, path_obj), attrs)
 
-                
-def add_text_h5(fid, path, data):
-    """Add text data (UTF-8) to the given path in the HDF5 file
+def resolve_metadata(path, meta, channels=None):
+    """
+    Resolve the metadata blocks of a map (see add_metadata_h5) into
+    the attributes of each object. The later blocks override the
+    earlier ones.
+
+    Returns:
+       - a dict {<path of the object> : <dict with the attributes>}, in
+         the order the objects first appear in the blocks
+    """
+    out = {}
+    for group in meta:
+        if group["channels"] == ["*"]:
+            targets = [path] if channels is None else [path + "/" + i for i in channels]
+        else:
+            targets = [path + "/" + i for i in group["channels"]]
+        for path_obj in targets:
+            out.setdefault(path_obj, {}).update(group["info"])
+    return out
+
+def add_text_h5(fid, path, data, encoding="utf-8"):
+    """Add text data to the given path in the HDF5 file
        with handle fid.
 
     Arguments:
@@ -81,17 +170,75 @@ def add_text_h5(fid, path, data):
 
        - path is the base path inside the HDF5 file
 
-       - data is the text data as a string
-    """
+       - data is the text data as a string, or the encoded text as
+         bytes or as an array of bytes (numpy.uint8), e.g., a memory
+         map of the file (see utilities_general.read_text)
 
-    dset = fid.create_dataset(name=path,
-                              shape=(1,),
-                              dtype=h5py.special_dtype(vlen=str),
-                              data=data,
-                              compression="gzip")
+       - encoding is the encoding of the text
 
-                
-def add_events_h5(fid, path, data, dtype):
+    The encoded text is written in blocks to a chunked and compressed
+    dataset of bytes (uint8) with the attribute encoding. The byte
+    offset of the start of every line_index_factor:th line is added as
+    the attribute line_index, so that lines can be read without
+    reading the whole text (see utilities_query.ExportReader).
+    """
+    data = text_to_bytes(data, encoding)
+    n = len(data)
+
+    with profutils.stage("write", dataset_path=path) as rec:
+        dset = fid.create_dataset(name=path,
+                                  shape=(n,),
+                                  ## resizable, so that empty text can be chunked
+                                  maxshape=(None,),
+                                  dtype=np.uint8,
+                                  chunks=(max(1, min(n, TEXT_CHUNK_SIZE)),),
+                                  compression="gzip",
+                                  fletcher32=use_checksums(np.dtype(np.uint8)))
+        dset.attrs["encoding"] = encoding
+
+        block_size = max(1, BLOCK_SIZE // TEXT_CHUNK_SIZE) * TEXT_CHUNK_SIZE
+        index = [0]
+        n_lines = 0
+        for start in range(0, n, block_size):
+            block = np.asarray(data[start:start + block_size])
+            dset[start:start + len(block)] = block
+
+            ## the offsets of the lines starting in the block
+            starts = np.flatnonzero(block == ord("\n")) + start + 1
+            first = (-n_lines - 1) % LINE_INDEX_FACTOR
+            index += starts[first::LINE_INDEX_FACTOR].tolist()
+            n_lines += len(starts)
+
+        add_line_index(dset, [i for i in index if i < n] or [0], LINE_INDEX_FACTOR)
+        profutils.add_dataset(rec, dset)
+
+def text_to_bytes(data, encoding="utf-8"):
+    """ Return text (a string, bytes or an array of bytes) as an array
+    of bytes (numpy.uint8). """
+    if isinstance(data, str):
+        data = data.encode(encoding)
+    if isinstance(data, (bytes, bytearray)):
+        return np.frombuffer(data, dtype=np.uint8)
+    return data
+
+def add_line_index(dset, index, factor):
+    """ Add the byte offsets of the start of every factor:th line of the
+    text in dset as the attribute line_index. The index is thinned until
+    it fits in an attribute. """
+    while len(index) > MAX_LINE_INDEX:
+        index = index[::2]
+        factor *= 2
+    dset.attrs["line_index"] = np.asarray(index, dtype=np.int64)
+    dset.attrs["line_index_factor"] = factor
+
+def is_text_h5(dset):
+    """ Return True if the HDF5 dataset dset contains text written by
+    add_text_h5 (or by earlier versions, as a variable-length string). """
+    if h5py.check_string_dtype(dset.dtype) is not None:
+        return True
+    return dset.dtype == np.uint8 and "encoding" in dset.attrs
+
+def add_events_h5(fid, path, data, dtype, meta=None):
     """Add events  to the given path in the HDF5 file with handle fid.
 
     Arguments:
@@ -101,16 +248,45 @@ def add_events_h5(fid, path, data, dtype):
 
        - dataset is a numpy structured array. The format of the events
          varies depending on their origin.
+
+       - meta is an optional dict with metadata for the events
+
+    The events are written as one chunked compound dataset. If the
+    events have onsets (the field onset, in seconds) in increasing
+    order, the onset of the first event in each chunk is added as the
+    attribute time_index, so that the events in a time window can be
+    found without reading all events.
     """
-    dset = fid.create_dataset(name=path,
-                              shape=(len(data),),
-                              dtype=dtype,
-                              data=data,
-                              compression="gzip")
+    with profutils.stage("write", dataset_path=path) as rec:
+        dset = fid.create_dataset(name=path,
+                                  shape=(len(data),),
+                                  dtype=dtype,
+                                  data=data,
+                                  chunks=True,
+                                  compression="gzip",
+                                  fletcher32=use_checksums(dtype))
+        profutils.add_dataset(rec, dset)
+
+        if dtype.names is not None and "onset" in dtype.names:
+            add_event_index(dset, data["onset"])
+
+    if meta is not None:
+        add_metadata(dset, meta)
 
     
                 
-def add_data_h5(fid, path, dataset, channels, shared_group=True):
+def add_event_index(dset, onset):
+    """ Add the onset of the first event in each chunk of the events
+    dset as the attribute time_index, if the onsets are in increasing
+    order and the index fits in an attribute. """
+    chunk = dset.chunks[0]
+    index = np.asarray(onset[::chunk], dtype=np.float64)
+    if len(index) > MAX_EVENT_INDEX or np.any(np.diff(onset) < 0):
+        return
+    dset.attrs["time_index"] = index
+    dset.attrs["time_index_factor"] = chunk
+
+def add_data_h5(fid, path, dataset, channels, shared_group=True, pyramid=None, statistics=True):
     """Add the channels in the dataset to the given path in the
     HDF5 file with handle fid.
 
@@ -119,20 +295,52 @@ def add_data_h5(fid, path, dataset, channels, shared_group=True):
 
        - path is the base path inside the HDF5 file
 
-       - dataset is a dict of dictionaries, each dictionary having the
-         format:
+       - dataset is a ChannelSet (see utilities_channels). Datasets in
+         the older format, i.e., lists of dictionaries, each dictionary
+         having the format:
 
            {"meta" : <dict with metadata>,
             "data" : {"time" : [...], "<channelname" : [...] }}
 
-          and representing a channel.
+          and representing a channel, are also accepted.
 
     The boolean shared_group indicates whether all of the given
     channels should share the same time vector. The channels can share
     the same time vector if they are recorded in time synchrony and at
     the same sampling rate.
 
+    The data is read from the channels and written in blocks, so
+    that lazily read channels are never read into memory as a whole.
+
+    The optional pyramid is a list of decimation factors, e.g.,
+    [10, 100, 1000]. For each factor a downsampled level with the
+    minimum, maximum and mean of each bin of samples is written in
+    the same pass as the data, together with the time of the first
+    sample in each bin. The levels are written to
+
+      <path>/pyramid_<factor>/<channel> and <path>/pyramid_<factor>/time
+
+    for a shared group and otherwise to
+
+      <path>/<channel>/pyramid_<factor>/data and .../time
+
+    If statistics is True, summary statistics of each channel (see
+    utilities_statistics) are computed while the data is written and
+    added as attributes to the dataset of the channel.
+
+    For irregularly sampled channels a coarse index of the time vector,
+    i.e., the time of the first sample in each chunk of the time vector,
+    is written to index/time next to the time vector, so that a time
+    window can be found without reading the whole time vector.
+
+    If the channels do not share a group, the time vector of channels
+    with the same time axis (the same sampling rate and length, or the
+    same irregular time points) is written once, and the groups of the
+    other channels contain hard links to it (and to its downsampled
+    levels and index).
+
     """
+    dataset = chutils.as_channel_set(dataset)
 
     if shared_group:
         ## create the group
@@ -145,47 +353,293 @@ def add_data_h5(fid, path, dataset, channels, shared_group=True):
         ## same time vector
         timevector_added = False
         
-        for i in dataset:
-            channel = utils.get_channels_in_set(i)[0]
-            path_tmp = path + "/" + channel
-
-            if channel in channels:
-                dset_d = fid.create_dataset(path_tmp,
-                                            shape=i["data"][channel].shape,
-                                            dtype="f",
-                                            data=i["data"][channel],
-                                            compression="gzip")
-
-                add_metadata(dset_d, i["meta"])
-
-                if not timevector_added:
-                    dset_t = fid.create_dataset(path + "/time",
-                                                shape=i["data"]["time"].shape,
-                                                dtype="f",
-                                                data=i["data"]["time"],
-                                                compression="gzip")
-                    timevector_added = True
-                if not metadata_added:
-                    add_metadata(grp, i["meta"])
+        for ch in dataset.select(channels):
+            path_tmp = path + "/" + ch.name
+
+            dset_d = write_signal_h5(fid, path_tmp, ch.length, ch.read,
+                                     levels=get_levels(path, pyramid, ch.name),
+                                     statistics=statistics)
+
+            if dset_d is not None:
+                add_metadata(dset_d, ch.meta)
+
+            if not timevector_added:
+                dset_t = write_signal_h5(fid, path + "/time", ch.axis.length, ch.axis.read,
+                                         levels=get_levels(path, pyramid, "time"), summary=False,
+                                         index=get_index_path(path, ch.axis))
+                timevector_added = True
+            if not metadata_added:
+                add_metadata(grp, ch.meta)
+                metadata_added = True
 
     ## the group does not share the same time vector
     else:
-        for i in dataset:
-            channel = utils.get_channels_in_set(i)[0]
-            if channel in channels:
-                path_tmp = path + "/" + channel
+        ## the channels with the same time axis
+        time_paths = {}
+
+        for ch in dataset.select(channels):
+            path_tmp = path + "/" + ch.name
+
+            dset_d = write_signal_h5(fid, path_tmp + "/data", ch.length, ch.read,
+                                     levels=get_levels(path_tmp, pyramid, "data"),
+                                     statistics=statistics)
+
+            ## in SWMR mode the links have been created with the
+            ## datasets, and a linked time vector is written once
+            key = get_axis_key(ch.axis)
+            if key in time_paths and not liveutils.is_writing():
+                link_time_h5(fid, time_paths[key], path_tmp, ch.axis, pyramid)
+            else:
+                dset_t = write_signal_h5(fid, path_tmp + "/time", ch.axis.length, ch.axis.read,
+                                         levels=get_levels(path_tmp, pyramid, "time"), summary=False,
+                                         index=get_index_path(path_tmp, ch.axis))
+                if key is not None:
+                    time_paths[key] = path_tmp
+
+            if dset_d is not None:
+                add_metadata(dset_d, ch.meta)
+
+def get_axis_key(axis):
+    """ Return a key identifying the time vector of the time axis
+    (see utilities_channels.TimeAxis). Regular axes are identified by
+    the sampling rate and the length, irregular axes by the hash of the
+    time points. Returns None for an irregular axis whose time points
+    are not known (e.g., read by a probe). """
+    if axis.is_regular():
+        return ("regular", axis.sampling_rate, axis.length)
+    if axis.explicit is None:
+        return None
+    values = np.ascontiguousarray(axis.explicit)
+    return ("irregular", str(values.dtype), values.shape, hashlib.sha1(values).hexdigest())
+
+def link_time_h5(fid, path_src, path_dst, axis, pyramid=None):
+    """ Add hard links to the time vector (and its downsampled levels
+    and index) of the channel in path_src to the channel in path_dst
+    (see add_data_h5). """
+    links = [(path_src + "/time", path_dst + "/time")]
+    links += list(zip([p for f, p in get_levels(path_src, pyramid, "time")],
+                      [p for f, p in get_levels(path_dst, pyramid, "time")]))
+    if get_index_path(path_src, axis) is not None:
+        links += [(get_index_path(path_src, axis), get_index_path(path_dst, axis))]
+
+    for src, dst in links:
+        get_group(fid, dst.rsplit("/", 1)[0])
+        fid[dst] = fid[src]
+
+def get_levels(path, pyramid, name):
+    """ Return the downsampled levels of the dataset with the given name
+    in the group path as a list of tuples (factor, path of the level). """
+    return [(factor, path + "/pyramid_" + str(factor) + "/" + name) for factor in (pyramid or [])]
+
+def get_index_path(path, axis):
+    """ Return the path of the time index of an irregular time axis in
+    the group path (see write_signal_h5), or None for a regular axis. """
+    if axis.is_regular():
+        return None
+    return path + "/index/time"
+
+def reduce_bins(x, factor, summary=True):
+    """
+    Reduce the samples in x in bins of factor samples. The last bin
+    can be shorter.
+
+    Returns:
+       - if summary is True, an array with one row per bin and the
+         columns PYRAMID_COLUMNS, ignoring NaN values, otherwise the
+         first sample of each bin
+    """
+    if not summary:
+        return x[::factor]
+
+    n = len(x) // factor * factor
+    bins = [x[:n].reshape(-1, factor)]
+    if n < len(x):
+        bins += [x[n:].reshape(1, -1)]
+
+    out = []
+    for b in bins:
+        with warnings.catch_warnings():
+            ## bins with only NaN values
+            warnings.simplefilter("ignore", RuntimeWarning)
+            out += [np.column_stack([np.fmin.reduce(b, axis=1), np.fmax.reduce(b, axis=1), np.nanmean(b, axis=1)])]
+    return np.concatenate(out)
+
+def write_signal_h5(fid, path, length, read, block_size=None, levels=None, summary=True, statistics=False, index=None):
+    """Write a one-dimensional signal to the given path in the HDF5
+    file with handle fid, reading and writing it in blocks.
+
+    Arguments:
+       - fid is the file handle to the HDF5 file
+
+       - path is the path of the dataset inside the HDF5 file
+
+       - length is the number of samples in the signal
+
+       - read is a function read(start, stop) returning the samples
+         from index start to stop
+
+       - block_size is the approximate number of samples written at a
+         time. The blocks are aligned with the chunks of the dataset.
+         By default BLOCK_SIZE, or fewer samples if a memory budget
+         has been set (see utilities_memory).
+
+       - levels is a list of tuples (factor, path) of downsampled levels
+         of the signal, which are written from the same blocks (see
+         reduce_bins). If summary is False (e.g., for time vectors),
+         the levels contain the first sample of each bin.
+
+       - if statistics is True, summary statistics of the signal are
+         computed from the blocks and added as attributes to the
+         dataset (see utilities_statistics)
 
-                dset_d = fid.create_dataset(path_tmp + "/data",
-                                            shape=i["data"][channel].shape,
-                                            dtype="f",
-                                            data=i["data"][channel],
-                                            compression="gzip")
+       - index is the path of a coarse index of the signal (e.g., of a
+         time vector) containing the first sample of each chunk. Its
+         attribute factor is the chunk size.
 
-                dset_t = fid.create_dataset(path_tmp + "/time",
-                                            shape=i["data"]["time"].shape,
-                                            dtype="f",
-                                            data=i["data"]["time"],
-                                            compression="gzip")
+    Returns:
+       - the created dataset
 
-                add_metadata(dset_d, i["meta"])
+    When profiling, the time used for reading and converting the
+    blocks (convert_time) and for compressing and writing them
+    (write_time) are recorded separately.
 
+    In a live export (see utilities_live) the datasets are first created
+    empty, with the attributes of the statistics, and the length is
+    only used for the chunk size. In SWMR mode the samples are written
+    to the existing datasets, which grow as the blocks are written and
+    flushed; None is returned if the dataset has not been created.
+    """
+    with profutils.stage("write", dataset_path=path) as rec:
+        dset = create_signal_h5(fid, path, (length,))
+        if dset is None:
+            return None
+        if liveutils.is_writing() and dset.shape[0] > 0:
+            ## a hard link to a time vector that has been written
+            return dset
+
+        ## align the blocks with the chunks so that each chunk is
+        ## compressed only once
+        chunk = dset.chunks[0]
+        if block_size is None:
+            block_size = memutils.get_block_size(BLOCK_SIZE, memutils.WRITE_SAMPLE_BYTES)
+        block_size = max(1, block_size // chunk) * chunk
+
+        pyramid = [create_level_h5(fid, level_path, length, factor, summary) for factor, level_path in (levels or [])]
+        if index is not None:
+            pyramid += [create_level_h5(fid, index, length, chunk, summary=False)]
+        pyramid = [level for level in pyramid if level is not None]
+        stats = statutils.init_statistics() if statistics else None
+
+        if liveutils.is_creating():
+            ## attributes cannot be added in SWMR mode, so the
+            ## statistics of the empty signal are added now and
+            ## modified once the signal has been written
+            if stats is not None:
+                statutils.add_statistics(dset, stats)
+            return dset
+
+        write_blocks_h5(dset, length, read, block_size, pyramid, stats, rec)
+    return dset
+
+def create_signal_h5(fid, path, shape):
+    """
+    Create a dataset of the given shape for a signal (or a level of
+    it) in the HDF5 file with handle fid. In a live export the dataset
+    is created empty, with the chunks of a dataset of the given shape,
+    and grows without limit, since the shape is an estimate. In SWMR
+    mode the existing dataset is returned, or None with a warning if
+    it has not been created.
+    """
+    if liveutils.is_writing():
+        if path not in fid:
+            print("\tWarning! Dataset", path, "was not created before SWMR mode and is not written.")
+            return None
+        return fid[path]
+
+    if not liveutils.is_live():
+        return fid.create_dataset(path, shape=shape, dtype="f", compression="gzip", fletcher32=CHECKSUMS)
+
+    dset = fid.create_dataset(path, shape=shape, maxshape=(None,) + shape[1:], dtype="f", compression="gzip", fletcher32=CHECKSUMS)
+    dset.resize((0,) + shape[1:])
+    return dset
+
+def write_blocks_h5(dset, length, read, block_size, pyramid, stats, rec):
+    """
+    Read and write the blocks of a signal (see write_signal_h5) to the
+    dataset dset and its downsampled levels, updating the statistics
+    stats (or None) and the profile record rec (or None).
+    """
+    convert_time = 0
+    write_time = 0
+    for start in range(0, length, block_size):
+        stop = min(start + block_size, length)
+        t_0 = time.perf_counter()
+        block = np.asarray(read(start, stop), dtype=dset.dtype)
+        t_1 = time.perf_counter()
+        if dset.shape[0] < stop:
+            dset.resize((stop,))
+        dset[start:stop] = block
+        ## when profiling, compress and write the block now, so that
+        ## the compression is counted in the write time; in SWMR
+        ## mode, so that the readers see the block
+        if rec is not None or liveutils.is_writing():
+            dset.flush()
+        for level in pyramid:
+            write_level_h5(level, block, stop == length)
+        if stats is not None:
+            statutils.update_statistics(stats, block)
+        convert_time += t_1 - t_0
+        write_time += time.perf_counter() - t_1
+
+    profutils.add_dataset(rec, dset)
+    for level in pyramid:
+        profutils.add_dataset(rec, level["dset"])
+    if stats is not None:
+        statutils.add_statistics(dset, stats)
+    profutils.add(rec, convert_time=convert_time, write_time=write_time)
+
+def create_level_h5(fid, path, length, factor, summary=True):
+    """
+    Create the dataset of a downsampled level of a signal with the
+    given length in the HDF5 file with handle fid.
+
+    Returns:
+       - the state of the level (a dict) used by write_level_h5, or
+         None if the level has not been created in SWMR mode
+    """
+    shape = (-(-length // factor),)
+    if summary:
+        shape += (len(PYRAMID_COLUMNS),)
+
+    dset = create_signal_h5(fid, path, shape)
+    if dset is None:
+        return None
+    if not liveutils.is_writing():
+        dset.attrs["factor"] = factor
+        if summary:
+            dset.attrs["columns"] = PYRAMID_COLUMNS
+
+    return {"dset" : dset, "factor" : factor, "summary" : summary,
+            "carry" : np.zeros(0, dtype=dset.dtype), "position" : 0}
+
+def write_level_h5(level, block, last=False):
+    """
+    Reduce a block of samples into the downsampled level (see
+    create_level_h5) and write the complete bins. The samples of an
+    incomplete bin are kept until the next block, or written as a
+    shorter bin if last is True.
+    """
+    buf = np.concatenate([level["carry"], block]) if len(level["carry"]) else block
+    n = len(buf) if last else len(buf) // level["factor"] * level["factor"]
+
+    out = reduce_bins(buf[:n], level["factor"], level["summary"])
+    stop = level["position"] + len(out)
+    grow = level["dset"].shape[0] < stop
+    if grow:
+        ## a growing dataset of a live export
+        level["dset"].resize((stop,) + level["dset"].shape[1:])
+    level["dset"][level["position"]:stop] = out
+    if grow:
+        level["dset"].flush()
+    level["position"] = stop
+    level["carry"] = buf[n:]
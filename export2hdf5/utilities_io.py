@@ -0,0 +1,377 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for opening input files. Compressed
+files (gzip, bzip2, xz and zstd) are detected from their magic bytes
+and decompressed transparently while they are being read, so that
+the readers can be used directly on compressed archives.
+
+Formats that need random access (e.g., the NeurOne binary data) can
+be opened as a memory map of the decompressed data.
+"""
+
+import io
+import os
+import bz2
+import gzip
+import lzma
+import shutil
+import warnings
+import tempfile
+import contextlib
+import numpy as np
+
+## Magic bytes of the supported compression formats
+MAGIC = {"gzip" : b"\x1f\x8b",
+         "bzip2" : b"BZh",
+         "xz" : b"\xfd7zXZ\x00",
+         "zstd" : b"\x28\xb5\x2f\xfd"}
+
+## File name suffixes tried if the given file does not exist
+SUFFIXES = [".gz", ".bz2", ".xz", ".zst"]
+
+## Block size used when copying decompressed data
+BLOCK_SIZE = 1 << 20
+
+## The ratio of the decompressed and the compressed size used for
+## estimating the size of compressed files that do not store it
+COMPRESSION_RATIO = 4
+
+def resolve_input(fname):
+    """
+    Return the name of the file to read. If the file fname does not
+    exist but a compressed version of it (e.g., fname.gz) does, the
+    name of the compressed file is returned.
+    """
+    if not os.path.exists(fname):
+        for suffix in SUFFIXES:
+            if os.path.exists(fname + suffix):
+                return fname + suffix
+    return fname
+
+def detect_compression(fname):
+    """
+    Detect the compression of the file fname from its magic bytes.
+
+    Returns:
+       - the name of the compression format (a key in MAGIC) or None
+         if the file is not compressed.
+    """
+    with open(fname, "rb") as file:
+        head = file.read(8)
+
+    for compression, magic in MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+def open_zstd(fname):
+    """ Open a zstd compressed file for streaming reading. """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading zstd compressed files requires the zstandard package.")
+
+    reader = zstandard.ZstdDecompressor().stream_reader(open(fname, "rb"), closefd=True)
+    return io.BufferedReader(reader)
+
+def open_input(fname, mode="rb", encoding="utf-8"):
+    """
+    Open a file for reading, decompressing it on the fly if it is
+    compressed.
+
+    Arguments:
+       - fname : the name of the file
+       - mode : "rb" for a binary stream or "r" for a text stream
+       - encoding : the encoding of text streams
+
+    Returns:
+       - a file object
+    """
+    fname = resolve_input(fname)
+    compression = detect_compression(fname)
+
+    if compression == "gzip":
+        file = gzip.open(fname, "rb")
+    elif compression == "bzip2":
+        file = bz2.open(fname, "rb")
+    elif compression == "xz":
+        file = lzma.open(fname, "rb")
+    elif compression == "zstd":
+        file = open_zstd(fname)
+    else:
+        file = open(fname, "rb")
+
+    if "b" not in mode:
+        file = io.TextIOWrapper(file, encoding=encoding)
+    return file
+
+def open_input_memmap(fname, dtype):
+    """
+    Open a binary file as a read-only memory map. Compressed files
+    are first decompressed to an anonymous temporary file, which is
+    removed automatically once the memory map is released.
+
+    Arguments:
+       - fname : the name of the file
+       - dtype : the numpy dtype of the data in the file
+
+    Returns:
+       - a one-dimensional numpy.memmap
+    """
+    fname = resolve_input(fname)
+
+    if detect_compression(fname) is None:
+        if os.path.getsize(fname) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(fname, dtype=dtype, mode="r")
+
+    with tempfile.TemporaryFile() as tmp:
+        with open_input(fname, "rb") as file:
+            shutil.copyfileobj(file, tmp, BLOCK_SIZE)
+        tmp.flush()
+        if tmp.tell() == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(tmp, dtype=dtype, mode="r")
+
+def input_size(fname):
+    """
+    Return the size of the (decompressed) contents of the file fname
+    in bytes, without decompressing it. The size of compressed files
+    is read from the gzip trailer (ISIZE), the xz index or the zstd
+    frame header. These are exact for files with one gzip member, xz
+    stream or zstd frame (gzip stores the size modulo 4 GiB, so larger
+    files are estimated). The size of other compressed files (e.g.,
+    bzip2) is estimated from the compressed size using
+    COMPRESSION_RATIO.
+    """
+    fname = resolve_input(fname)
+    compression = detect_compression(fname)
+    size = os.path.getsize(fname)
+
+    if compression is None:
+        return size
+
+    out = None
+    try:
+        if compression == "gzip":
+            out = gzip_size(fname, size)
+        elif compression == "xz":
+            out = xz_size(fname)
+        elif compression == "zstd":
+            out = zstd_size(fname)
+    except (OSError, ValueError, IndexError):
+        out = None
+
+    if out is None:
+        out = size * COMPRESSION_RATIO
+    return out
+
+def gzip_size(fname, size):
+    """ Return the decompressed size of a gzip file from its trailer.
+    The trailer holds the size modulo 2**32; larger files are assumed
+    to be at least as large as the compressed file. """
+    with open(fname, "rb") as file:
+        file.seek(-4, os.SEEK_END)
+        isize = int.from_bytes(file.read(4), "little")
+    while isize < size and size > 1 << 32:
+        isize += 1 << 32
+    return isize
+
+def read_varint(data, pos):
+    """ Read a variable-length integer of the xz format from the bytes
+    data at position pos. Returns the value and the next position. """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        value |= (byte & 0x7f) << shift
+        pos += 1
+        shift += 7
+        if byte & 0x80 == 0:
+            return value, pos
+
+def xz_size(fname):
+    """ Return the decompressed size of an xz file from the index at the
+    end of the file, or None if the file does not end in a stream
+    footer. """
+    with open(fname, "rb") as file:
+        file.seek(-12, os.SEEK_END)
+        footer = file.read(12)
+        if footer[10:12] != b"YZ":
+            return None
+        index_size = (int.from_bytes(footer[4:8], "little") + 1) * 4
+        file.seek(-12 - index_size, os.SEEK_END)
+        index = file.read(index_size)
+
+    if index[0] != 0:
+        return None
+    n, pos = read_varint(index, 1)
+    size = 0
+    for i in range(n):
+        unpadded, pos = read_varint(index, pos)
+        uncompressed, pos = read_varint(index, pos)
+        size += uncompressed
+    return size
+
+def zstd_size(fname):
+    """ Return the decompressed size of a zstd file from the header of
+    its first frame, or None if it is not stored there. """
+    try:
+        import zstandard
+    except ImportError:
+        return None
+
+    with open(fname, "rb") as file:
+        size = zstandard.frame_content_size(file.read(18))
+    if size < 0:
+        return None
+    return size
+
+@contextlib.contextmanager
+def input_path(fname):
+    """
+    Context manager yielding the name of a regular file with the
+    decompressed contents of fname. This is needed for libraries that
+    only accept file names (e.g., pyedflib). Uncompressed files are
+    used as they are, compressed files are decompressed to a temporary
+    file that is removed when the context exits.
+    """
+    fname = resolve_input(fname)
+
+    if detect_compression(fname) is None:
+        yield fname
+        return
+
+    ## keep the original extension (e.g., ".edf") of the file
+    root, ext = os.path.splitext(fname)
+    if ext in SUFFIXES:
+        ext = os.path.splitext(root)[1]
+
+    tmp = tempfile.NamedTemporaryFile(suffix=ext, delete=False)
+    try:
+        with open_input(fname, "rb") as file:
+            shutil.copyfileobj(file, tmp, BLOCK_SIZE)
+        tmp.close()
+        yield tmp.name
+    finally:
+        tmp.close()
+        os.remove(tmp.name)
+
+def count_rows(file, header, size, n_sample=100):
+    """
+    Estimate the number of data rows in a text file without reading it.
+
+    Arguments:
+       - file : a text stream positioned after the header lines
+       - header : the header lines that have been read
+       - size : the (decompressed) size of the file in bytes
+       - n_sample : the number of rows used for the estimate
+
+    Returns:
+       - the number of rows. This is exact for files with at most
+         n_sample rows, otherwise it is estimated from the size of the
+         file and the average length of the first n_sample rows.
+    """
+    sample = []
+    for i in range(n_sample):
+        line = file.readline()
+        if line.strip() == "":
+            break
+        sample += [line]
+
+    if len(sample) < n_sample:
+        return len(sample)
+
+    header_bytes = sum(len(i.encode("utf-8")) for i in header)
+    row_bytes = sum(len(i.encode("utf-8")) for i in sample) / len(sample)
+    return int(round((size - header_bytes) / row_bytes))
+
+def read_header(fname, n_header, n_sample=100):
+    """
+    Read the header lines of a text file and estimate the number of
+    data rows following them (see count_rows).
+
+    Returns:
+       - a tuple (header lines, number of rows)
+    """
+    with open_input(fname, "r") as file:
+        header = [file.readline() for i in range(n_header)]
+        n_rows = count_rows(file, header, input_size(fname), n_sample)
+    return header, n_rows
+
+def iter_blocks(file, delimiter, usecols=None, block_size=65536):
+    """
+    Read numeric delimited text from a stream in blocks of rows.
+
+    Arguments:
+       - file : a text stream positioned at the first data row
+       - delimiter : the column separator
+       - usecols : the columns read (default: all)
+       - block_size : the number of rows in each block
+
+    Returns:
+       - a generator yielding two-dimensional arrays with one
+         column per column read
+    """
+    while True:
+        with warnings.catch_warnings():
+            # the last block can be empty
+            warnings.simplefilter("ignore", UserWarning)
+            block = np.loadtxt(file, delimiter=delimiter, usecols=usecols, max_rows=block_size, ndmin=2)
+
+        if len(block) > 0:
+            yield block
+        if len(block) < block_size:
+            break
+
+class ColumnStore(object):
+    """
+    Temporary files holding the columns of a table that is parsed in
+    blocks of rows (e.g., a csv file), one file per column. The blocks
+    are appended as they are parsed, and the columns are then used as
+    read-only memory maps, so that the parsed data is not held in
+    memory and each column can be read in blocks (e.g., by the writer
+    in utilities_h5). The files are removed once the memory maps have
+    been released.
+
+    Arguments:
+       - n_columns : the number of columns
+       - dtype : the numpy dtype of the columns
+    """
+
+    def __init__(self, n_columns, dtype=np.float64):
+        self.files = [tempfile.TemporaryFile() for i in range(n_columns)]
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+
+    def append(self, block):
+        """ Append a block (a two-dimensional array with one column per
+        column of the table) to the columns. """
+        block = np.asarray(block, dtype=self.dtype)
+        for i, file in enumerate(self.files):
+            file.write(np.ascontiguousarray(block[:, i]).data)
+        self.length += len(block)
+
+    def columns(self):
+        """ Close the files and return the columns as a list of
+        read-only memory maps. """
+        out = []
+        for file in self.files:
+            file.flush()
+            if self.length > 0:
+                out += [np.memmap(file, dtype=self.dtype, mode="r")]
+            else:
+                out += [np.zeros(0, dtype=self.dtype)]
+            file.close()
+        self.files = []
+        return out
@@ -0,0 +1,192 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for live export, i.e., writing HDF5
+files that other processes can read while they are being written,
+using the single-writer/multiple-reader (SWMR) mode of HDF5.
+
+In SWMR mode the writer can only write to and extend the datasets and
+modify the attributes that exist when the mode is switched on; the
+readers do not see objects (groups, datasets, attributes) created
+later. A live export is therefore written in two phases:
+
+1. CREATE: the headers of the signals are read using the probes of the
+   readers, and the groups, the metadata and the datasets of the
+   signals (and of their downsampled levels, time indices and
+   statistics) are created. The datasets are empty and can grow
+   without limit, since the probes only estimate the number of
+   samples. The events, the text and the signals of readers without a
+   probe are read and written in full.
+
+2. WRITE: the file is switched to SWMR mode, and the signals are read
+   and written one dataset at a time in the order of the configuration
+   file. Each block is flushed as it is written and the file after
+   each map, so that the readers see the samples written so far. The
+   attributes created in the first phase are updated in place (see
+   modify_attr); attributes missing from the probes cannot be added.
+
+The readers open the file with h5py.File(fname, "r", swmr=True) (or
+utilities_query.ExportReader(fname, swmr=True)) and call refresh() on
+the datasets to see new samples.
+
+The LiveWriter appends blocks of a streamed signal (e.g., from a
+device) to a file kept open in SWMR mode.
+"""
+
+import numpy as np
+import h5py
+
+## The phases of a live export
+CREATE = "create"
+WRITE = "write"
+
+## The phase of the running live export, or None if the export is
+## not live
+PHASE = None
+
+## The number of samples in the chunks of the datasets of a LiveWriter
+CHUNK_SIZE = 1 << 14
+
+def set_phase(phase):
+    """ Set the phase of a live export (CREATE or WRITE), or None to
+    stop the live export. """
+    global PHASE
+    PHASE = phase
+
+def is_live():
+    """ Return True if a live export is running. """
+    return PHASE is not None
+
+def is_creating():
+    """ Return True if the objects of a live export are being created. """
+    return PHASE == CREATE
+
+def is_writing():
+    """ Return True if the signals of a live export are being written
+    in SWMR mode. """
+    return PHASE == WRITE
+
+def open_h5(fname, mode="w"):
+    """ Open an HDF5 file that can be switched to SWMR mode and return a
+    handle to it. """
+    return h5py.File(fname, mode, libver="latest")
+
+def start_swmr(fid):
+    """ Switch the HDF5 file with handle fid to SWMR mode and start
+    writing the signals of a live export. """
+    fid.swmr_mode = True
+    set_phase(WRITE)
+
+def modify_attr(obj, key, value):
+    """
+    Modify the attribute key of the HDF5 object obj in place, as
+    attributes cannot be added in SWMR mode. A warning is printed if
+    the attribute does not exist, or the value does not fit its type
+    and shape.
+
+    Returns:
+       - True if the attribute was modified
+    """
+    if key in obj.attrs:
+        attr = obj.attrs.get_id(key)
+        try:
+            new = np.asarray(value, dtype=attr.dtype)
+            exact = attr.dtype.kind not in "iub" or np.array_equal(new, value)
+            if new.shape == attr.shape and exact:
+                attr.write(np.ascontiguousarray(new))
+                return True
+        except (TypeError, ValueError):
+            pass
+    print("\tWarning! Attribute", key, "of", obj.name, "cannot be changed in a live export.")
+    return False
+
+class LiveWriter(object):
+    """
+    Writer appending blocks of a streamed signal to an HDF5 file in
+    SWMR mode. The channels share the time vector, as in a shared group
+    written by utilities_h5.add_data_h5:
+
+        <path>/<channel> and <path>/time
+
+    Arguments:
+       - fname : the name of the HDF5 file
+       - path : the path of the group of the channels
+       - channels : the names of the channels
+       - meta : a dict with the metadata of the group
+       - mode : "w" to create the file, "a" to add the group to an
+                existing file that is not open in another process
+       - chunk_size : the number of samples in a chunk
+
+    Example:
+
+        with LiveWriter("live.h5", "ECG/device", ["ecg"]) as writer:
+            for time, samples in stream:
+                writer.append(time, {"ecg" : samples})
+    """
+
+    def __init__(self, fname, path, channels, meta=None, mode="w", chunk_size=CHUNK_SIZE):
+        self.fid = open_h5(fname, mode)
+        self.length = 0
+
+        grp = self.fid.require_group(path)
+        for key, value in (meta or {}).items():
+            grp.attrs[key] = value
+
+        self.dsets = {}
+        for name in list(channels) + ["time"]:
+            self.dsets[name] = grp.create_dataset(name,
+                                                  shape=(0,),
+                                                  maxshape=(None,),
+                                                  chunks=(chunk_size,),
+                                                  dtype="f",
+                                                  compression="gzip")
+
+        self.fid.swmr_mode = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, time, data):
+        """
+        Append a block of samples.
+
+        Arguments:
+           - time : the time points of the samples
+           - data : a dict mapping the names of the channels to the
+                    samples, which have the same length as time
+
+        The block is flushed, so that the readers see it once they
+        refresh the datasets.
+        """
+        n = len(time)
+        if set(data) != set(self.dsets) - {"time"}:
+            raise ValueError("The block must contain the samples of all channels.")
+        if any(len(x) != n for x in data.values()):
+            raise ValueError("The channels of a block must have the same length as the time vector.")
+
+        stop = self.length + n
+        for name, x in list(data.items()) + [("time", time)]:
+            dset = self.dsets[name]
+            dset.resize((stop,))
+            dset[self.length:stop] = np.asarray(x, dtype=dset.dtype)
+        ## flush the time vector last, so that the readers never see
+        ## time points without samples
+        for name in list(data) + ["time"]:
+            self.dsets[name].flush()
+        self.length = stop
+
+    def close(self):
+        """ Close the file. """
+        self.fid.close()
@@ -0,0 +1,117 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains the memory budget of an export. When a budget is
+set (e.g., using --max-memory), it determines
+
+- the number of rows read at a time by the streaming readers
+- the number of samples written at a time to the HDF5 file
+- the number of files parsed in parallel (e.g., for Empatica)
+
+so that the data held in memory at a time stays within the budget.
+Readers that hold the whole dataset in memory cannot be limited this
+way, so a dataset whose reading is estimated to need more memory than
+the budget is not read, and the export fails with a MemoryError (see
+check). Without a budget the defaults of the readers and writers are
+used.
+"""
+
+## The memory budget in bytes, None if the memory is not limited
+MAX_MEMORY = None
+
+## Memory used by the interpreter and the libraries (bytes)
+BASE_MEMORY = 60e6
+
+## The fraction of the budget available for one block of data
+BLOCK_FRACTION = 0.1
+
+## Memory used per value while parsing numeric text in blocks (bytes)
+TEXT_VALUE_BYTES = 32
+
+## Memory used per sample while writing a signal in blocks: the
+## samples read (float64), converted (float32) and the time points
+WRITE_SAMPLE_BYTES = 8 + 4 + 8
+
+## Suffixes accepted in memory sizes
+UNITS = {"K" : 1e3, "M" : 1e6, "G" : 1e9, "T" : 1e12}
+
+def parse_size(size):
+    """
+    Parse a memory size given as a number of bytes or with a
+    suffix, e.g., "512M" or "2G". Returns the size in bytes.
+    """
+    size = str(size).strip().upper().rstrip("B")
+    if size and size[-1] in UNITS:
+        return int(float(size[:-1]) * UNITS[size[-1]])
+    return int(float(size))
+
+def set_budget(max_memory):
+    """ Set the memory budget (bytes, or a string accepted by parse_size).
+    None removes the limit. """
+    global MAX_MEMORY
+    MAX_MEMORY = parse_size(max_memory) if max_memory is not None else None
+
+def get_budget():
+    """ Return the memory budget in bytes, or None if it is not set. """
+    return MAX_MEMORY
+
+def available():
+    """ Return the memory available for data within the budget (bytes),
+    or None if the memory is not limited. """
+    if MAX_MEMORY is None:
+        return None
+    return max(MAX_MEMORY - BASE_MEMORY, 0)
+
+def get_block_size(default, item_bytes):
+    """
+    Return the number of items (samples or rows) processed at a time.
+
+    Arguments:
+       - default : the number of items used without a budget
+       - item_bytes : the memory used per item (bytes)
+
+    Returns:
+       - the default, or fewer items if a block of the default size
+         would use more than BLOCK_FRACTION of the available memory
+    """
+    if MAX_MEMORY is None:
+        return default
+    return int(max(1, min(default, available() * BLOCK_FRACTION / max(item_bytes, 1))))
+
+def get_max_workers(default, worker_bytes):
+    """
+    Return the number of workers that can run in parallel.
+
+    Arguments:
+       - default : the number of workers used without a budget
+       - worker_bytes : the memory used by one worker (bytes)
+    """
+    if MAX_MEMORY is None:
+        return default
+    return int(max(1, min(default, available() // max(worker_bytes, 1))))
+
+def check(name, estimate):
+    """
+    Check that the estimated memory use (bytes) of reading the dataset
+    with the given name is within the budget. Raises a MemoryError if
+    it is not.
+    """
+    if MAX_MEMORY is None or estimate <= available():
+        return
+    raise MemoryError("Reading %s is estimated to need %.0f MB, more than the memory budget of %.0f MB." % (name, (estimate + BASE_MEMORY) / 1e6, MAX_MEMORY / 1e6))
+
+def usage(peak_rss):
+    """ Return the peak memory use peak_rss (bytes) relative to the
+    budget, or None if the memory is not limited. """
+    if MAX_MEMORY is None or peak_rss is None:
+        return None
+    return peak_rss / float(MAX_MEMORY)
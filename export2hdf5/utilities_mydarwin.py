@@ -14,7 +14,10 @@ This module contains functions for reading
 data exported from MyDarwin in csv format.
 """
 
+import io
 import numpy as np
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
 
 def read_mydarwin_data_ibi(fname):
     """
@@ -26,10 +29,7 @@ def read_mydarwin_data_ibi(fname):
        - fname : file name
 
     Returns:
-       - A list with a dictionary of the form
-
-         {"meta" : <dict with metadata>,
-          "data" : {"time" : [...], "<channelname" : [...] }}
+       - A ChannelSet (see utilities_channels)
 
     Notes:
 
@@ -39,19 +39,18 @@ def read_mydarwin_data_ibi(fname):
     """
 
     meta = {}
-    data = {}
 
     meta["time_start"] = ''
     meta["sampling_rate"] = 0
 
 
-    data_tmp = np.genfromtxt(fname, delimiter=",", skip_header=0)
+    with ioutils.open_input(fname, "r") as file:
+        data_tmp = np.genfromtxt(file, delimiter=",", skip_header=0)
 
-    data["time"] = np.cumsum(data_tmp[:, 0] / 1000)
-    data["ibi"] = data_tmp[:, 0]
-    data["beat_type"] = data_tmp[:, 1]
+    out = chutils.ChannelSet()
+    out.add_samples(["ibi", "beat_type"], data_tmp[:, 0:2], meta, time=np.cumsum(data_tmp[:, 0] / 1000))
 
-    return [{"meta" : meta, "data" : data}]
+    return out
 
 
 def read_mydarwin_data_summary(fname):
@@ -64,10 +63,7 @@ def read_mydarwin_data_summary(fname):
        - fname : file name
 
     Returns:
-       - A list with a dictionary of the form
-
-         {"meta" : <dict with metadata>,
-          "data" : {"time" : [...], "<channelname" : [...] }}
+       - A ChannelSet (see utilities_channels)
 
     Notes:
 
@@ -76,7 +72,8 @@ def read_mydarwin_data_summary(fname):
          is irregular.
     """
 
-    data_tmp = np.genfromtxt(fname, delimiter=",", skip_header=0, names = True)
+    with ioutils.open_input(fname, "r") as file:
+        data_tmp = np.genfromtxt(file, delimiter=",", skip_header=0, names = True)
 
     labels = data_tmp.dtype.names
     
@@ -88,17 +85,63 @@ def read_mydarwin_data_summary(fname):
 
     timevec = data_tmp["start"]
 
-    out = [0] * (len(labels) - len(skip_columns))
+    out = chutils.ChannelSet()
 
-    i = 0
     for label in labels:
         if label not in skip_columns:
-            data = {}
+            out.add_channel(label, data_tmp[label], meta, time=timevec)
+
+    return out
+
+
+def probe_mydarwin_data_ibi(fname):
+    """
+    Read only the beginning of an IBI file exported from MyDarwin.
+    The number of beats is estimated from the size of the file.
+
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    header, n_rows = ioutils.read_header(fname, 0)
+
+    meta = {}
+    meta["time_start"] = ''
+    meta["sampling_rate"] = 0
 
-            data["time"] = timevec
-            data[label] = data_tmp[label]
+    out = chutils.ChannelSet()
+    axis = out.add_axis(length=n_rows)
+    for label in ["ibi", "beat_type"]:
+        out.add_lazy_channel(label, None, n_rows, np.float64, meta, axis)
 
-            out[i] = {"data" : data, "meta" : meta}
-            i += 1
     return out
 
+def probe_mydarwin_data_summary(fname):
+    """
+    Read only the header of a summary file exported from MyDarwin.
+    The number of rows is estimated from the size of the file.
+
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    ## parse the header and the first row as in read_mydarwin_data_summary
+    ## to get the same channel names
+    header, n_rows = ioutils.read_header(fname, 2)
+    if header[1].strip() != "":
+        n_rows += 1
+    labels = np.genfromtxt(io.StringIO("".join(header)), delimiter=",", names = True).dtype.names
+
+    skip_columns = ["start", "end"]
+
+    meta = {}
+    meta["time_start"] = ''
+    meta["sampling_rate"] = 0
+
+    out = chutils.ChannelSet()
+    axis = out.add_axis(length=n_rows)
+    for label in labels:
+        if label not in skip_columns:
+            out.add_lazy_channel(label, None, n_rows, np.float64, meta, axis)
+
+    return out
@@ -23,6 +23,8 @@ from os import path
 from construct import Struct, Int32sl, Int64ul
 
 from datetime import datetime
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
 
 def read_neurone_protocol(fpath):
     """
@@ -56,7 +58,8 @@ def read_neurone_protocol(fpath):
     # Get channel names and organise them according to their
     # physical order (InputNumber), which is the order
     # in which the channels are being sampled.
-    docroot = xml.etree.ElementTree.parse(fname_protocol).getroot()
+    with ioutils.open_input(fname_protocol, "rb") as file:
+        docroot = xml.etree.ElementTree.parse(file).getroot()
     channels = docroot.findall("xmlns:TableInput", namespaces=ns)
     channel_names = ['']*len(channels)
 
@@ -76,7 +79,8 @@ def read_neurone_protocol(fpath):
     # Get channel names and organise them according to their
     # physical order (InputNumber), which is the order
     # in which the channels are being sampled.
-    docroot = xml.etree.ElementTree.parse(fname_session).getroot()
+    with ioutils.open_input(fname_session, "rb") as file:
+        docroot = xml.etree.ElementTree.parse(file).getroot()
     session = docroot.findall("xmlns:TableSession", namespaces=ns2)
     time_start = session[0].findall("xmlns:StartDateTime", namespaces=ns2)[0].text
     time_stop = session[0].findall("xmlns:StopDateTime", namespaces=ns2)[0].text
@@ -132,20 +136,58 @@ def read_neurone_data(fpath, session_phase = 1, protocol = None):
     if protocol is None:
         protocol = read_neurone_protocol(fpath)
     
-    # Determine number of samples to read
-    f_info = path.getsize(fname)
+    # Map the (decompressed) data into memory and determine
+    # the number of samples
+    data = ioutils.open_input_memmap(fname, dtype='<i4')
     n_channels = len(protocol['channels'])
-    n_samples = int(f_info / 4 / n_channels)
+    n_samples = int(data.size / n_channels)
 
-    # Read the data and store the data
-    # in an ndarray
-    with open(fname, mode='rb') as file:
-        data = np.fromfile(fname, dtype='<i4')
-        data.shape = (n_samples, n_channels)
+    # Store the data in an ndarray with one column per channel
+    data = data[0:(n_samples * n_channels)].reshape((n_samples, n_channels))
 
     return data
 
 
+def probe_neurone_data(fpath, session_phase = 1):
+    """
+    Read only the protocol of a NeurOne measurement. The number of
+    samples is computed from the size of the binary data file.
+
+    Arguments:
+       - fpath : the path to the directory holding the
+                 NeurOne measurement
+       - session_phase : the phase of the measurement
+
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    protocol = read_neurone_protocol(fpath)
+
+    fname = path.join(fpath, str(session_phase), str(session_phase)+'.bin')
+    n_samples = int(ioutils.input_size(fname) / (4 * len(protocol['channels'])))
+
+    out = chutils.ChannelSet()
+    axis = out.add_axis(sampling_rate=float(protocol['meta']['sampling_rate']), length=n_samples)
+    for channel in protocol["channels"]:
+        out.add_lazy_channel(channel, None, n_samples, np.int32, protocol["meta"], axis)
+
+    return out
+
+def probe_neurone_events(fpath, session_phase = 1):
+    """
+    Get the number of NeurOne events from the size of the events file
+    without reading the events.
+
+    Returns:
+       - A dict with the number of events and the data type for the events.
+
+    {"n_events" : <the number of events>,
+    "dtype" : <the numpy dtype for the events>}
+    """
+    fname = path.join(fpath, str(session_phase), "events.bin")
+    return {'n_events' : int(ioutils.input_size(fname) / 88), 'dtype' : get_n1_events_dtype()}
+
 def get_n1_event_format():
     """
     Define the format for the events in a neurone recording.
@@ -177,6 +219,25 @@ def get_n1_event_format():
         "RFU5"              / Int32sl)
 
 
+def get_n1_events_dtype():
+    """
+    Return the numpy dtype of the NeurOne events as they are exported.
+    """
+    return np.dtype([("Revision"          , np.int32),
+                     ("Type"              , np.int32),
+                     ("SourcePort"        , np.int32),
+                     ("ChannelNumber"     , np.int32),
+                     ("Code"              , np.int32),
+                     ("StartSampleIndex"  , np.int64),
+                     ("StopSampleIndex"   , np.int64),
+                     ("DescriptionLength" , np.int64),
+                     ("DescriptionOffset" , np.int64),
+                     ("DataLength"        , np.int64),
+                     ("DataOffset"        , np.int64),
+                     ("StartTime"         , np.int64),
+                     ("StopTime"          , np.int64) ])
+
+
 def read_neurone_events(fpath, session_phase = 1, sampling_rate = None):
     """
     Read the NeurOne events from a binary file.
@@ -210,40 +271,28 @@ def read_neurone_events(fpath, session_phase = 1, sampling_rate = None):
         protocol = read_neurone_protocol(fpath)
         sampling_rate = protocol['meta']['sampling_rate']
     
-    # Determine number of events
-    f_info = path.getsize(fname)
-    n_events = int(f_info / 88)
+    # Read the (decompressed) events and determine number of events
+    with ioutils.open_input(fname, "rb") as file:
+        buf = file.read()
+    n_events = int(len(buf) / 88)
     events = [''] * n_events
 
-    # Read events in chunks of 88 bytes and unpack
+    # Unpack the events in chunks of 88 bytes and
     # also add start / stop time for each event
     # and remove 'reserved for future use' (RFU) fields
     format = get_n1_event_format()
-    with open(fname, mode='rb') as file:
-        for i in range(n_events):
-            events[i] = format.parse(file.read(88))
-            events[i]['StartTime'] = events[i]['StartSampleIndex'] / sampling_rate
-            events[i]['StopTime'] = events[i]['StopSampleIndex'] / sampling_rate
-            for j in range(5):
-                del events[i]['RFU' + str(j+1)]
+    for i in range(n_events):
+        events[i] = format.parse(buf[(i * 88):((i + 1) * 88)])
+        events[i]['StartTime'] = events[i]['StartSampleIndex'] / sampling_rate
+        events[i]['StopTime'] = events[i]['StopSampleIndex'] / sampling_rate
+        for j in range(5):
+            del events[i]['RFU' + str(j+1)]
 
     # Create a numpy structured array from the events
-    events_dtype = np.dtype([("Revision"          , np.int32),
-                             ("Type"              , np.int32),
-                             ("SourcePort"        , np.int32),
-                             ("ChannelNumber"     , np.int32),
-                             ("Code"              , np.int32),
-                             ("StartSampleIndex"  , np.int64),
-                             ("StopSampleIndex"   , np.int64),
-                             ("DescriptionLength" , np.int64),
-                             ("DescriptionOffset" , np.int64),
-                             ("DataLength"        , np.int64),
-                             ("DataOffset"        , np.int64),
-                             ("StartTime"         , np.int64),
-                             ("StopTime"          , np.int64) ])
+    events_dtype = get_n1_events_dtype()
 
     # convert array of event dicts to an array of tuples
-    keylist = [k for k, v in events[0].items()]
+    keylist = list(events_dtype.names)
     tmp =  [tuple([e[k] for k in keylist]) for e in events]
     events = np.array(tmp, dtype = events_dtype)
 
@@ -299,7 +348,7 @@ def read_neurone(fpath):
        - a dictionary containing the data, events and the
          data type (numpy dtype) for the events.
 
-    {"data" : <the signal data>,
+    {"data" : <the signal data as a ChannelSet>,
     "events" : <the events>,
     "events_dtype" : <event data type>}
     """
@@ -313,15 +362,9 @@ def read_neurone(fpath):
     # Read the events
     events = read_neurone_events(fpath, session_phase = 1, sampling_rate = float(protocol['meta']['sampling_rate']))
 
-    # Create a time vector
-    timevec = np.array(range(data.shape[0])) / float(protocol['meta']['sampling_rate'])
-
-    out = [0] * len(protocol["channels"])
-    for i, label in enumerate(protocol["channels"]):
-        data_out =  {}
-        data_out[label] = data[:,i]
-        data_out["time"] = timevec
-        out[i] = {"meta" : protocol["meta"], "data" : data_out}
+    # The channels share a regular time axis
+    out = chutils.ChannelSet()
+    out.add_samples(protocol["channels"], data, protocol["meta"], sampling_rate=float(protocol['meta']['sampling_rate']))
 
     return {"data" : out, "events" : events['events'], "events_dtype" : events['dtype']}
 
@@ -336,10 +379,7 @@ def read_neurone_data_hdf5(fpath):
                  directory Protocol.xml and Session.xml
                  files.
     Returns:
-       - a list of dictionaries, where each dictionary
-         represents a feature as a time series ("signal")
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+       - a ChannelSet (see utilities_channels)
     """
 
     # Read the protocol
@@ -348,15 +388,9 @@ def read_neurone_data_hdf5(fpath):
     # Read the signal data
     data = read_neurone_data(fpath, session_phase = 1, protocol = protocol)
 
-    # Create a time vector
-    timevec = np.array(range(data.shape[0])) / float(protocol['meta']['sampling_rate'])
-
-    out = [0] * len(protocol["channels"])
-    for i, label in enumerate(protocol["channels"]):
-        data_out =  {}
-        data_out[label] = data[:,i]
-        data_out["time"] = timevec
-        out[i] = {"meta" : protocol["meta"], "data" : data_out}
+    # The channels share a regular time axis
+    out = chutils.ChannelSet()
+    out.add_samples(protocol["channels"], data, protocol["meta"], sampling_rate=float(protocol['meta']['sampling_rate']))
 
     return out
 
@@ -0,0 +1,242 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for planning an export without
+exporting any data. Only the headers of the data sources are read,
+using the probe functions of the readers, and for each dataset and
+map the following is estimated
+
+- the channels that are exported and the channels that are missing
+- the number of samples and the raw and compressed size of the output
+- the peak memory use and the duration of the export
+
+The estimates are based on the throughput and memory use of the
+readers measured with synthetic data (see READER_COSTS).
+"""
+
+import os
+from . import utilities_io as ioutils
+from . import utilities_h5 as h5utils
+from . import utilities_memory as memutils
+
+## The costs of the readers, measured with synthetic data on one core:
+##   - rate : samples (events for events, bytes for text) read per second
+##   - memory : bytes of memory used per sample while reading
+##   - lazy : True if only the exported channels are read, in blocks
+READER_COSTS = {"edf"                     : {"rate" : 50e6,  "memory" : 0,    "lazy" : True},
+                "edf_faros"               : {"rate" : 50e6,  "memory" : 0,    "lazy" : True},
+                "neurone"                 : {"rate" : 100e6, "memory" : 0,    "lazy" : True},
+                "empatica"                : {"rate" : 4e6,   "memory" : 10,   "lazy" : False},
+                "shimmer"                 : {"rate" : 7e6,   "memory" : 0,    "lazy" : False},
+                "actigraph"               : {"rate" : 7e6,   "memory" : 0,    "lazy" : False},
+                "bodyguard_features"      : {"rate" : 0.6e6, "memory" : 150,  "lazy" : False},
+                "bodyguard_features_misc" : {"rate" : 0.7e6, "memory" : 150,  "lazy" : False},
+                "bodyguard_acc"           : {"rate" : 1.1e6, "memory" : 110,  "lazy" : False},
+                "bodyguard_ibi"           : {"rate" : 1.2e6, "memory" : 140,  "lazy" : False},
+                "mydarwin_ibi"            : {"rate" : 1.1e6, "memory" : 140,  "lazy" : False},
+                "mydarwin_summary"        : {"rate" : 1.0e6, "memory" : 150,  "lazy" : False},
+                "psg_hypnogram"           : {"rate" : 0.17e6, "memory" : 300, "lazy" : False},
+                "psg_arousal"             : {"rate" : 0.17e6, "memory" : 300, "lazy" : False},
+                "psg_events"              : {"rate" : 0.17e6, "memory" : 300, "lazy" : False},
+                "neurone_events"          : {"rate" : 19e3,  "memory" : 1100, "lazy" : False},
+                "text"                    : {"rate" : 500e6, "memory" : 0,    "lazy" : False}}
+
+## The costs used for readers not listed in READER_COSTS
+DEFAULT_COST = {"rate" : 1e6, "memory" : 150, "lazy" : False}
+
+## Bytes of raw output written (and compressed using gzip) per second
+WRITE_THROUGHPUT = 20e6
+
+## Size of the compressed output relative to the raw output
+COMPRESSION_RATIO = 0.55
+
+## Memory used by the interpreter and the libraries (bytes)
+BASE_MEMORY = 60e6
+
+def block_memory():
+    """ Return the memory used for the blocks of one signal while it is
+    written (fewer samples are written at a time within a memory
+    budget, see utilities_memory). """
+    return memutils.get_block_size(h5utils.BLOCK_SIZE, memutils.WRITE_SAMPLE_BYTES) * memutils.WRITE_SAMPLE_BYTES
+
+def source_size(fname):
+    """
+    Return the size of a data source on disk in bytes. The size of a
+    directory (e.g., a NeurOne measurement) is the total size of
+    the files in it.
+    """
+    if os.path.isdir(fname):
+        size = 0
+        for root, dirs, files in os.walk(fname):
+            size += sum(os.path.getsize(os.path.join(root, i)) for i in files)
+        return size
+    return os.path.getsize(ioutils.resolve_input(fname))
+
+def plan_signal_map(dset_map, data):
+    """
+    Plan the export of one map of a signal dataset.
+
+    Arguments:
+       - dset_map : the map from the configuration file
+       - data : the probed data (a ChannelSet without the data)
+
+    Returns:
+       - a dict with the plan of the map
+    """
+    channels = dset_map.get("channels", ["*"])
+    if channels == ["*"]:
+        channels = data.names()
+
+    selected = data.select(channels)
+
+    ## channels in a shared group share one time vector
+    if dset_map.get("shared_group", True):
+        n_time = selected[0].axis.length if selected else 0
+    else:
+        n_time = sum(ch.axis.length for ch in selected)
+
+    ## the decimated signals (see utilities_transform)
+    q = dset_map.get("transform", {}).get("decimate", 1)
+    n_samples = sum(-(-ch.length // q) for ch in selected)
+    n_time = -(-n_time // q)
+
+    raw_bytes = 4 * (n_samples + n_time)
+
+    ## the downsampled levels (see utilities_h5.add_data_h5)
+    for factor in dset_map.get("pyramid", []):
+        raw_bytes += 4 * (len(h5utils.PYRAMID_COLUMNS) * n_samples + n_time) // factor
+
+    return {"path" : dset_map["path"],
+            "channels" : [ch.name for ch in selected],
+            "missing" : [i for i in channels if i not in data],
+            "samples" : n_samples,
+            "raw_bytes" : raw_bytes}
+
+def plan_dataset(dataset, reader):
+    """
+    Plan the export of one dataset in the configuration file.
+
+    Arguments:
+       - dataset : the dataset from the configuration file
+       - reader : the entry of the data type in the list of readers,
+                  i.e., a dict with the keys 'reader_type' and 'probe'
+
+    Returns:
+       - a dict with the plan of the dataset and of each of its maps
+    """
+    cost = READER_COSTS.get(dataset["data_type"], DEFAULT_COST)
+    data = reader['probe'](dataset["filename"])
+
+    out = {"filename" : dataset["filename"],
+           "data_type" : dataset["data_type"],
+           "source_bytes" : source_size(dataset["filename"]),
+           "maps" : []}
+
+    if 'signal' == reader['reader_type']:
+        out["maps"] = [plan_signal_map(i, data) for i in dataset["maps"]]
+        n_total = sum(ch.length for ch in data)
+        if cost["lazy"]:
+            n_read = sum(i["samples"] for i in out["maps"])
+        else:
+            n_read = n_total
+        out["memory"] = n_total * cost["memory"] + block_memory()
+    else:
+        if 'events' == reader['reader_type']:
+            n_read = data["n_events"]
+            raw_bytes = n_read * data["dtype"].itemsize
+        else:
+            n_read = data["n_bytes"]
+            raw_bytes = n_read
+        out["maps"] = [{"path" : i["path"], "channels" : [], "missing" : [],
+                        "samples" : n_read, "raw_bytes" : raw_bytes} for i in dataset["maps"]]
+        out["memory"] = n_read * cost["memory"]
+
+    for i in out["maps"]:
+        i["compressed_bytes"] = i["raw_bytes"] * COMPRESSION_RATIO
+
+    out["samples"] = sum(i["samples"] for i in out["maps"])
+    out["raw_bytes"] = sum(i["raw_bytes"] for i in out["maps"])
+    out["compressed_bytes"] = sum(i["compressed_bytes"] for i in out["maps"])
+    out["duration"] = n_read / cost["rate"] + out["raw_bytes"] / WRITE_THROUGHPUT
+
+    return out
+
+def plan_export(config, readerlist):
+    """
+    Plan the export of the datasets in a configuration.
+
+    Arguments:
+       - config : the configuration (a dict)
+       - readerlist : the map of data types to readers
+
+    Returns:
+       - a dict with the plans of the datasets and the totals. The peak
+         memory is the largest memory use of a single dataset, since the
+         datasets are exported one at a time.
+    """
+    out = {"output" : config["output"]["filename"],
+           "datasets" : [],
+           "errors" : []}
+
+    for dataset in config["datasets"]:
+        if dataset["data_type"] not in readerlist:
+            out["errors"] += ["Unknown data type: " + dataset["data_type"]]
+            continue
+        if readerlist[dataset["data_type"]].get('probe') is None:
+            out["errors"] += ["No probe function for data type: " + dataset["data_type"]]
+            continue
+        try:
+            out["datasets"] += [plan_dataset(dataset, readerlist[dataset["data_type"]])]
+        except Exception as e:
+            out["errors"] += ["Unable to read " + dataset["filename"] + ": " + str(e)]
+
+    for key in ["source_bytes", "samples", "raw_bytes", "compressed_bytes", "duration"]:
+        out[key] = sum(i[key] for i in out["datasets"])
+    out["memory"] = BASE_MEMORY + max([i["memory"] for i in out["datasets"]] + [0])
+
+    return out
+
+def format_bytes(n):
+    """ Format a number of bytes for printing. """
+    for unit in ["B", "kB", "MB", "GB"]:
+        if abs(n) < 1000:
+            return "%.1f %s" % (n, unit)
+        n /= 1000.0
+    return "%.1f TB" % n
+
+def print_plan(plan):
+    """ Print the plan returned by plan_export. """
+    print("Export plan for:\t", plan["output"], "\n")
+
+    for dataset in plan["datasets"]:
+        print("Dataset:\t", dataset["filename"], "(" + dataset["data_type"] + ")")
+        print("\tSource size:\t", format_bytes(dataset["source_bytes"]))
+        for dset_map in dataset["maps"]:
+            print("\tPath:\t", dset_map["path"])
+            if dset_map["channels"]:
+                print("\t\tChannels:\t", len(dset_map["channels"]))
+            print("\t\tSamples:\t", dset_map["samples"])
+            print("\t\tSize:\t\t", format_bytes(dset_map["raw_bytes"]), "(compressed " + format_bytes(dset_map["compressed_bytes"]) + ")")
+            for channel in dset_map["missing"]:
+                print("\t\tWarning! Channel not found in data:\t", channel)
+        print("\tPeak memory:\t", format_bytes(BASE_MEMORY + dataset["memory"]))
+        print("\tDuration:\t %.1f s\n" % dataset["duration"])
+
+    for error in plan["errors"]:
+        print("Warning!", error)
+
+    print("\nTotal (estimates)")
+    print("\tSource size:\t", format_bytes(plan["source_bytes"]))
+    print("\tSamples:\t", plan["samples"])
+    print("\tOutput size:\t", format_bytes(plan["raw_bytes"]), "(compressed " + format_bytes(plan["compressed_bytes"]) + ")")
+    print("\tPeak memory:\t", format_bytes(plan["memory"]))
+    print("\tDuration:\t %.1f s\n" % plan["duration"])
@@ -0,0 +1,266 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for profiling an export. The stages of
+the export (reading a dataset, writing a map, writing one HDF5 dataset,
+writing metadata) are wrapped in stage(), which records
+
+- the wall time and the CPU time
+- the bytes read and written, the raw (uncompressed) size of the
+  written data and the compression ratio
+- the peak resident set size (RSS) of the process during the stage,
+  sampled every RSS_INTERVAL seconds by a background thread (only on
+  platforms where the current RSS can be read, e.g., Linux)
+
+The stages are nested, and the bytes of a stage are added to the stage
+containing it, so that the record of a dataset contains the totals of
+its maps. Profiling is disabled unless start() has been called, and the
+stages then cost only a function call.
+"""
+
+import sys
+import mmap
+import time
+import json
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+## The records of the active profile, None when profiling is disabled
+RECORDS = None
+
+## The records of the stages that have not finished
+STACK = []
+
+## The counters added to the stage containing a stage. The time used
+## for reading and converting the signal blocks (convert_time) and for
+## compressing and writing them (write_time) is counted separately.
+COUNTERS = ["bytes_in", "bytes_out", "raw_bytes", "convert_time", "write_time"]
+
+## The fields inherited from the stage containing a stage
+INHERITED = ["dataset", "data_type", "path"]
+
+## Interval in seconds between the samples of the RSS
+RSS_INTERVAL = 0.01
+
+## The thread sampling the RSS while profiling
+SAMPLER = None
+
+def peak_rss():
+    """ Return the peak resident set size of the process in bytes,
+    or None if it is not available. """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ## the size is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return rss
+    return rss * 1024
+
+def current_rss():
+    """ Return the current resident set size of the process in bytes,
+    or None if it is not available (it is read from /proc on Linux). """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def update_rss(rss=None):
+    """ Update the peak RSS of the stages that have not finished with
+    the current RSS (or the given value). """
+    if rss is None:
+        rss = current_rss()
+    if rss is None:
+        return
+    for rec in list(STACK):
+        if rec.get("peak_rss") is None or rss > rec["peak_rss"]:
+            rec["peak_rss"] = rss
+
+class RssSampler(threading.Thread):
+    """ A thread sampling the RSS every RSS_INTERVAL seconds and
+    updating the peak RSS of the running stages (see update_rss). """
+
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(RSS_INTERVAL):
+            update_rss()
+
+    def stop(self):
+        """ Stop the thread and wait for it. """
+        self.done.set()
+        self.join()
+
+def start():
+    """ Start profiling, discarding any earlier records. """
+    global RECORDS, SAMPLER
+    RECORDS = []
+    del STACK[:]
+    if SAMPLER is None and current_rss() is not None:
+        SAMPLER = RssSampler()
+        SAMPLER.start()
+
+def stop():
+    """ Stop profiling and return the records. """
+    global RECORDS, SAMPLER
+    if SAMPLER is not None:
+        SAMPLER.stop()
+        SAMPLER = None
+    records = RECORDS
+    RECORDS = None
+    del STACK[:]
+    return records
+
+def enabled():
+    """ Return True if profiling has been started. """
+    return RECORDS is not None
+
+@contextlib.contextmanager
+def stage(name, **info):
+    """
+    Context manager recording one stage of the export.
+
+    Arguments:
+       - name : the name of the stage (e.g., "read" or "write")
+       - info : additional fields of the record (e.g., path=...).
+                The fields of the enclosing stages are inherited.
+
+    Yields:
+       - the record (a dict) of the stage, to which the counters
+         (see COUNTERS) can be added, or None if profiling is disabled.
+    """
+    if RECORDS is None:
+        yield None
+        return
+
+    rec = {}
+    if STACK:
+        rec.update({k : v for k, v in STACK[-1].items() if k in INHERITED})
+    rec.update(info)
+    rec["stage"] = name
+    rec["level"] = len(STACK)
+    rec["peak_rss"] = current_rss()
+    for key in COUNTERS:
+        rec[key] = 0
+
+    RECORDS.append(rec)
+    STACK.append(rec)
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield rec
+    finally:
+        rec["wall_time"] = time.perf_counter() - wall
+        rec["cpu_time"] = time.process_time() - cpu
+        update_rss()
+        if rec["raw_bytes"] > 0 and rec["bytes_out"] > 0:
+            rec["compression_ratio"] = rec["raw_bytes"] / float(rec["bytes_out"])
+
+        STACK.pop()
+        if STACK:
+            for key in COUNTERS:
+                STACK[-1][key] += rec[key]
+
+def add(rec, **counters):
+    """ Add the given counters (e.g., bytes_out=...) to the record rec
+    of a stage. Does nothing if rec is None. """
+    if rec is None:
+        return
+    for key, value in counters.items():
+        rec[key] = rec.get(key, 0) + value
+
+def add_dataset(rec, dset):
+    """ Add the raw size and the size on disk of the HDF5 dataset dset
+    to the record rec of a stage. Does nothing if rec is None. """
+    if rec is None:
+        return
+    add(rec, raw_bytes=int(dset.size * dset.dtype.itemsize), bytes_out=int(dset.id.get_storage_size()))
+
+def report(records, output=None):
+    """
+    Create the report of a profile.
+
+    Arguments:
+       - records : the records returned by stop()
+       - output : the name of the output file
+
+    Returns:
+       - a dict with the totals and the records of all stages
+
+    {"output" : <the output file>,
+     "total" : <the totals of the top level stages>,
+     "stages" : <the records>}
+    """
+    top = [i for i in records if i["level"] == 0]
+
+    total = {}
+    for key in COUNTERS + ["wall_time", "cpu_time"]:
+        total[key] = sum(i[key] for i in top)
+    if total["bytes_out"] > 0:
+        total["compression_ratio"] = total["raw_bytes"] / float(total["bytes_out"])
+    total["peak_rss"] = peak_rss()
+
+    return {"output" : output, "total" : total, "stages" : records}
+
+def merge_reports(reports, output=None, wall_time=None):
+    """
+    Merge the reports of exports run in separate processes (e.g., of
+    the shards of an output file) into one report.
+
+    Arguments:
+       - reports : the reports
+       - output : the name of the output file
+       - wall_time : the elapsed time of the whole export, which is
+                     less than the total of the reports if the exports
+                     ran in parallel
+
+    Returns:
+       - the report, whose peak RSS is the largest of the reports
+    """
+    rep = report([rec for i in reports for rec in i["stages"]], output)
+    rep["total"]["peak_rss"] = max([i["total"]["peak_rss"] or 0 for i in reports] + [rep["total"]["peak_rss"] or 0])
+    if wall_time is not None:
+        rep["total"]["wall_time"] = wall_time
+    for key in ["max_memory", "memory_usage"]:
+        if any(key in i["total"] for i in reports):
+            rep["total"][key] = max(i["total"].get(key) or 0 for i in reports)
+    return rep
+
+def write_report(rep, fname):
+    """ Write the report rep in JSON format to the file fname. """
+    with open(fname, "w") as file:
+        json.dump(rep, file, indent=1, default=str)
+
+def add_report_h5(fid, rep):
+    """
+    Add the report rep as attributes to the HDF5 file with handle fid.
+    The totals are added to the root group (with the prefix profile_),
+    and the record of each map to the object at the path of the map.
+    """
+    for key, value in rep["total"].items():
+        if value is not None:
+            fid.attrs["profile_" + key] = value
+
+    for rec in rep["stages"]:
+        if rec["stage"] == "map" and rec["path"] in fid:
+            obj = fid[rec["path"]]
+            for key in COUNTERS + ["wall_time", "cpu_time", "compression_ratio", "peak_rss"]:
+                if rec.get(key) is not None:
+                    obj.attrs["profile_" + key] = rec[key]
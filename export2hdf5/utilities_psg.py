@@ -13,11 +13,20 @@
 This module contains helper functions for extracting a hypnogram from an XML file.
 """
 
+import os
+import functools
 import xml.etree.ElementTree
-from datetime import datetime
+import h5py
 import numpy as np
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
 
-def read_hypnogram(fname, events_accepted=["SLEEP-MT", "SLEEP-REM", "SLEEP-S0", "SLEEP-S1", "SLEEP-S2", "SLEEP-S3"]):
+## The event families that can be exported and the event types
+## belonging to each family
+PSG_EVENT_FAMILIES = {"hypnogram" : ["SLEEP-MT", "SLEEP-REM", "SLEEP-S0", "SLEEP-S1", "SLEEP-S2", "SLEEP-S3"],
+                      "arousal" : ["AROUSAL"]}
+
+def read_hypnogram(fname, events_accepted=PSG_EVENT_FAMILIES["hypnogram"]):
     """Extract a hypnogram from the  XML-file with filename fname.
 
     Arguments:
@@ -25,16 +34,13 @@ def read_hypnogram(fname, events_accepted=["SLEEP-MT", "SLEEP-REM", "SLEEP-S0",
        - events_accepted : array of strings with the hypnogram events that are to be exported
 
     Returns:
-        - The hypnogramas a dataset:
-
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+        - The hypnogram as a ChannelSet (see utilities_channels)
     """
 
     res = read_psg_event(fname, events_accepted, check_consecutive=True)
     return hypnogram_to_dataset(res)
 
-def read_arousal(fname, events_accepted=["AROUSAL"]):
+def read_arousal(fname, events_accepted=PSG_EVENT_FAMILIES["arousal"]):
     """Extract polysomnography (PSG) events from the  XML-file with filename fname.
 
     Arguments:
@@ -42,14 +48,111 @@ def read_arousal(fname, events_accepted=["AROUSAL"]):
        - events_accepted : array of strings with the events that are to be exported
 
     Returns:
-        - The events a dataset:
+        - A dict containing the events and the data type for the events
+          (see psg_events_to_array).
+    """
+
+    return read_psg_events_hdf5(fname, events_accepted)
 
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+def parse_psg_xml(fname, events_accepted=None):
+    """Parse the events in the XML-file with filename fname in one
+       streaming pass. The elements are discarded as soon as they
+       have been read, so the whole document is never held in memory.
+
+    Arguments:
+       - fname : the filename of the XML-file
+       - events_accepted : the event types to collect, or None
+                           to collect all events
+
+    Returns:
+       - a tuple (event_type, t_start, t_stop) of numpy arrays with
+         the type (string), start and stop times (datetime64) of the
+         accepted events.
     """
+    if events_accepted is not None:
+        accepted = set(events_accepted)
 
-    res = read_psg_event(fname, events_accepted, check_consecutive=False)
-    return psg_event_to_dataset(res)
+    vec_t_type = []
+    vec_t_start = []
+    vec_t_stop = []
+
+    depth = 0
+    events = None
+
+    with ioutils.open_input(fname, "rb") as file:
+        for action, elem in xml.etree.ElementTree.iterparse(file, events=("start", "end")):
+            if action == "start":
+                depth += 1
+                ## the events are in the first Events element below the root
+                if (depth == 2) and (elem.tag == "Events") and (events is None):
+                    events = elem
+                continue
+
+            depth -= 1
+            if (depth == 2) and (elem.tag == "Event") and (events is not None):
+                ev_type = elem.findtext("Type")
+                if (events_accepted is None) or (ev_type in accepted):
+                    vec_t_type += [ev_type]
+                    vec_t_start += [elem.findtext("StartTime")]
+                    vec_t_stop += [elem.findtext("StopTime")]
+                events.clear()
+            elif depth == 1 and elem is events:
+                ## stop at the end of the Events element
+                break
+
+    ## convert the times in bulk
+    return (np.array(vec_t_type, dtype=str),
+            np.array(vec_t_start, dtype="datetime64[us]"),
+            np.array(vec_t_stop, dtype="datetime64[us]"))
+
+@functools.lru_cache(maxsize=4)
+def parse_psg_xml_cached(fname, mtime):
+    """ Cached version of parse_psg_xml, collecting all events. The
+    modification time of the file is part of the key so that changed
+    files are parsed again. """
+    return parse_psg_xml(fname)
+
+def read_psg_events(fname, families=PSG_EVENT_FAMILIES):
+    """Read and extract several families of events (e.g., the hypnogram and
+       the arousals) from the XML-file with filename fname in one pass.
+
+    Arguments:
+       - fname : the filename of the XML-file
+       - families : a dict where the keys are the names of the event
+                    families and the values arrays of strings with the
+                    event types belonging to each family. If the value
+                    is None, all events in the file belong to the family.
+
+    Returns:
+       - a dict with the same keys as families, where each value is
+         a dict with the events of the family:
+
+    {"t_start" : <datetime64 array>,
+     "t_stop" : <datetime64 array>,
+     "duration" : <array with the durations in seconds>,
+     "event_type" : <array with the event types>,
+     "n_events" : <the number of events>}
+
+    All events in the XML file are collected in one pass and the
+    families are selected from them, so reading other families from
+    the same file again (e.g., for another dataset in the configuration)
+    uses the cached result.
+    """
+    fname_in = ioutils.resolve_input(fname)
+    ev_type, t_start, t_stop = parse_psg_xml_cached(fname_in, os.path.getmtime(fname_in))
+
+    out = {}
+    for name, family in families.items():
+        if family is None:
+            ind = np.ones(len(ev_type), dtype=bool)
+        else:
+            ind = np.isin(ev_type, family)
+        out[name] = {"t_start" : t_start[ind],
+                     "t_stop" : t_stop[ind],
+                     "duration" : (t_stop[ind] - t_start[ind]) / np.timedelta64(1, "s"),
+                     "event_type" : ev_type[ind],
+                     "n_events" : int(np.count_nonzero(ind))}
+    return out
 
 def read_psg_event(fname, events_accepted, check_consecutive=False):
     """Read and extract events listed in the array events_accepted from
@@ -60,88 +163,45 @@ def read_psg_event(fname, events_accepted, check_consecutive=False):
        - events_accepted : array of strings with the hypnogram events that are to be exported
 
     Returns:
-        - The events as a dataset:
-
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+        - The events as a dict (see read_psg_events).
 
-    The events are exported from the time interval defined by the
-    first occurrence of the LIGHTS_OFF event to the last occurrence of
-    the event LIGHTS_ON.
+    If check_consecutive is True, a message is printed if the
+    accepted events are not spaced 30 s apart.
 
     """
 
-    timeformat = "%Y-%m-%dT%H:%M:%S.%f"
-
-    docroot = xml.etree.ElementTree.parse(fname).getroot()
-    events = docroot.findall("Events")[0].findall("Event")
-
-    vec_t_start = []
-    vec_t_stop = []
-    vec_t_duration = []
-    vec_t_type = []
+    res = read_psg_events(fname, {"events" : events_accepted})["events"]
 
-    previous_event_start = None
-
-    for e in events:
-        ## parse event information
-        ev_type = e.findall("Type")[0].text
-        ev_start = e.findall("StartTime")[0].text
-        ev_stop = e.findall("StopTime")[0].text
-
-        ## event duration in milliseconds
-        t_start = datetime.strptime(ev_start, timeformat)
-        t_stop = datetime.strptime(ev_stop, timeformat)
-        ev_duration = (t_stop - t_start).total_seconds() 
-
-        ## create output string
-        out = "{0:s}" + "\t" + "{1:s}" + "\t" + "{2:s}" + "\t" + "{3:f}"
-        out = out.format(ev_type, ev_start, ev_stop, ev_duration)
-
-        ## store and/or print event
-        if ev_type in events_accepted:
-            if check_consecutive:
-                if previous_event_start is not None:
-                    delta = (t_start - previous_event_start).total_seconds()
-                    if delta != 30:
-                        print("Error!\n\nConsecutive accepted events not spaced 30s apart.")
-                previous_event_start = t_start
-
-            vec_t_start += [t_start]
-            vec_t_stop += [t_stop]
-            vec_t_duration += [ev_duration]
-            vec_t_type += [ev_type]
-    res = {"t_start" : vec_t_start,
-           "t_stop" : vec_t_stop,
-           "duration" : vec_t_duration,
-           "event_type" : vec_t_type,
-           "n_events" : len(vec_t_start)}
+    if check_consecutive:
+        check_spacing(res["t_start"], 30)
 
     return res
 
+def check_spacing(t_start, spacing):
+    """ Check that the times in the datetime64 array t_start are spaced
+    spacing seconds apart. Returns True if they are. """
+    delta = np.diff(t_start) / np.timedelta64(1, "s")
+    if np.any(delta != spacing):
+        print("Error!\n\nConsecutive accepted events not spaced " + str(spacing) + "s apart.")
+        return False
+    return True
+
 def firstindex(x, val):
     """ Find the first index of val in the vector x. """
-    try:
-        return x.index(val)
-    except ValueError:
+    ind = np.flatnonzero(np.asarray(x) == val)
+    if len(ind) == 0:
         return 1
+    return ind[0]
 
 def lastindex(x, val):
     """ Find the last index of val in the vector x. """
-    try:
-        return len(x) - x[::-1].index(val) - 1
-    except ValueError:
+    ind = np.flatnonzero(np.asarray(x) == val)
+    if len(ind) == 0:
         return len(x)
+    return ind[-1]
 
 def hypnogram_to_dataset(res):
-    """Create a dataset from the hypnogram.
-
-    A dataset is a list of dictionaries, each dictionary having the
-    format:
-
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
-    """
+    """Create a dataset (a ChannelSet) from the hypnogram."""
 
     ## Find index of first "LIGHTS-ON" and last "LIGHTS-OFF"
     # i_start = firstindex(res["event_type"], "LIGHTS-OFF") + 1
@@ -161,33 +221,140 @@ def hypnogram_to_dataset(res):
                "LIGHTS-OFF" :  0,
                "LIGHTS-ON"  :  0}
 
-    meta["time_start"] = res["t_start"][i_start:i_stop][0]
+    meta["time_start"] = res["t_start"][i_start:i_stop][0].item()
     meta["sampling_rate"] = 1.0 / 30.0
 
-    data["hypnogram"] = np.array([hyp_val[i] for i in res["event_type"][i_start:i_stop]])
+    ## map the event types to hypnogram values
+    ev_types, ind = np.unique(res["event_type"][i_start:i_stop], return_inverse=True)
+    data["hypnogram"] = np.array([hyp_val[i] for i in ev_types], dtype=int)[ind]
     data["time"] = np.arange(0, 30*len(data["hypnogram"]), step=30)
 
-    return [{"meta" : meta, "data" : data}]
+    out = chutils.ChannelSet()
+    out.add_channel("hypnogram", data["hypnogram"], meta, time=data["time"])
+
+    return out
 
 
-def psg_event_to_dataset(res):
-    """Create a dataset from PSG events
+def psg_events_to_array(res, time_start=None, sampling_rate=1.0 / 30.0):
+    """Create a numpy structured array from PSG events.
 
-    A dataset is a list of dictionaries, each dictionary having the
-    format:
+    Arguments:
+       - res : the events (see read_psg_events)
+       - time_start : the time (datetime64) the onsets are relative to.
+                      The default is the start of the first event.
+       - sampling_rate : the sampling rate used for the sample indices
+                         of the events. The default is one sample per
+                         30 s scoring epoch, as in the hypnogram.
+
+    Returns:
+       - A dict containing the events, the data type for the events
+         and the metadata of the events.
 
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+    {"events" : <numpy structured array with the events>,
+     "dtype" : <the numpy dtype for the events>,
+     "meta" : <dict with metadata>}
+
+    The event types are stored as integer codes in an HDF5 enum type,
+    which carries the mapping from the codes to the event names.
     """
+    if time_start is None:
+        time_start = np.min(res["t_start"]) if res["n_events"] > 0 else np.datetime64(0, "us")
+
+    ## code the event types in alphabetical order
+    ev_types, codes = np.unique(res["event_type"], return_inverse=True)
+    mapping = {str(name) : code for code, name in enumerate(ev_types)}
+
+    events_dtype = np.dtype([("event"        , h5py.enum_dtype(mapping, basetype=np.int16)),
+                             ("onset"        , np.float64),
+                             ("duration"     , np.float64),
+                             ("sample_index" , np.int64)])
+
+    events = np.zeros(res["n_events"], dtype=events_dtype)
+    events["event"] = codes
+    events["onset"] = (res["t_start"] - time_start) / np.timedelta64(1, "s")
+    events["duration"] = res["duration"]
+    events["sample_index"] = np.floor(events["onset"] * sampling_rate)
 
     meta = {}
-    data = {}
+    meta["time_start"] = time_start.item()
+    meta["sampling_rate"] = sampling_rate
+
+    return {"events" : events, "dtype" : events_dtype, "meta" : meta}
+
+def read_psg_events_hdf5(fname, events_accepted=None):
+    """Read polysomnography (PSG) events in a format compatible with the
+       HDF5-exporting function export_hdf5.
+
+    Arguments:
+       - fname : the filename of the XML-file
+       - events_accepted : array of strings with the events that are to be
+                           exported. The default is all events in the file.
+
+    Returns:
+       - A dict containing the events and the data type for the events
+         (see psg_events_to_array).
+    """
+    res = read_psg_events(fname, {"events" : events_accepted})["events"]
+    return psg_events_to_array(res)
+
+def read_arousal_hdf5(fname):
+    """Read the arousal events in a format compatible with the
+       HDF5-exporting function export_hdf5 (see read_arousal).
+    """
+    return read_arousal(fname)
+
+def count_psg_events(fname):
+    """Count the Event elements in the XML-file with filename fname by
+       scanning the bytes of the file, without parsing the XML.
 
-    meta["time_start"] = res["t_start"][0]
-    meta["sampling_rate"] = 0
+    Returns:
+       - the number of events of all types in the file
+    """
+    tag = b"<Event>"
+    n_events = 0
+    tail = b""
+
+    with ioutils.open_input(fname, "rb") as file:
+        for block in iter(lambda: file.read(ioutils.BLOCK_SIZE), b""):
+            ## keep the end of the previous block so that tags split
+            ## between two blocks are found
+            block = tail + block
+            n_events += block.count(tag)
+            tail = block[-(len(tag) - 1):]
+
+    return n_events
 
-    data["event"] = np.array(i for i in res["event_type"])
-    data["time"] = np.array([(i - res["t_start"][0]).total_seconds() for i in res["t_start"]])
-    data["duration"] = np.array(res["duration"])
+def probe_hypnogram(fname):
+    """Get the channels of the hypnogram in the XML-file with filename
+       fname without parsing the file. The number of samples is at most
+       the number of events in the file (see count_psg_events).
 
-    return [{"meta" : meta, "data" : data}]
+    Returns:
+        - a ChannelSet (see utilities_channels) with the channels
+          but without the data
+    """
+    meta = {}
+    meta["time_start"] = ""
+    meta["sampling_rate"] = 1.0 / 30.0
+
+    n_events = count_psg_events(fname)
+
+    out = chutils.ChannelSet()
+    out.add_lazy_channel("hypnogram", None, n_events, int, meta, out.add_axis(length=n_events))
+    return out
+
+def probe_psg_events(fname):
+    """Get the number of events in the XML-file with filename fname
+       without parsing the file (see count_psg_events).
+
+    Returns:
+       - A dict with the number of events and the data type for the events.
+
+    {"n_events" : <the number of events>,
+     "dtype" : <the numpy dtype for the events>}
+    """
+    res = {"t_start" : np.zeros(0, dtype="datetime64[us]"),
+           "duration" : np.zeros(0),
+           "event_type" : np.zeros(0, dtype=str),
+           "n_events" : 0}
+    return {"n_events" : count_psg_events(fname), "dtype" : psg_events_to_array(res)["dtype"]}
@@ -0,0 +1,398 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for reading time windows of the
+signals in HDF5 files created by export2hdf5 (see
+utilities_h5.add_data_h5). Both layouts are supported:
+
+- shared group:  <path>/<channel> and <path>/time
+- per channel:   <path>/<channel>/data and <path>/<channel>/time
+
+A time window [t0, t1) (in seconds, on the time axis of the channel)
+is resolved to sample indices without reading the time vector: for
+regularly sampled channels the indices are computed from the sampling
+rate, and for irregularly sampled channels the time vector is searched
+using binary search, first in the coarse index of the time vector
+(index/time) and then in one chunk of the time vector. Only the chunks of the datasets overlapping the
+window are read and decompressed, and the decompressed chunks are kept
+in a cache (least recently used chunks are discarded first), so that
+repeated reads of nearby windows are fast.
+
+The text (see utilities_h5.add_text_h5) can be read as byte ranges or
+as lines, reading only the chunks containing them.
+
+A file written in a live export (see utilities_live) can be read
+while it is written by opening it with swmr=True. Calling refresh()
+then makes the samples written since the previous call visible.
+
+Example:
+
+    with ExportReader("out.h5") as reader:
+        time, data = reader.read("EEG/NeurOne", ["Fz", "Cz"], 10, 20)
+"""
+
+import bisect
+import collections
+import numpy as np
+import h5py
+
+## The default size of the chunk cache in bytes
+CACHE_SIZE = 64 * (1 << 20)
+
+## The relative precision of the time vectors, which are stored in
+## single precision
+FLOAT32_TOLERANCE = 2.0 ** -20
+
+## Number of bytes of text read at a time when reading lines
+TEXT_BLOCK_SIZE = 1 << 16
+
+## Time points closer than this (in sampling intervals) to the edges of
+## a window are included in the window
+TIME_TOLERANCE = 1e-6
+
+class ChunkCache(object):
+    """
+    A cache of decompressed chunks of one-dimensional HDF5 datasets
+    in one file. When the cache is full, the least recently used
+    chunks are discarded.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.used = 0
+        self.chunks = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_chunk(self, dset, index):
+        """ Return the chunk with the given index of the dataset dset. """
+        key = (dset.name, index)
+        if key in self.chunks:
+            self.hits += 1
+            self.chunks.move_to_end(key)
+            return self.chunks[key]
+
+        self.misses += 1
+        n = dset.chunks[0]
+        chunk = dset[index * n:(index + 1) * n]
+
+        if chunk.nbytes <= self.size:
+            self.chunks[key] = chunk
+            self.used += chunk.nbytes
+            while self.used > self.size:
+                key_old, chunk_old = self.chunks.popitem(last=False)
+                self.used -= chunk_old.nbytes
+        return chunk
+
+    def read(self, dset, start, stop):
+        """ Return the samples of the dataset dset from index start to stop. """
+        if dset.chunks is None or stop - start <= 0:
+            return dset[start:stop]
+
+        n = dset.chunks[0]
+        out = []
+        for index in range(start // n, (stop - 1) // n + 1):
+            chunk = self.get_chunk(dset, index)
+            out += [chunk[max(start - index * n, 0):stop - index * n]]
+        return np.concatenate(out)
+
+    def clear(self):
+        """ Discard all chunks. """
+        self.chunks.clear()
+        self.used = 0
+
+
+class CachedArray(object):
+    """ A one-dimensional dataset (or a field of a compound dataset)
+    indexed through a ChunkCache, e.g., for searching a time vector
+    with bisect. """
+
+    def __init__(self, dset, cache, field=None):
+        self.dset = dset
+        self.cache = cache
+        self.field = field
+
+    def __len__(self):
+        return len(self.dset)
+
+    def __getitem__(self, index):
+        value = self.cache.read(self.dset, index, index + 1)[0]
+        if self.field is not None:
+            return value[self.field]
+        return value
+
+
+class ExportReader(object):
+    """
+    Reader of time windows of the signals in an HDF5 file created by
+    export2hdf5.
+
+    Arguments:
+       - fname : the name of the HDF5 file
+       - cache_size : the size of the chunk cache in bytes
+       - swmr : if True, the file is opened in SWMR mode, e.g., to
+                follow a live export
+    """
+
+    def __init__(self, fname, cache_size=CACHE_SIZE, swmr=False):
+        self.fid = h5py.File(fname, "r", swmr=swmr)
+        self.cache = ChunkCache(cache_size)
+        self.info = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Close the file. """
+        self.cache.clear()
+        self.fid.close()
+
+    def refresh(self):
+        """ Refresh the channels read so far and discard the cached
+        chunks, so that the samples written to a file in SWMR mode
+        since the previous refresh are seen. """
+        for info in self.info.values():
+            info["data"].refresh()
+            info["time"].refresh()
+        self.info.clear()
+        self.cache.clear()
+
+    def list_channels(self, path):
+        """ Return the names of the channels in the given path. """
+        grp = self.fid[path]
+        if is_shared_group(grp):
+            return [name for name, obj in grp.items() if isinstance(obj, h5py.Dataset) and name != "time"]
+        return [name for name, obj in grp.items() if isinstance(obj, h5py.Group) and "data" in obj]
+
+    def get_channel(self, path, name):
+        """
+        Return a dict describing the channel with the given name in
+        the path:
+
+            {"data" : <the dataset of the samples>,
+             "time" : <the dataset of the time vector>,
+             "sampling_rate" : <the sampling rate, 0 if irregular>,
+             "index" : <the coarse time index (see search_index)>}
+
+        The channel is regular, i.e., the sampling rate is not 0, if
+        its time vector matches the sampling rate.
+        """
+        key = (path, name)
+        if key not in self.info:
+            grp = self.fid[path]
+            if is_shared_group(grp):
+                data, time = grp[name], grp["time"]
+            else:
+                data, time = grp[name]["data"], grp[name]["time"]
+
+            sampling_rate = float(data.attrs.get("sampling_rate", 0) or 0)
+            if not is_regular(time, sampling_rate, self.cache):
+                sampling_rate = 0
+
+            self.info[key] = {"data" : data, "time" : time, "sampling_rate" : sampling_rate}
+
+            ## the coarse index of an irregular time vector
+            if sampling_rate == 0 and isinstance(time.parent.get("index/time"), h5py.Dataset):
+                index = time.parent["index/time"]
+                self.info[key]["index"] = (index[:], int(index.attrs["factor"]))
+        return self.info[key]
+
+    def get_window(self, path, name, t0=None, t1=None):
+        """
+        Return the indices (start, stop) of the samples of a channel
+        whose time points t satisfy t0 <= t < t1. A missing t0 (t1)
+        means the start (end) of the channel.
+        """
+        info = self.get_channel(path, name)
+        n = len(info["data"])
+
+        if info["sampling_rate"] > 0:
+            fs = info["sampling_rate"]
+            start = 0 if t0 is None else int(np.ceil(t0 * fs - TIME_TOLERANCE))
+            stop = n if t1 is None else int(np.ceil(t1 * fs - TIME_TOLERANCE))
+        else:
+            time = CachedArray(info["time"], self.cache)
+            start = 0 if t0 is None else search_index(time, t0, info.get("index"))
+            stop = n if t1 is None else search_index(time, t1, info.get("index"))
+
+        start = min(max(start, 0), n)
+        stop = min(max(stop, start), n)
+        return start, stop
+
+    def read_time(self, path, name, start, stop):
+        """ Return the time points of a channel from index start to stop. """
+        info = self.get_channel(path, name)
+        if info["sampling_rate"] > 0:
+            return np.arange(start, stop) / info["sampling_rate"]
+        return self.cache.read(info["time"], start, stop)
+
+    def read(self, path, channels, t0=None, t1=None):
+        """
+        Read the samples of one or several channels in a time window.
+
+        Arguments:
+           - path : the path of the channels in the HDF5 file
+           - channels : the name of a channel, or a list of names
+           - t0, t1 : the time window [t0, t1) in seconds
+
+        Returns:
+           - a tuple (time, data). For one channel the data is a
+             one-dimensional array, and for a list of channels a
+             two-dimensional array with one column per channel. The
+             channels in a list must have the same time points in the
+             window, e.g., the channels of a shared group.
+        """
+        if isinstance(channels, str):
+            start, stop = self.get_window(path, channels, t0, t1)
+            info = self.get_channel(path, channels)
+            return self.read_time(path, channels, start, stop), self.cache.read(info["data"], start, stop)
+
+        windows = [self.get_window(path, name, t0, t1) for name in channels]
+        if len(set(stop - start for start, stop in windows)) > 1:
+            raise ValueError("The channels do not share the time points of the window.")
+
+        start, stop = windows[0] if windows else (0, 0)
+        data = np.empty((stop - start, len(channels)), dtype=np.float32)
+        for i, (name, (start_i, stop_i)) in enumerate(zip(channels, windows)):
+            data[:, i] = self.cache.read(self.get_channel(path, name)["data"], start_i, stop_i)
+
+        time = self.read_time(path, channels[0], start, stop) if channels else np.zeros(0)
+        return time, data
+
+
+    def read_events(self, path, t0=None, t1=None):
+        """
+        Read the events (a compound dataset with the field onset in
+        seconds) whose onsets t satisfy t0 <= t < t1.
+
+        Returns:
+           - the events as a structured array
+        """
+        dset = self.fid[path]
+        if "time_index" not in dset.attrs:
+            events = dset[:]
+            mask = np.ones(len(events), dtype=bool)
+            if t0 is not None:
+                mask &= events["onset"] >= t0
+            if t1 is not None:
+                mask &= events["onset"] < t1
+            return events[mask]
+
+        index = (dset.attrs["time_index"], int(dset.attrs["time_index_factor"]))
+        onset = CachedArray(dset, self.cache, "onset")
+        start = 0 if t0 is None else search_index(onset, t0, index)
+        stop = len(dset) if t1 is None else search_index(onset, t1, index)
+        return self.cache.read(dset, start, max(start, stop))
+
+    def read_bytes(self, path, start=0, stop=None):
+        """ Read the bytes from offset start to stop of the encoded text
+        at the given path (see utilities_h5.add_text_h5). """
+        dset = self.fid[path]
+        if h5py.check_string_dtype(dset.dtype) is not None:
+            ## text written as a variable-length string by earlier versions
+            return dset[0][start:stop]
+        stop = len(dset) if stop is None else min(stop, len(dset))
+        return self.cache.read(dset, start, max(start, stop)).tobytes()
+
+    def read_text(self, path, start=0, stop=None):
+        """ Read the text at the given path, or the bytes from offset
+        start to stop of it, as a string. Characters split at start or
+        stop are replaced with U+FFFD. """
+        encoding = self.fid[path].attrs.get("encoding", "utf-8")
+        return self.read_bytes(path, start, stop).decode(encoding, errors="replace")
+
+    def read_lines(self, path, first=0, last=None):
+        """
+        Read the lines from first to last (numbered from 0, last not
+        included) of the text at the given path. The lines are separated
+        by newlines, and are returned without the line breaks. The
+        reading starts from the nearest entry of the line index (the
+        attribute line_index), so only the chunks of text containing
+        the lines (and the lines before them since the index entry) are
+        read.
+
+        Returns:
+           - the lines as a list of strings
+        """
+        dset = self.fid[path]
+        encoding = dset.attrs.get("encoding", "utf-8")
+        n = len(self.read_bytes(path)) if h5py.check_string_dtype(dset.dtype) is not None else len(dset)
+
+        line, pos = 0, 0
+        if "line_index" in dset.attrs:
+            index = dset.attrs["line_index"]
+            k = min(first // int(dset.attrs["line_index_factor"]), len(index) - 1)
+            line, pos = k * int(dset.attrs["line_index_factor"]), int(index[k])
+
+        out = []
+        rest = b""
+        while pos < n and (last is None or line < last):
+            stop = min(pos + TEXT_BLOCK_SIZE, n)
+            parts = (rest + self.read_bytes(path, pos, stop)).split(b"\n")
+            rest = parts.pop()
+            for i in parts:
+                if line >= first and (last is None or line < last):
+                    out += [i]
+                line += 1
+            pos = stop
+        if rest and line >= first and (last is None or line < last):
+            out += [rest]
+
+        return [(i[:-1] if i.endswith(b"\r") else i).decode(encoding, errors="replace") for i in out]
+
+
+def is_shared_group(grp):
+    """ Return True if the channels in the group grp share the time
+    vector grp/time. """
+    return "time" in grp and isinstance(grp["time"], h5py.Dataset)
+
+def is_regular(time, sampling_rate, cache):
+    """ Return True if the time vector (a dataset) is the regular time
+    axis of the given sampling rate. Only the first and the last time
+    points are read. """
+    n = len(time)
+    if sampling_rate <= 0:
+        return False
+    if n == 0:
+        return True
+    ## the time vectors are stored in single precision
+    tol = 0.5 / sampling_rate + FLOAT32_TOLERANCE * (n - 1) / sampling_rate
+    return abs(cache.read(time, 0, 1)[0]) < tol and \
+        abs(cache.read(time, n - 1, n)[0] - (n - 1) / sampling_rate) < tol
+
+def search_index(values, t, index=None):
+    """
+    Return the position of the first of the sorted values that is at
+    least t (as bisect.bisect_left). If a coarse index (a tuple of the
+    first value of every factor values and factor) is given, only the
+    values between two entries of the index are searched.
+    """
+    if index is None:
+        return bisect.bisect_left(values, t)
+
+    index, factor = index
+    k = bisect.bisect_left(index, t)
+    lo = max(k - 1, 0) * factor
+    hi = min(k * factor, len(values))
+    return bisect.bisect_left(values, t, lo, max(lo, hi))
+
+def read_window(fname, path, channels, t0=None, t1=None):
+    """
+    Read the samples of one or several channels in the time window
+    [t0, t1) from an HDF5 file created by export2hdf5. See
+    ExportReader.read.
+    """
+    with ExportReader(fname) as reader:
+        return reader.read(path, channels, t0, t1)
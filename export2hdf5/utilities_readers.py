@@ -0,0 +1,130 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains the registry of the data readers. The readers are
+declared by name in READERS, and the module of a reader (and the
+libraries it needs, e.g., pyedflib) is imported only when a
+configuration uses the data type.
+
+Other packages can add readers using the entry point group
+"export2hdf5.readers". The name of the entry point is the data type,
+and the entry point must refer to a dict with the keys
+
+    {"function" : <function reading the data from a file>,
+     "reader_type" : "signal", "events" or "text",
+     "probe" : <function reading only the header (optional)>}
+
+e.g., in setup.py:
+
+    entry_points={"export2hdf5.readers" :
+                  ["mydevice = mypackage.reader:MYDEVICE_READER"]}
+"""
+
+import importlib
+from collections.abc import Mapping
+
+## The entry point group of third-party readers
+ENTRY_POINT_GROUP = "export2hdf5.readers"
+
+## The built-in readers: the module (in this package), the function
+## reading the data, the function reading only the headers (used for
+## planning the export) and the type of the data.
+READERS = {"edf"                     : ("utilities_edf",       "read_edf_file",                "probe_edf",                     "signal"),
+           "edf_faros"               : ("utilities_edf",       "read_faros",                   "probe_edf",                     "signal"),
+           "mydarwin_ibi"            : ("utilities_mydarwin",  "read_mydarwin_data_ibi",       "probe_mydarwin_data_ibi",       "signal"),
+           "mydarwin_summary"        : ("utilities_mydarwin",  "read_mydarwin_data_summary",   "probe_mydarwin_data_summary",   "signal"),
+           "empatica"                : ("utilities_empatica",  "read_empatica",                "probe_empatica",                "signal"),
+           "bodyguard_features"      : ("utilities_firstbeat", "read_bodyguard_features",      "probe_bodyguard_features",      "signal"),
+           "bodyguard_features_misc" : ("utilities_firstbeat", "read_bodyguard_features_misc", "probe_bodyguard_features_misc", "signal"),
+           "bodyguard_ibi"           : ("utilities_firstbeat", "read_bodyguard_ibi",           "probe_bodyguard_ibi",           "signal"),
+           "bodyguard_acc"           : ("utilities_firstbeat", "read_bodyguard_acc",           "probe_bodyguard_acc",           "signal"),
+           "psg_hypnogram"           : ("utilities_psg",       "read_hypnogram",               "probe_hypnogram",               "signal"),
+           "psg_arousal"             : ("utilities_psg",       "read_arousal_hdf5",            "probe_psg_events",              "events"),
+           "psg_events"              : ("utilities_psg",       "read_psg_events_hdf5",         "probe_psg_events",              "events"),
+           "shimmer"                 : ("utilities_shimmer",   "read_shimmer",                 "probe_shimmer",                 "signal"),
+           "neurone"                 : ("utilities_neurone",   "read_neurone_data_hdf5",       "probe_neurone_data",            "signal"),
+           "neurone_events"          : ("utilities_neurone",   "read_neurone_events_hdf5",     "probe_neurone_events",          "events"),
+           "actigraph"               : ("utilities_actigraph", "read_actigraph",               "probe_actigraph",               "signal"),
+           "text"                    : ("utilities_general",   "read_text",                    "probe_text",                    "text")}
+
+def load_builtin(data_type):
+    """ Import the module of a built-in reader and return the entry of
+    the reader (a dict with the keys 'function', 'reader_type' and
+    'probe'). """
+    module, function, probe, reader_type = READERS[data_type]
+    module = importlib.import_module("." + module, __package__)
+    return {'function' : getattr(module, function),
+            'reader_type' : reader_type,
+            'probe' : getattr(module, probe)}
+
+def get_entry_points():
+    """ Return the entry points of the third-party readers as a dict
+    mapping the data types to the entry points. """
+    from importlib.metadata import entry_points
+    try:
+        eps = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:
+        ## Python < 3.10
+        eps = entry_points().get(ENTRY_POINT_GROUP, [])
+    return {i.name : i for i in eps}
+
+class ReaderList(Mapping):
+    """
+    The map of data types to readers. The entry of a reader is a dict
+
+        {'function' : <function reading the data>,
+         'reader_type' : 'signal', 'events' or 'text',
+         'probe' : <function reading the headers, or None>}
+
+    and it is created (and the module of the reader imported) when the
+    data type is first looked up. The entry points of the third-party
+    readers are only searched for data types that are not built in.
+    """
+
+    def __init__(self):
+        self.loaded = {}
+        self.entry_points = None
+
+    def get_entry_points(self):
+        if self.entry_points is None:
+            self.entry_points = get_entry_points()
+        return self.entry_points
+
+    def __getitem__(self, data_type):
+        if data_type not in self.loaded:
+            if data_type in READERS:
+                self.loaded[data_type] = load_builtin(data_type)
+            elif data_type in self.get_entry_points():
+                reader = dict(self.get_entry_points()[data_type].load())
+                reader.setdefault('probe', None)
+                self.loaded[data_type] = reader
+            else:
+                raise KeyError(data_type)
+        return self.loaded[data_type]
+
+    def __contains__(self, data_type):
+        return data_type in READERS or data_type in self.loaded or data_type in self.get_entry_points()
+
+    def __iter__(self):
+        names = list(READERS)
+        names += [i for i in self.get_entry_points() if i not in READERS]
+        return iter(names)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+## The registry shared by all exports
+REGISTRY = ReaderList()
+
+def get_readerlist():
+    """ Return the map of data types to readers (see ReaderList). """
+    return REGISTRY
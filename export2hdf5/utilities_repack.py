@@ -0,0 +1,272 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for merging HDF5 files created by
+export2hdf5 into one file, and for repacking files (e.g., with other
+compression settings). The groups, the datasets, the attributes and
+the hard links (e.g., shared time vectors) of the files are copied to
+the same paths in the output file.
+
+The chunked datasets are copied chunk by chunk without decompressing
+them (read_direct_chunk and write_direct_chunk) if their filters are
+not changed. If the compression is changed, the chunks are
+decompressed and compressed again in parallel threads when both the
+old and the new filters are shuffle and gzip (deflate). Other datasets
+(e.g., variable-length strings, virtual datasets of sharded output and
+datasets with other filters) are copied through h5py in blocks.
+"""
+
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import h5py
+from . import utilities_shards as shardutils
+
+## Number of chunks read and written at a time
+BATCH_SIZE = 256
+
+## Number of samples (rows) copied at a time through h5py
+BLOCK_SIZE = 1 << 20
+
+## The default level of gzip compression
+GZIP_LEVEL = 4
+
+## The filters that are decoded and encoded here when recompressing
+CODEC_FILTERS = [h5py.h5z.FILTER_SHUFFLE, h5py.h5z.FILTER_DEFLATE]
+
+def get_filters(dcpl):
+    """ Return the filters of a dataset creation property list as a
+    list of tuples (filter code, values). """
+    out = []
+    for i in range(dcpl.get_nfilters()):
+        code, flags, values, name = dcpl.get_filter(i)
+        out += [(code, tuple(values))]
+    return out
+
+def get_target_plist(dset, compression=None, level=None, shuffle=None):
+    """
+    Return the creation property list of the copy of the chunked
+    dataset dset. The chunks and the filters are the same as in dset,
+    unless the compression ("gzip", "lzf" or "none"), the gzip level or
+    shuffle is given. Then the filters are replaced with shuffle (if
+    given, or if dset uses it), the compression (by default gzip) and
+    fletcher32 (if dset uses it).
+    """
+    dcpl = dset.id.get_create_plist()
+    if compression is None and level is None and shuffle is None:
+        return dcpl
+
+    codes = [code for code, values in get_filters(dcpl)]
+    if shuffle is None:
+        shuffle = h5py.h5z.FILTER_SHUFFLE in codes
+    if compression is None:
+        compression = "lzf" if h5py.h5z.FILTER_LZF in codes else "gzip"
+
+    dcpl.remove_filter(h5py.h5z.FILTER_ALL)
+    if shuffle:
+        dcpl.set_shuffle()
+    if compression == "gzip":
+        dcpl.set_deflate(GZIP_LEVEL if level is None else level)
+    elif compression == "lzf":
+        dcpl.set_filter(h5py.h5z.FILTER_LZF, h5py.h5z.FLAG_OPTIONAL)
+    elif compression != "none":
+        raise ValueError("Unknown compression: " + str(compression))
+    if h5py.h5z.FILTER_FLETCHER32 in codes:
+        dcpl.set_fletcher32()
+    return dcpl
+
+def shuffle_bytes(data, itemsize, inverse=False):
+    """ Apply the shuffle filter of HDF5 (or its inverse) to the bytes
+    of a chunk with elements of itemsize bytes. """
+    n = len(data) // itemsize
+    if itemsize <= 1 or n <= 1:
+        return data
+    x = np.frombuffer(data, dtype=np.uint8)
+    if inverse:
+        body = x[:n * itemsize].reshape(itemsize, n).T
+    else:
+        body = x[:n * itemsize].reshape(n, itemsize).T
+    return body.tobytes() + x[n * itemsize:].tobytes()
+
+def decode_chunk(data, filter_mask, filters, itemsize):
+    """ Undo the filters (shuffle and deflate) of a raw chunk. The
+    filters skipped in the filter mask are not undone. """
+    for i in reversed(range(len(filters))):
+        if filter_mask & (1 << i):
+            continue
+        code, values = filters[i]
+        if code == h5py.h5z.FILTER_DEFLATE:
+            data = zlib.decompress(data)
+        elif code == h5py.h5z.FILTER_SHUFFLE:
+            data = shuffle_bytes(data, itemsize, inverse=True)
+    return data
+
+def encode_chunk(data, filters, itemsize):
+    """ Apply the filters (shuffle and deflate) to a chunk. """
+    for code, values in filters:
+        if code == h5py.h5z.FILTER_DEFLATE:
+            data = zlib.compress(data, values[0] if values else GZIP_LEVEL)
+        elif code == h5py.h5z.FILTER_SHUFFLE:
+            data = shuffle_bytes(data, itemsize)
+    return data
+
+def is_recodable(filters):
+    """ Return True if the chunks with the given filters can be decoded
+    and encoded here (see CODEC_FILTERS). """
+    return all(code in CODEC_FILTERS for code, values in filters)
+
+def copy_chunks(src, dst, recode=None, executor=None):
+    """
+    Copy the stored chunks of the dataset src to the dataset dst
+    without decompressing them, or, if recode is given, passing each
+    raw chunk through the function recode(data, filter_mask) in the
+    threads of the executor.
+    """
+    n = src.id.get_num_chunks()
+    for first in range(0, n, BATCH_SIZE):
+        chunks = []
+        for i in range(first, min(first + BATCH_SIZE, n)):
+            offset = src.id.get_chunk_info(i).chunk_offset
+            filter_mask, data = src.id.read_direct_chunk(offset)
+            chunks += [(offset, filter_mask, data)]
+
+        if recode is not None:
+            data = executor.map(lambda c: recode(c[2], c[1]), chunks)
+            chunks = [(offset, 0, i) for (offset, filter_mask, raw), i in zip(chunks, data)]
+
+        for offset, filter_mask, data in chunks:
+            dst.id.write_direct_chunk(offset, data, filter_mask)
+
+def copy_blocks(src, dst):
+    """ Copy the dataset src to the dataset dst (of the same shape)
+    through h5py in blocks of rows. """
+    if src.shape == ():
+        dst[()] = src[()]
+        return
+    n = len(src)
+    block = BLOCK_SIZE
+    if dst.chunks is not None:
+        block = max(1, block // dst.chunks[0]) * dst.chunks[0]
+    for start in range(0, n, block):
+        dst[start:start + block] = src[start:start + block]
+
+def copy_dataset(src, group, name, compression=None, level=None, shuffle=None, executor=None):
+    """
+    Copy the dataset src to the given name in the group (of another
+    file), with its attributes. See the description of this module.
+
+    Returns:
+       - the copied dataset and the method of copying ("direct",
+         "recompress" or "h5py")
+    """
+    dcpl = src.id.get_create_plist()
+    layout = dcpl.get_layout()
+    vlen = shardutils.is_vlen_dtype(src.dtype)
+
+    if layout == h5py.h5d.CHUNKED and not vlen:
+        target = get_target_plist(src, compression, level, shuffle)
+        dsid = h5py.h5d.create(group.id, name.encode("utf-8"), src.id.get_type(), src.id.get_space(), dcpl=target)
+        dst = h5py.Dataset(dsid)
+
+        filters_src = get_filters(dcpl)
+        filters_dst = get_filters(target)
+        if filters_src == filters_dst:
+            copy_chunks(src, dst)
+            method = "direct"
+        elif is_recodable(filters_src) and is_recodable(filters_dst):
+            itemsize = src.dtype.itemsize
+            recode = lambda data, mask: encode_chunk(decode_chunk(data, mask, filters_src, itemsize), filters_dst, itemsize)
+            copy_chunks(src, dst, recode, executor)
+            method = "recompress"
+        else:
+            copy_blocks(src, dst)
+            method = "h5py"
+    else:
+        ## e.g., strings and virtual datasets, which are written as
+        ## ordinary chunked datasets
+        if compression == "none":
+            compression = None
+        elif compression is None:
+            compression = src.compression or "gzip"
+        dst = group.create_dataset(name,
+                                   shape=src.shape,
+                                   dtype=src.dtype,
+                                   chunks=src.chunks if src.chunks else (True if src.shape else None),
+                                   compression=compression if src.shape else None,
+                                   compression_opts=level if compression == "gzip" else None,
+                                   shuffle=bool(shuffle) and src.shape != ())
+        copy_blocks(src, dst)
+        method = "h5py"
+
+    shardutils.copy_attributes(src, dst)
+    return dst, method
+
+def merge_files(fnames, fname_out, compression=None, level=None, shuffle=None, jobs=None):
+    """
+    Merge HDF5 files created by export2hdf5 into one file, or repack
+    one file.
+
+    Arguments:
+       - fnames : the names of the input files
+       - fname_out : the name of the output file
+       - compression : the compression of the output ("gzip", "lzf" or
+                       "none"). By default the compression of the input
+                       is kept.
+       - level : the level of gzip compression
+       - shuffle : if True (False), the shuffle filter is (not) used.
+                   By default as in the input.
+       - jobs : the number of threads recompressing the chunks (by
+                default the number of processors)
+
+    Returns:
+       - a dict with the number of datasets copied using each method
+
+    The attributes of the root and of the groups are merged, the later
+    files overriding the earlier ones. A dataset existing in several
+    files is an error.
+    """
+    if os.path.abspath(fname_out) in [os.path.abspath(i) for i in fnames]:
+        raise ValueError("The output file must not be one of the input files.")
+
+    counts = {"direct" : 0, "recompress" : 0, "h5py" : 0, "link" : 0}
+
+    with h5py.File(fname_out, "w") as out, ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        for fname in fnames:
+            print("Copying:\t", fname)
+            copied = {}
+
+            def copy_group(src, dst):
+                shardutils.copy_attributes(src, dst)
+                for key in src:
+                    obj = src[key]
+                    path = dst.name.rstrip("/") + "/" + key
+
+                    ## hard links to an object copied earlier
+                    if obj.id in copied:
+                        dst[key] = out[copied[obj.id]]
+                        counts["link"] += 1
+                        continue
+
+                    if isinstance(obj, h5py.Group):
+                        copy_group(obj, dst.require_group(key))
+                    else:
+                        if key in dst:
+                            raise ValueError("The dataset " + path + " exists in several files.")
+                        dset, method = copy_dataset(obj, dst, key, compression, level, shuffle, executor)
+                        counts[method] += 1
+                    copied[obj.id] = path
+
+            with h5py.File(fname, "r") as src:
+                copy_group(src, out)
+
+    return counts
@@ -0,0 +1,104 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for sharded output. In sharded output
+each dataset in the configuration file is written to its own HDF5
+file (a shard), and the output file is a master file presenting the
+contents of all shards at the same paths as an ordinary output file:
+
+- the datasets are virtual datasets mapping the datasets in the shards
+  (or external links, for datasets that cannot be virtual, e.g.,
+  variable-length strings)
+- the groups and the attributes are copied from the shards
+
+The shards are stored in the directory <output>_shards next to the
+master file, and are referred to using relative paths, so that the
+master file and the shards can be moved together.
+"""
+
+import os
+import h5py
+
+def get_shard_dir(fname):
+    """ Return the directory of the shards of the output file fname. """
+    return os.path.splitext(fname)[0] + "_shards"
+
+def get_shard_names(fname, n):
+    """ Return the names of the n shards of the output file fname. """
+    dname = get_shard_dir(fname)
+    stem = os.path.basename(os.path.splitext(fname)[0])
+    return [os.path.join(dname, "%s_%04d.h5" % (stem, i)) for i in range(n)]
+
+def is_vlen_dtype(dtype):
+    """ Return True if the type (or a field of it) has variable-length
+    data, e.g., strings. Datasets of such types cannot be virtual. """
+    if dtype.names is not None:
+        return any(is_vlen_dtype(dtype.fields[i][0]) for i in dtype.names)
+    return h5py.check_vlen_dtype(dtype) is not None or dtype.kind == "O"
+
+def copy_attributes(src, dst):
+    """ Copy the attributes of the HDF5 object src to dst. """
+    for key, value in src.attrs.items():
+        dst.attrs[key] = value
+
+def add_shard(master, fname_shard):
+    """
+    Add the contents of a shard to the master file (an open HDF5 file).
+    The path of the shard is stored relative to the master file.
+    """
+    relname = os.path.relpath(fname_shard, os.path.dirname(os.path.abspath(master.filename)))
+    ## the paths of the objects added, for the hard links in the shard
+    ## (e.g., shared time vectors)
+    added = {}
+
+    def add_group(src, dst):
+        copy_attributes(src, dst)
+        for key in src:
+            obj = src[key]
+            name = src.name.rstrip("/") + "/" + key
+
+            if obj.id in added:
+                if isinstance(master.get(added[obj.id], getlink=True), h5py.ExternalLink):
+                    dst[key] = h5py.ExternalLink(relname, added[obj.id])
+                else:
+                    dst[key] = master[added[obj.id]]
+                continue
+
+            if isinstance(obj, h5py.Group):
+                add_group(obj, dst.require_group(key))
+            elif key in dst:
+                raise ValueError("The path " + name + " is written by several datasets.")
+            elif not is_vlen_dtype(obj.dtype):
+                layout = h5py.VirtualLayout(shape=obj.shape, dtype=obj.dtype)
+                layout[...] = h5py.VirtualSource(relname, name, shape=obj.shape)
+                dset = dst.create_virtual_dataset(key, layout)
+                copy_attributes(obj, dset)
+            else:
+                dst[key] = h5py.ExternalLink(relname, name)
+            added[obj.id] = name
+
+    with h5py.File(fname_shard, "r") as shard:
+        add_group(shard, master)
+
+def build_master(fname, shards):
+    """
+    Create the master file fname of the shards (a list of file names).
+    Returns the handle to the master file, which is open for writing.
+    """
+    master = h5py.File(fname, "w")
+    try:
+        for fname_shard in shards:
+            add_shard(master, fname_shard)
+    except Exception:
+        master.close()
+        raise
+    return master
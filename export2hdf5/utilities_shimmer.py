@@ -17,70 +17,212 @@ http://www.shimmersensing.com/
 import re
 import datetime
 import numpy as np
+from . import utilities_io as ioutils
+from . import utilities_channels as chutils
+from . import utilities_memory as memutils
+
+## Number of rows read at a time
+BLOCK_SIZE = 65536
+
+## The largest deviation (in sampling intervals) of the timestamps
+## from a constant sampling rate for which the data is considered
+## regularly sampled
+JITTER_TOLERANCE = 0.5
+
+## Rules for fixing the channel names. Each rule is a tuple
+## (new name, patterns), and a label matching all of the patterns
+## is renamed. If several rules match, the last one is used.
+LABEL_RULES = [("Timestamp",   [re.compile("Unix")]),
+               ("Accel_X",     [re.compile("Accel"), re.compile("X")]),
+               ("Accel_Y",     [re.compile("Accel"), re.compile("Y")]),
+               ("Accel_Z",     [re.compile("Accel"), re.compile("Z")]),
+               ("Gyro_X",      [re.compile("Gyro"), re.compile("X")]),
+               ("Gyro_Y",      [re.compile("Gyro"), re.compile("Y")]),
+               ("Gyro_Z",      [re.compile("Gyro"), re.compile("Z")]),
+               ("Pressure",    [re.compile("Pressure")]),
+               ("Temperature", [re.compile("Temp")]),
+               ("GSR",         [re.compile("GSR")])]
+
+def read_shimmer_header(fid):
+    """
+    Read the header of a Shimmer csv file from the stream fid.
+
+    Returns:
+       - a tuple (separator, channel names, units)
+    """
+    # Get the separator
+    sep = fid.readline().split("=")[1].split('"')[0]
+
+    # Get header and units
+    header = [i.strip() for i in fid.readline().split(sep) if i.strip() != ""]
+    header = fix_labels(header)
+    units = [i.strip() for i in fid.readline().split(sep) if i.strip() != ""]
+
+    return sep, header, units
+
+def iter_shimmer_blocks(fname, block_size=None):
+    """
+    Read the data in a Shimmer csv file in blocks.
+
+    Arguments:
+       - fname : the name of the csv file
+       - block_size : the number of rows in each block. By default
+                      BLOCK_SIZE, or fewer rows if a memory budget
+                      has been set (see utilities_memory).
+
+    Returns:
+       - a generator yielding tuples (channel names, block), where
+         block is a two-dimensional array with one column per channel
+    """
+    with ioutils.open_input(fname, "r") as fid:
+        sep, header, units = read_shimmer_header(fid)
+
+        if block_size is None:
+            block_size = memutils.get_block_size(BLOCK_SIZE, len(header) * memutils.TEXT_VALUE_BYTES)
+
+        # The rows end in a separator, so only read the named columns
+        for block in ioutils.iter_blocks(fid, sep, range(len(header)), block_size):
+            yield header, block
+
+def get_timing(tvec, tolerance=JITTER_TOLERANCE, block_size=BLOCK_SIZE):
+    """
+    Determine whether the timestamps in tvec (seconds) are regularly
+    sampled. The timestamps are regular if they deviate at most
+    tolerance sampling intervals from a constant sampling rate. The
+    timestamps are processed in blocks, so tvec can be a memory map.
+
+    Returns:
+       - a tuple (sampling rate, jitter), where jitter is the largest
+         deviation in sampling intervals.
+    """
+    if len(tvec) < 2:
+        return 0, 0
+
+    dt = (tvec[-1] - tvec[0]) / (len(tvec) - 1)
+    if dt <= 0:
+        return 0, np.inf
 
-def read_shimmer(fname):
+    jitter = 0
+    for start in range(0, len(tvec), block_size):
+        block = tvec[start:start + block_size]
+        deviation = np.abs(block - tvec[0] - dt * np.arange(start, start + len(block)))
+        jitter = max(jitter, np.max(deviation) / dt)
+    return 1.0 / dt, jitter
+
+def read_shimmer(fname, block_size=None, tolerance=JITTER_TOLERANCE):
     """
     Read data recorded using a Shimmer device tored in csv format.
 
     Arguments:
        - fname : the name of the csv file
+       - block_size : the number of rows read at a time (see
+                      iter_shimmer_blocks)
+       - tolerance : the largest timing jitter (in sampling intervals)
+                     for which the data is treated as regularly sampled
 
     Returns:
+       - A ChannelSet (see utilities_channels).
 
-    A dictionary with the following format:
+    All columns in the file are read. If the timestamps are regular
+    the time vector is created from the sampling rate, otherwise the
+    timestamps are used as the time vector and the sampling rate is 0.
+    The mean sampling rate and the jitter are stored in the metadata.
 
-    {"meta" : <dict with metadata>,
-    "data" : {"time" : [...], "<channelname" : [...] }}
+    The file is parsed in blocks, and the converted blocks are written
+    to temporary files (see utilities_io.ColumnStore), so the channels
+    are memory maps and the data is not held in memory.
 
     """
-    fid = open(fname, "r", encoding="utf-8")
+    header = None
+    store = None
 
-    # Get the separator
-    sep = fid.readline().split("=")[1].split('"')[0]
+    for header, block in iter_shimmer_blocks(fname, block_size):
+        if store is None:
+            # Convert the UNIX timestamp to seconds from milliseconds
+            i_time = header.index("Timestamp") if "Timestamp" in header else 0
+            t_first = block[0, i_time] / 1000
 
-    # Get header and units
-    header = [i.strip() for i in fid.readline().split(sep) if i.strip() != ""]
-    header = fix_labels(header)
-    # units = [i.strip() for i in fid.readline().split(sep) if i.strip() != ""]
+            # Convert acceleration to units of g
+            labels = [i for i in header if i != header[i_time]]
+            scale = np.array([1 / 9.80665 if re.search("Accel", i) else 1.0 for i in labels])
+            store = ioutils.ColumnStore(len(labels) + 1)
 
-    # Read the data
-    data_tmp = np.genfromtxt(fname, delimiter=sep, skip_header=3)
-    data_tmp = data_tmp[:, 0:10]
+        tstamp = block[:, i_time] / 1000
+        block = np.delete(block, i_time, 1) * scale
+        store.append(np.column_stack([block, tstamp - t_first]))
+
+    if store is None:
+        raise ValueError("No data in the Shimmer file " + str(fname))
+
+    columns = store.columns()
+    tvec = columns[-1]
 
     # Store the data
     meta = {}
-    data = {}
 
-    # Convert the UNIX timestamp to seconds from milliseconds
-    data_tmp[:, 0] = data_tmp[:, 0] / 1000
+    # -- start time and sampling rate
+    mean_sampling_rate, jitter = get_timing(tvec, tolerance)
+    meta["time_start"] = datetime.datetime.fromtimestamp(float(t_first))
+    meta["mean_sampling_rate"] = mean_sampling_rate
+    meta["timing_jitter"] = jitter
+
+    # Use a regular time axis, or the timestamps as the time vector
+    out = chutils.ChannelSet()
+    if jitter <= tolerance:
+        meta["sampling_rate"] = mean_sampling_rate
+        axis = out.add_axis(sampling_rate=mean_sampling_rate, length=len(tvec))
+    else:
+        meta["sampling_rate"] = 0
+        axis = out.add_axis(tvec, sampling_rate=0)
+
+    # -- the signals
+    for label, column in zip(labels, columns):
+        out.add_channel(label, column, meta, axis)
+
+    return out
 
-    # Create a time vector
-    tvec = data_tmp[:, 0] - data_tmp[0, 0]
+def probe_shimmer(fname):
+    """
+    Read only the header of a Shimmer csv file. The number of samples
+    is estimated from the size of the file, and the sampling rate from
+    the timestamps of the first rows. The timing jitter is not known,
+    and the timestamps are assumed to be regular.
 
-    # -- start time and sampling rate
-    meta["time_start"] = datetime.datetime.fromtimestamp(float(data_tmp[0, 0]))
-    meta["sampling_rate"] = 1 / (tvec[1] - tvec[0])
+    Returns:
+       - a ChannelSet (see utilities_channels) with the channels
+         but without the data
+    """
+    with ioutils.open_input(fname, "r") as fid:
+        sep, header, units = read_shimmer_header(fid)
+        first = [fid.readline() for i in range(2)]
 
-    data_tmp = data_tmp[:, 1:]
-    header = header[1:]
+    tmp, n_rows = ioutils.read_header(fname, 3)
 
-    # Preallocate structure to return
-    out = [0] * len(header)
+    i_time = header.index("Timestamp") if "Timestamp" in header else 0
+    tstamp = [float(i.split(sep)[i_time]) / 1000 for i in first if i.strip() != ""]
 
-    # -- the signals
-    for ind, label in enumerate(header):
-        data = {}
-        # Convert acceleration to units of g
-        if re.search("Accel", label):
-            data[label] = (data_tmp[:, ind] / 9.80665)
-        else:
-            data[label] = data_tmp[:, ind]
-        data["time"] = tvec
-        out[ind] = {"meta": meta, "data" : data}
+    meta = {}
+    meta["time_start"] = datetime.datetime.fromtimestamp(tstamp[0]) if tstamp else ""
+    meta["sampling_rate"] = 1.0 / (tstamp[1] - tstamp[0]) if len(tstamp) == 2 else 0
+    meta["mean_sampling_rate"] = float(meta["sampling_rate"])
+    meta["timing_jitter"] = 0.0
+
+    out = chutils.ChannelSet()
+    axis = out.add_axis(sampling_rate=meta["sampling_rate"], length=n_rows)
+    for label in header:
+        if label != header[i_time]:
+            out.add_lazy_channel(label, None, n_rows, np.float64, meta, axis)
 
     return out
 
 
+def fix_label(label):
+    """ Fix one channel name using the rules in LABEL_RULES. """
+    for name, patterns in reversed(LABEL_RULES):
+        if all(i.search(label) for i in patterns):
+            return name
+    return label
+
 def fix_labels(header):
     """
     Fix the labels from the Shimmer data by removing unnecessary
@@ -91,30 +233,17 @@ def fix_labels(header):
 
     Returns:
 
-    A list with the channel names fixed.
+    A list with the channel names fixed. If several channels get
+    the same name (e.g., the low noise and wide range accelerometers
+    in Shimmer3), a running number is added to the later ones.
 
     """
+    header = [fix_label(i) for i in header]
 
+    seen = {}
     for i, label in enumerate(header):
-        if re.search("Unix", label):
-            header[i] = "Timestamp"
-        if (re.search("Accel", label) and re.search("X", label)):
-            header[i] = "Accel_X"
-        if (re.search("Accel", label) and re.search("Y", label)):
-            header[i] = "Accel_Y"
-        if (re.search("Accel", label) and re.search("Z", label)):
-            header[i] = "Accel_Z"
-        if (re.search("Gyro", label) and re.search("X", label)):
-            header[i] = "Gyro_X"
-        if (re.search("Gyro", label) and re.search("Y", label)):
-            header[i] = "Gyro_Y"
-        if (re.search("Gyro", label) and re.search("Z", label)):
-            header[i] = "Gyro_Z"
-        if re.search("Pressure", label):
-            header[i] = "Pressure"
-        if re.search("Temp", label):
-            header[i] = "Temperature"
-        if re.search("GSR", label):
-            header[i] = "GSR"
+        seen[label] = seen.get(label, 0) + 1
+        if seen[label] > 1:
+            header[i] = label + "_" + str(seen[label])
 
     return header
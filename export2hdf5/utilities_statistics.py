@@ -0,0 +1,122 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for computing summary statistics of a
+signal while it is written in blocks (see utilities_h5.write_signal_h5).
+The statistics are accumulated block by block, so that the signal is
+never held in memory as a whole:
+
+- count : the number of samples that are not NaN
+- nan_count : the number of NaN samples
+- min, max : the smallest and the largest value
+- min_count, max_count : the number of samples equal to the smallest
+  and the largest value. Large counts indicate clipping.
+- mean, std : the mean and the (population) standard deviation. The
+  mean and the sum of squared deviations of each block are combined
+  with those of the earlier blocks (Welford's method as generalized by
+  Chan et al.), which is numerically stable.
+- longest_flat : the number of samples in the longest run of equal
+  consecutive values. Long runs indicate, e.g., a detached sensor.
+
+The statistics are stored as attributes with the prefix stats_.
+"""
+
+import numpy as np
+
+## The prefix of the attributes
+PREFIX = "stats_"
+
+def init_statistics():
+    """ Return the accumulator (a dict) of the statistics of an empty signal. """
+    return {"count" : 0, "nan_count" : 0,
+            "min" : np.nan, "max" : np.nan, "min_count" : 0, "max_count" : 0,
+            "mean" : 0.0, "m2" : 0.0,
+            "longest_flat" : 0, "run_value" : None, "run_length" : 0}
+
+def update_extreme(acc, key, value, count, better):
+    """ Update the extreme value (min or max) and the number of samples
+    equal to it with those of a block. """
+    if acc[key + "_count"] == 0 or better(value, acc[key]):
+        acc[key] = value
+        acc[key + "_count"] = count
+    elif value == acc[key]:
+        acc[key + "_count"] += count
+
+def update_runs(acc, x):
+    """ Update the longest run of equal consecutive values with the
+    samples in the block x. """
+    change = np.flatnonzero(x[1:] != x[:-1]) + 1
+    bounds = np.concatenate([[0], change, [len(x)]])
+    lengths = np.diff(bounds)
+
+    ## the first run continues the last run of the previous block
+    if acc["run_value"] is not None and x[0] == acc["run_value"]:
+        lengths[0] += acc["run_length"]
+
+    acc["longest_flat"] = max(acc["longest_flat"], int(lengths.max()))
+    acc["run_value"] = x[-1]
+    acc["run_length"] = int(lengths[-1])
+
+def update_statistics(acc, block):
+    """
+    Update the statistics in the accumulator acc with the samples in
+    block (a one-dimensional array).
+    """
+    if len(block) == 0:
+        return
+
+    x = np.asarray(block)
+    update_runs(acc, x)
+
+    valid = ~np.isnan(x)
+    n_b = int(np.count_nonzero(valid))
+    acc["nan_count"] += len(x) - n_b
+    if n_b == 0:
+        return
+    if n_b < len(x):
+        x = x[valid]
+
+    x_min = x.min()
+    x_max = x.max()
+    update_extreme(acc, "min", float(x_min), int(np.count_nonzero(x == x_min)), lambda a, b: a < b)
+    update_extreme(acc, "max", float(x_max), int(np.count_nonzero(x == x_max)), lambda a, b: a > b)
+
+    ## combine the mean and the sum of squared deviations of the block
+    ## with those of the earlier blocks
+    x = x.astype(np.float64)
+    mean_b = x.mean()
+    m2_b = float(np.sum(np.square(x - mean_b)))
+
+    n_a = acc["count"]
+    n = n_a + n_b
+    delta = mean_b - acc["mean"]
+    acc["mean"] += delta * n_b / n
+    acc["m2"] += m2_b + delta * delta * n_a * n_b / n
+    acc["count"] = n
+
+def get_statistics(acc):
+    """ Return the statistics in the accumulator acc as a dict. """
+    out = {key : acc[key] for key in ["count", "nan_count", "min", "max", "min_count", "max_count", "longest_flat"]}
+    if acc["count"] > 0:
+        out["mean"] = acc["mean"]
+        out["std"] = float(np.sqrt(acc["m2"] / acc["count"]))
+    else:
+        out["mean"] = np.nan
+        out["std"] = np.nan
+    return out
+
+def add_statistics(obj, acc):
+    """ Add the statistics in the accumulator acc as attributes (with
+    the prefix PREFIX) to the HDF5 object obj. Existing attributes are
+    modified in place. """
+    for key, value in get_statistics(acc).items():
+        obj.attrs.modify(PREFIX + key, value)
@@ -0,0 +1,273 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains the transforms applied to the signals of a map
+before they are written, i.e., filtering and decimation. The transform
+of a map is given in the configuration file, e.g.,
+
+    "transform" : {"decimate" : 20,
+                   "filter" : "fir",
+                   "cutoff" : 400,
+                   "order" : 401,
+                   "zero_phase" : 1}
+
+- decimate : the decimation factor (default 1, i.e., no decimation)
+- filter : "fir" (default) or "iir" (Chebyshev type I)
+- cutoff : the cutoff frequency in Hz of a lowpass filter, or a list
+           [low, high] for a bandpass filter. For a highpass filter
+           high is null. When decimating, the default (and the high
+           cutoff of a highpass filter) is 0.8 times the Nyquist
+           frequency after decimation.
+- order : the number of taps of a FIR filter (default 20 * decimate + 1)
+          or the order of an IIR filter (default 8)
+- zero_phase : if true (default), the filter does not shift the signal
+               in time. Otherwise the filter is causal.
+
+The transformed channels are read lazily in blocks, like the channels
+returned by the readers: each block is filtered together with the
+samples overlapping the neighbouring blocks, so that the blocks join
+seamlessly. For FIR filters the result is the same as when filtering
+the whole signal at once (with zeros outside the signal), and for IIR
+filters it differs only by the decay of the impulse response beyond
+the overlap. Only regularly sampled channels can be transformed.
+
+The filters are designed using scipy.signal, which is imported only
+when a transform is used.
+"""
+
+import numpy as np
+from . import utilities_channels as chutils
+
+## Number of input samples filtered at a time
+BLOCK_SIZE = 1 << 20
+
+## The ripple (dB) of the IIR filters, as in scipy.signal.decimate
+IIR_RIPPLE = 0.05
+
+## The default order of the IIR filters
+IIR_ORDER = 8
+
+## The IIR impulse response is truncated where it has decayed to this
+## fraction of its peak, which determines the overlap of the blocks
+IIR_TOLERANCE = 1e-9
+
+## Relative cutoff frequency of the anti-aliasing filters (relative to
+## the Nyquist frequency after decimation)
+CUTOFF = 0.8
+
+def import_signal():
+    """ Import and return scipy.signal. """
+    try:
+        import scipy.signal
+    except ImportError:
+        raise ImportError("Filtering requires the scipy package, e.g., pip install export2hdf5[scipy].")
+    return scipy.signal
+
+def get_band(transform, sampling_rate):
+    """
+    Return the pass band of the filter of a transform as a tuple
+    (low, high) in Hz, where low and high can be None, or None if
+    the signal is not filtered.
+    """
+    q = transform.get("decimate", 1)
+    cutoff = transform.get("cutoff")
+
+    if isinstance(cutoff, list):
+        low, high = cutoff
+    else:
+        low, high = None, cutoff
+
+    if high is None and q > 1:
+        high = CUTOFF * sampling_rate / (2.0 * q)
+
+    if low is None and high is None:
+        return None
+    return low, high
+
+def design_filter(transform, sampling_rate):
+    """
+    Design the filter of a transform for the given sampling rate.
+
+    Returns:
+       - a dict with the filter (the FIR taps or the IIR second-order
+         sections), the overlap of the blocks and a description of the
+         filter, or None if the signal is not filtered
+    """
+    band = get_band(transform, sampling_rate)
+    if band is None:
+        return None
+
+    signal = import_signal()
+    q = transform.get("decimate", 1)
+    low, high = band
+
+    if low is not None and high is not None:
+        cutoff, btype = [low, high], "bandpass"
+    elif low is not None:
+        cutoff, btype = low, "highpass"
+    else:
+        cutoff, btype = high, "lowpass"
+
+    out = {"ftype" : transform.get("filter", "fir"),
+           "zero_phase" : bool(transform.get("zero_phase", True))}
+
+    if out["ftype"] == "fir":
+        numtaps = transform.get("order", 20 * q + 1)
+        ## highpass and bandpass filters need an odd number of taps
+        numtaps += 1 - numtaps % 2
+        out["taps"] = signal.firwin(numtaps, cutoff, pass_zero=(btype == "lowpass"), fs=sampling_rate)
+        out["overlap"] = numtaps
+    elif out["ftype"] == "iir":
+        order = transform.get("order", IIR_ORDER)
+        out["sos"] = signal.cheby1(order, IIR_RIPPLE, cutoff, btype=btype, fs=sampling_rate, output="sos")
+        out["overlap"] = get_iir_overlap(out["sos"])
+    else:
+        raise ValueError("Unknown filter type: " + str(out["ftype"]))
+
+    out["description"] = "%s %s %s Hz%s" % (out["ftype"], btype, cutoff,
+                                            ", zero-phase" if out["zero_phase"] else "")
+    return out
+
+def get_iir_overlap(sos, n_max=1 << 20):
+    """ Return the length of the impulse response of an IIR filter,
+    truncated at IIR_TOLERANCE of its peak. """
+    signal = import_signal()
+    n = 1024
+    while True:
+        impulse = np.zeros(n)
+        impulse[0] = 1
+        h = np.abs(signal.sosfilt(sos, impulse))
+        above = np.nonzero(h > IIR_TOLERANCE * h.max())[0]
+        if above[-1] < n // 2 or n >= n_max:
+            return int(above[-1]) + 1
+        n *= 2
+
+def read_padded(ch, start, stop):
+    """ Return the samples of the channel ch from index start to stop,
+    with zeros outside the channel. """
+    out = np.zeros(stop - start)
+    lo, hi = max(start, 0), min(stop, ch.length)
+    if lo < hi:
+        out[lo - start:hi - start] = ch.read(lo, hi)
+    return out
+
+def filter_fir(ch, filt, q, start, stop):
+    """
+    Filter and decimate the samples of the channel ch using a FIR
+    filter, returning the output samples from index start to stop.
+    Only the output samples are computed (polyphase filtering).
+    """
+    signal = import_signal()
+    taps = filt["taps"]
+
+    ## the delay of the linear-phase filter is compensated
+    delay = (len(taps) - 1) // 2 if filt["zero_phase"] else 0
+    n_prev = -(-len(taps) // q)
+
+    first = start * q + delay - n_prev * q
+    last = (stop - 1) * q + delay + 1
+    y = signal.upfirdn(taps, read_padded(ch, first, last), 1, q)
+    return y[n_prev:n_prev + stop - start]
+
+def filter_iir(ch, filt, q, start, stop):
+    """
+    Filter and decimate the samples of the channel ch using an IIR
+    filter, returning the output samples from index start to stop.
+    The block is filtered together with the overlapping samples.
+    """
+    signal = import_signal()
+    overlap = filt["overlap"]
+
+    first = max(start * q - overlap, 0)
+    last = min((stop - 1) * q + 1 + (overlap if filt["zero_phase"] else 0), ch.length)
+    x = ch.read(first, last).astype(np.float64)
+
+    if filt["zero_phase"]:
+        try:
+            y = signal.sosfiltfilt(filt["sos"], x)
+        except ValueError:
+            ## the signal is shorter than the default padding
+            y = signal.sosfiltfilt(filt["sos"], x, padlen=len(x) - 1)
+    else:
+        y = signal.sosfilt(filt["sos"], x)
+    return y[start * q - first:(stop - 1) * q + 1 - first:q]
+
+def get_reader(ch, filt, q):
+    """
+    Return a function reader(start, stop) returning the transformed
+    samples of the channel ch from index start to stop, processing at
+    most BLOCK_SIZE input samples at a time.
+    """
+    block = max(1, BLOCK_SIZE // q)
+
+    def reader(start, stop):
+        out = []
+        for i in range(start, stop, block):
+            j = min(i + block, stop)
+            if filt is None:
+                out += [np.asarray(ch.read(i * q, (j - 1) * q + 1))[::q]]
+            elif filt["ftype"] == "fir":
+                out += [filter_fir(ch, filt, q, i, j)]
+            else:
+                out += [filter_iir(ch, filt, q, i, j)]
+        if not out:
+            return np.zeros(0)
+        return np.concatenate(out)
+
+    return reader
+
+def transform_channels(data, channels, transform):
+    """
+    Apply a transform (see the description of this module) to the
+    given channels in a ChannelSet.
+
+    Arguments:
+       - data : a ChannelSet (see utilities_channels)
+       - channels : the names of the channels
+       - transform : the transform from the configuration file
+
+    Returns:
+       - a ChannelSet with the transformed channels, which are read
+         lazily. The channels sharing a time axis in data share the
+         new time axis, with the sampling rate divided by the
+         decimation factor.
+    """
+    q = int(transform.get("decimate", 1))
+    if q < 1:
+        raise ValueError("The decimation factor must be a positive integer.")
+
+    out = chutils.ChannelSet()
+    axes = {}
+    filters = {}
+
+    for ch in data.select(channels):
+        if not ch.axis.is_regular() or not ch.sampling_rate:
+            raise ValueError("Channel " + ch.name + " is not regularly sampled and cannot be filtered or decimated.")
+
+        if id(ch.axis) not in axes:
+            axes[id(ch.axis)] = out.add_axis(sampling_rate=ch.sampling_rate / q,
+                                             length=-(-ch.axis.length // q))
+            filters[id(ch.axis)] = design_filter(transform, ch.sampling_rate)
+
+        filt = filters[id(ch.axis)]
+
+        meta = dict(ch.meta)
+        meta["sampling_rate"] = ch.sampling_rate / q
+        if q > 1:
+            meta["decimation"] = q
+        if filt is not None:
+            meta["filter"] = filt["description"]
+
+        out.add_lazy_channel(ch.name, get_reader(ch, filt, q), -(-ch.length // q),
+                             np.float64, meta, axes[id(ch.axis)])
+
+    return out
@@ -0,0 +1,337 @@
+# This file is part of export2hdf5
+#
+# Copyright 2016
+# Andreas Henelius <andreas.henelius@ttl.fi>,
+# Finnish Institute of Occupational Health
+#
+# This code is released under the MIT License
+# http://opensource.org/licenses/mit-license.php
+#
+# Please see the file LICENSE for details.
+
+"""
+This module contains functions for verifying an HDF5 file created by
+export2hdf5 against its data sources. The sources in the configuration
+file are read again using the readers (see utilities_readers), and
+each map is compared with the output:
+
+- signals : the samples and the time vector of each channel are read
+  in blocks from the source and from the output and compared. Integer
+  samples must be equal after they are converted to the type of the
+  output (as when they are written), and floating-point samples (and
+  the time vectors) must be equal within the precision of the
+  single-precision output (FLOAT32_TOLERANCE relative to the value).
+  The transforms of the maps (see utilities_transform) are applied to
+  the sources. Channels missing from the source fail the map.
+- events : the output must be equal to the source.
+- text : the bytes of the output must be equal to the encoded text of
+  the source, compared in blocks as the signals.
+
+For very large files only a sample of the blocks (the first and the
+last block, and randomly chosen blocks) can be compared.
+
+The downsampled levels, the statistics and the metadata are not
+verified.
+"""
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import h5py
+from . import utilities_readers as readerutils
+from . import utilities_h5 as h5utils
+from . import utilities_transform as transformutils
+from . import utilities_general as utils
+from . import utilities_memory as memutils
+
+## Number of samples compared at a time
+BLOCK_SIZE = 1 << 20
+
+## Memory used for comparing one sample (the source and the output
+## blocks and the differences)
+VERIFY_SAMPLE_BYTES = 40
+
+## The largest relative difference between a floating-point sample in
+## the source and in the (single-precision) output
+FLOAT32_TOLERANCE = 2.0 ** -23
+
+## The seed of the random choice of the blocks when sampling
+SEED = 0
+
+def compare_block(src, out):
+    """
+    Compare a block of samples from the source with the block in the
+    output.
+
+    Returns:
+       - a tuple (the number of differing samples, the largest relative
+         difference). Integer samples must be equal after they are
+         converted to the type of the output, as the writer converts
+         them (e.g., integers above 2**24 are rounded in float32
+         output), and NaN values must be NaN in both blocks.
+    """
+    src = np.asarray(src)
+    if len(src) != len(out):
+        return max(len(src), len(out)), np.inf
+
+    if src.dtype.kind in "iub":
+        differ = out != src.astype(out.dtype)
+        return int(np.count_nonzero(differ)), (np.inf if differ.any() else 0.0)
+
+    src = src.astype(np.float64)
+    out = out.astype(np.float64)
+    nan_src = np.isnan(src)
+    nan_out = np.isnan(out)
+
+    with np.errstate(invalid="ignore", over="ignore"):
+        error = np.abs(out - src) / np.maximum(np.abs(src), np.finfo(np.float32).tiny)
+    error[nan_src & nan_out] = 0
+    error[nan_src != nan_out] = np.inf
+
+    differ = error > FLOAT32_TOLERANCE
+    return int(np.count_nonzero(differ)), float(error.max()) if len(error) else 0.0
+
+def choose_blocks(n_blocks, sample=None, seed=SEED):
+    """ Return the indices of the blocks to compare: all blocks, or
+    the first and the last block and a random sample of the given
+    fraction of the blocks. """
+    if sample is None or sample >= 1 or n_blocks <= 2:
+        return list(range(n_blocks))
+    rng = np.random.default_rng(seed)
+    k = max(0, int(np.ceil(sample * n_blocks)) - 2)
+    middle = rng.choice(np.arange(1, n_blocks - 1), size=min(k, n_blocks - 2), replace=False)
+    return sorted(set([0, n_blocks - 1]) | set(int(i) for i in middle))
+
+def verify_signal(read_src, length, dset, sample=None, block_size=None):
+    """
+    Compare a signal read using the function read_src(start, stop) with
+    the dataset dset in the output.
+
+    Returns:
+       - a dict with the number of samples compared, the number of
+         differing samples and the largest relative difference
+    """
+    if block_size is None:
+        block_size = memutils.get_block_size(BLOCK_SIZE, VERIFY_SAMPLE_BYTES)
+    if dset.chunks is not None:
+        block_size = max(1, block_size // dset.chunks[0]) * dset.chunks[0]
+
+    out = {"samples" : 0, "mismatches" : 0, "max_error" : 0.0}
+    if len(dset) != length:
+        out["mismatches"] = abs(len(dset) - int(length))
+        out["max_error"] = np.inf
+        out["error"] = "length %d in the output, %d in the source" % (len(dset), length)
+        return out
+
+    n_blocks = int(-(-length // block_size))
+    for i in choose_blocks(n_blocks, sample):
+        start = i * block_size
+        stop = min(start + block_size, length)
+        block = dset[start:stop]
+        mismatches, max_error = compare_block(read_src(start, stop), block)
+        out["samples"] += int(stop - start)
+        out["mismatches"] += mismatches
+        out["max_error"] = max(out["max_error"], max_error)
+    return out
+
+def get_signal_paths(dset_map, name):
+    """ Return the paths of the samples and of the time vector of a
+    channel in the output (see utilities_h5.add_data_h5). """
+    if dset_map["shared_group"]:
+        return dset_map["path"] + "/" + name, dset_map["path"] + "/time"
+    return dset_map["path"] + "/" + name + "/data", dset_map["path"] + "/" + name + "/time"
+
+def verify_signal_map(dset_map, data, fid, sample=None):
+    """ Verify the channels of a signal map (see verify_dataset). """
+    channels = dset_map["channels"]
+    if channels == ["*"]:
+        channels = utils.get_channels_in_set(data)
+
+    rep = {"channels" : {}, "missing" : [c for c in channels if c not in data], "errors" : []}
+    if "transform" in dset_map:
+        data = transformutils.transform_channels(data, channels, dset_map["transform"])
+
+    time_verified = False
+    for ch in data.select(channels):
+        path_data, path_time = get_signal_paths(dset_map, ch.name)
+        if path_data not in fid:
+            rep["errors"] += ["Channel not found in the output: " + path_data]
+            continue
+
+        rep["channels"][ch.name] = verify_signal(ch.read, ch.length, fid[path_data], sample)
+        if not time_verified or not dset_map["shared_group"]:
+            name_time = "time" if dset_map["shared_group"] else ch.name + "/time"
+            rep["channels"][name_time] = verify_signal(ch.axis.read, ch.axis.length, fid[path_time], sample)
+            time_verified = True
+
+    return rep
+
+def equal_values(a, b):
+    """ Return True if the arrays (possibly structured) a and b are
+    equal. NaN values are equal. """
+    if a.shape != b.shape:
+        return False
+    if a.dtype.names is not None:
+        return all(equal_values(a[i], b[i]) for i in a.dtype.names)
+    if a.dtype.kind == "f":
+        return np.array_equal(a, b, equal_nan=True)
+    return np.array_equal(a, b)
+
+def verify_dataset_map(dset_map, fid, values, dtype=None):
+    """ Verify the events of a map: the output must equal the source
+    values. """
+    rep = {"channels" : {}, "missing" : [], "errors" : []}
+    if dset_map["path"] not in fid:
+        rep["errors"] += ["Path not found in the output: " + dset_map["path"]]
+        return rep
+
+    dset = fid[dset_map["path"]]
+    values = np.asarray(values, dtype=dtype)
+    n = len(values)
+    equal = equal_values(values, dset[()])
+
+    rep["channels"][dset.name.split("/")[-1]] = {"samples" : n, "mismatches" : 0 if equal else n,
+                                                 "max_error" : 0.0 if equal else np.inf}
+    return rep
+
+def verify_text_map(dset_map, fid, data, sample=None):
+    """ Verify the text of a map: the bytes of the output must equal
+    the encoded text of the source. The bytes are compared in blocks
+    (see verify_signal). """
+    rep = {"channels" : {}, "missing" : [], "errors" : []}
+    if dset_map["path"] not in fid:
+        rep["errors"] += ["Path not found in the output: " + dset_map["path"]]
+        return rep
+
+    dset = fid[dset_map["path"]]
+    encoding = data.get("encoding", "utf-8")
+    values = h5utils.text_to_bytes(data["text"], encoding)
+    name = dset.name.split("/")[-1]
+
+    if h5py.check_string_dtype(dset.dtype) is not None:
+        ## text written as a variable-length string by earlier versions
+        equal = dset.asstr()[()].tolist() == [bytes(values).decode(encoding)]
+        rep["channels"][name] = {"samples" : len(values), "mismatches" : 0 if equal else len(values),
+                                 "max_error" : 0.0 if equal else np.inf}
+    else:
+        rep["channels"][name] = verify_signal(lambda start, stop: values[start:stop], len(values), dset, sample)
+    return rep
+
+def verify_dataset(dataset, fname_out, sample=None, max_memory=None):
+    """
+    Verify the maps of a dataset (from a configuration file) in the
+    output file fname_out.
+
+    Returns:
+       - a list with the report (a dict) of each map
+    """
+    memutils.set_budget(max_memory)
+    reader = readerutils.get_readerlist()[dataset["data_type"]]
+    out = []
+
+    try:
+        data = reader['function'](dataset["filename"])
+    except Exception as e:
+        return [dict(get_map_info(dataset, i), passed=False, channels={}, missing=[],
+                     errors=["Unable to read the source: " + str(e)]) for i in dataset["maps"]]
+
+    with h5py.File(fname_out, "r") as fid:
+        for dset_map in dataset["maps"]:
+            try:
+                if reader['reader_type'] == 'signal':
+                    rep = verify_signal_map(dset_map, data, fid, sample)
+                elif reader['reader_type'] == 'events':
+                    rep = verify_dataset_map(dset_map, fid, data['events'], data['dtype'])
+                else:
+                    rep = verify_text_map(dset_map, fid, data, sample)
+            except Exception as e:
+                ## e.g., a checksum error when reading the output
+                rep = {"channels" : {}, "missing" : [], "errors" : [str(e)]}
+
+            rep.update(get_map_info(dataset, dset_map))
+            summarize(rep)
+            out += [rep]
+
+    return out
+
+def get_map_info(dataset, dset_map):
+    """ Return the dataset, the data type and the path of a map. """
+    return {"dataset" : dataset["filename"], "data_type" : dataset["data_type"], "path" : dset_map["path"]}
+
+def summarize(rep):
+    """ Add the totals of the channels and the result to the report of
+    a map. The map fails if samples differ, if a channel is missing
+    from the source or if there are errors. """
+    channels = rep["channels"].values()
+    rep["samples"] = sum(i["samples"] for i in channels)
+    rep["mismatches"] = sum(i["mismatches"] for i in channels)
+    rep["max_error"] = max([i["max_error"] for i in channels] + [0.0])
+    rep["passed"] = rep["mismatches"] == 0 and not rep["missing"] and not rep["errors"] and \
+        not any("error" in i for i in channels)
+
+def verify_export(config, sample=None, jobs=1):
+    """
+    Verify the output file of a configuration (a dict) against the
+    data sources.
+
+    Arguments:
+       - config : the configuration
+       - sample : the fraction of the blocks compared (default: all)
+       - jobs : the number of datasets verified in parallel processes
+
+    Returns:
+       - the report, a dict {"output" : <output file>, "passed" : ...,
+         "maps" : <the report of each map>}
+    """
+    fname_out = config["output"]["filename"]
+    max_memory = memutils.get_budget()
+    if max_memory is not None:
+        max_memory = max_memory // max(jobs, 1)
+    args = [(dataset, fname_out, sample, max_memory) for dataset in config["datasets"]]
+
+    if jobs <= 1:
+        reports = [verify_dataset(*i) for i in args]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            reports = list(executor.map(verify_dataset, *zip(*args)))
+
+    maps = [rep for i in reports for rep in i]
+    return {"output" : fname_out, "sample" : sample,
+            "passed" : all(i["passed"] for i in maps), "maps" : maps}
+
+def print_report(rep):
+    """ Print the report returned by verify_export. """
+    print("Verification of:\t", rep["output"], "\n")
+    for i in rep["maps"]:
+        print("%s\t%s\t(%s, %d samples, %d differing, max. relative difference %.3g)"
+              % ("PASS" if i["passed"] else "FAIL", i["path"], i["data_type"],
+                 i["samples"], i["mismatches"], i["max_error"]))
+        for channel in i["missing"]:
+            print("\tError:\t Channel not found in data:\t", channel)
+        for error in i["errors"]:
+            print("\tError:\t", error)
+        for name, ch in i["channels"].items():
+            if "error" in ch:
+                print("\tError:\t", name + ":", ch["error"])
+            elif ch["mismatches"] > 0:
+                print("\t" + name + ":\t", ch["mismatches"], "differing samples")
+
+    print("\nVerification", "passed." if rep["passed"] else "FAILED.")
+
+def to_json(value):
+    """ Return the value (e.g., a report) with the infinite and NaN
+    numbers replaced by None, which is null in JSON. """
+    if isinstance(value, dict):
+        return {key : to_json(i) for key, i in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(i) for i in value]
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+def write_report(rep, fname):
+    """ Write the report returned by verify_export in JSON format. The
+    infinite differences (e.g., of samples differing in their NaN
+    values or of signals of different lengths) are written as null. """
+    with open(fname, "w") as file:
+        json.dump(to_json(rep), file, indent=1, allow_nan=False)
@@ -14,8 +14,9 @@ setup(name='export2hdf5',
       install_requires=['jsonschema',
                         'pyedflib',
                         'numpy',
-                        'scipy',
                         'h5py',
                         'construct>=2.8'],
+      extras_require={'scipy' : ['scipy'],
+                      'zstd' : ['zstandard']},
       entry_points={"console_scripts":
                     ["export2hdf = export2hdf5.export_hdf5:export2hdf5_cli"]})
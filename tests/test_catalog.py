@@ -0,0 +1,73 @@
+import datetime
+import sqlite3
+
+import h5py
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_catalog as catalogutils
+from export2hdf5 import utilities_channels as chutils
+from export2hdf5 import utilities_h5 as h5utils
+
+
+@pytest.fixture
+def fname(tmp_path):
+    """ An output file with signals in both layouts (with downsampled
+    levels and a time index), events and text. """
+    fname = str(tmp_path / "out.h5")
+    start = datetime.datetime(2017, 1, 1, 10, 0, 0)
+
+    ecg = chutils.ChannelSet()
+    ecg.add_channel("ECG_1", np.zeros(36000), {"sampling_rate" : 500.0, "time_start" : start}, sampling_rate=500.0)
+
+    ibi = chutils.ChannelSet()
+    time = np.cumsum(np.full(100, 0.8))
+    ibi.add_channel("ibi", np.full(100, 0.8), {"sampling_rate" : 0, "time_start" : start}, time)
+
+    dtype = np.dtype([("onset", "f8"), ("code", "i4")])
+    events = np.zeros(3, dtype=dtype)
+
+    with h5py.File(fname, "w") as fid:
+        h5utils.add_data_h5(fid, "ECG/device", ecg, ["ECG_1"], shared_group=True, pyramid=[10])
+        h5utils.add_data_h5(fid, "IBI/device", ibi, ["ibi"], shared_group=False)
+        h5utils.add_events_h5(fid, "Events/device", events, dtype)
+        h5utils.add_text_h5(fid, "Notes/note", "first line\nsecond line\n")
+    return fname
+
+
+def test_add_and_query(tmp_path, fname):
+    catalog = str(tmp_path / "catalog.db")
+    source = tmp_path / "source.csv"
+    source.write_text("1,2\n")
+
+    n = catalogutils.add_file(catalog, fname, [{"filename" : str(source), "data_type" : "text"}])
+    assert n == 4
+
+    rows = {i["name"] : i for i in catalogutils.query(catalog)}
+    ## the pyramid, the index and the time vectors are not channels
+    assert sorted(rows) == ["ECG_1", "device", "ibi", "note"]
+    assert rows["device"]["kind"] == "events"
+    assert rows["ECG_1"]["sampling_rate"] == 500.0
+    assert rows["ECG_1"]["time_start"] == "2017-01-01T10:00:00"
+    assert rows["ECG_1"]["time_stop"] == "2017-01-01T10:01:12"
+    assert rows["ibi"]["sampling_rate"] is None
+    assert rows["note"]["kind"] == "text"
+
+    assert [i["name"] for i in catalogutils.query(catalog, channel="ECG*")] == ["ECG_1"]
+    assert [i["name"] for i in catalogutils.query(catalog, min_rate=100)] == ["ECG_1"]
+    assert len(catalogutils.query(catalog, kind="events")) == 1
+    assert catalogutils.query(catalog, start="2017-01-02") == []
+    assert len(catalogutils.query(catalog, start="2017-01-01T10:00:30", stop="2017-01-01T10:00:40")) == 2
+
+    with sqlite3.connect(catalog) as con:
+        (size, digest), = con.execute("SELECT size, sha256 FROM sources").fetchall()
+    assert size == 4 and len(digest) == 64
+
+
+def test_add_again_replaces_rows(tmp_path, fname):
+    catalog = str(tmp_path / "catalog.db")
+    catalogutils.add_file(catalog, fname)
+    catalogutils.add_file(catalog, fname)
+    rows = catalogutils.query(catalog)
+    assert len(rows) == 4
+    assert len(set(i["file"] for i in rows)) == 1
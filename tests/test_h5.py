@@ -0,0 +1,89 @@
+import h5py
+import numpy as np
+
+from export2hdf5 import export_hdf5
+from export2hdf5 import utilities_channels as chutils
+from export2hdf5 import utilities_h5 as h5utils
+from export2hdf5 import utilities_shards as shardutils
+
+
+def add_regular(fid):
+    """ Channels a and b have the same regular time axis, c another one. """
+    data = chutils.ChannelSet()
+    for name, rate in [("a", 100.0), ("b", 100.0), ("c", 50.0)]:
+        data.add_channel(name, np.arange(1000.0), {"sampling_rate" : rate}, sampling_rate=rate)
+    h5utils.add_data_h5(fid, "X", data, ["a", "b", "c"], shared_group=False, pyramid=[10])
+
+
+def test_regular_time_vectors_are_linked(tmp_path):
+    with h5py.File(str(tmp_path / "out.h5"), "w") as fid:
+        add_regular(fid)
+        assert fid["X/a/time"].id == fid["X/b/time"].id
+        assert fid["X/a/pyramid_10/time"].id == fid["X/b/pyramid_10/time"].id
+        assert fid["X/a/time"].id != fid["X/c/time"].id
+        assert fid["X/a/data"].id != fid["X/b/data"].id
+        np.testing.assert_allclose(fid["X/c/time"][:], np.arange(1000) / 50.0)
+
+
+def test_irregular_time_vectors_are_linked_by_content(tmp_path):
+    time = np.cumsum(np.random.default_rng(0).uniform(0.5, 1.5, size=1000))
+    data = chutils.ChannelSet()
+    data.add_channel("a", np.ones(1000), {"sampling_rate" : 0}, time)
+    data.add_channel("b", np.ones(1000), {"sampling_rate" : 0}, time.copy())
+    data.add_channel("c", np.ones(1000), {"sampling_rate" : 0}, time + 1)
+
+    with h5py.File(str(tmp_path / "out.h5"), "w") as fid:
+        h5utils.add_data_h5(fid, "X", data, ["a", "b", "c"], shared_group=False)
+        assert fid["X/a/time"].id == fid["X/b/time"].id
+        assert fid["X/a/index/time"].id == fid["X/b/index/time"].id
+        assert fid["X/a/time"].id != fid["X/c/time"].id
+        np.testing.assert_allclose(fid["X/c/time"][:], time + 1, rtol=1e-6)
+
+
+def test_sharded_master_keeps_links(tmp_path):
+    fname_shard = str(tmp_path / "shard.h5")
+    with h5py.File(fname_shard, "w") as fid:
+        add_regular(fid)
+
+    master = shardutils.build_master(str(tmp_path / "out.h5"), [fname_shard])
+    try:
+        assert master["X/a/time"].id == master["X/b/time"].id
+        np.testing.assert_allclose(master["X/b/time"][:], np.arange(1000) / 100.0)
+    finally:
+        master.close()
+
+
+def test_later_metadata_blocks_override():
+    meta = [{"channels" : ["*"], "info" : {"a" : 1, "b" : 1}},
+            {"channels" : ["ch1"], "info" : {"b" : 2}},
+            {"channels" : ["*"], "info" : {"c" : 3}},
+            {"channels" : ["ch2"], "info" : {"c" : 4}}]
+    out = h5utils.resolve_metadata("X", meta, ["ch1", "ch2"])
+    assert out == {"X/ch1" : {"a" : 1, "b" : 2, "c" : 3},
+                   "X/ch2" : {"a" : 1, "b" : 1, "c" : 4}}
+
+    ## without channels (events and text) the wildcard is the map itself
+    assert h5utils.resolve_metadata("E", meta[:1]) == {"E" : {"a" : 1, "b" : 1}}
+
+
+def test_metadata_written_over_channel_metadata(tmp_path):
+    data = chutils.ChannelSet()
+    axis = data.add_axis(sampling_rate=10.0, length=100)
+    for name in ["ch1", "ch2"]:
+        data.add_channel(name, np.zeros(100), {"sampling_rate" : 10.0, "device" : name}, axis)
+    dset_map = {"path" : "X", "channels" : ["*"], "shared_group" : 1,
+                "meta" : [{"channels" : ["*"], "info" : {"device" : "all", "site" : "lab"}},
+                          {"channels" : ["ch2"], "info" : {"device" : "second"}}]}
+    dataset = {"filename" : "x", "data_type" : "x", "maps" : [dset_map]}
+    original = repr(dataset)
+
+    with h5py.File(str(tmp_path / "out.h5"), "w") as fid:
+        export_hdf5.export_hdf5_signal(dataset, data, fid)
+        assert fid["X/ch1"].attrs["device"] == "all"
+        assert fid["X/ch2"].attrs["device"] == "second"
+        assert fid["X/ch2"].attrs["site"] == "lab"
+        ## the group has the metadata of the first channel
+        assert fid["X"].attrs["device"] == "ch1"
+
+    ## the configuration is not modified
+    assert repr(dataset) == original
@@ -0,0 +1,85 @@
+import bz2
+import gzip
+import lzma
+
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_io as ioutils
+
+TEXT = "".join("%d,%d\n" % (i, 2 * i) for i in range(2000)).encode("utf-8")
+
+COMPRESSORS = {"gzip" : gzip.compress,
+               "bzip2" : bz2.compress,
+               "xz" : lzma.compress}
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSORS))
+def test_detect_and_read(tmp_path, compression):
+    ## the compression is detected from the contents, not the name
+    fname = write(tmp_path / "data.csv", COMPRESSORS[compression](TEXT))
+    assert ioutils.detect_compression(fname) == compression
+    with ioutils.open_input(fname, "rb") as file:
+        assert file.read() == TEXT
+
+
+def test_uncompressed(tmp_path):
+    fname = write(tmp_path / "data.gz", TEXT)
+    assert ioutils.detect_compression(fname) is None
+    assert ioutils.input_size(fname) == len(TEXT)
+
+
+def test_zstd(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    fname = write(tmp_path / "data.csv", zstandard.ZstdCompressor().compress(TEXT))
+    assert ioutils.detect_compression(fname) == "zstd"
+    assert ioutils.input_size(fname) == len(TEXT)
+    with ioutils.open_input(fname, "r") as file:
+        assert file.readline() == "0,0\n"
+
+
+def test_resolve_compressed_name(tmp_path):
+    write(tmp_path / "data.csv.gz", gzip.compress(TEXT))
+    assert ioutils.resolve_input(str(tmp_path / "data.csv")) == str(tmp_path / "data.csv.gz")
+    with ioutils.open_input(str(tmp_path / "data.csv"), "r") as file:
+        assert file.readline() == "0,0\n"
+
+
+@pytest.mark.parametrize("compression", ["gzip", "xz"])
+def test_input_size_is_exact(tmp_path, compression):
+    fname = write(tmp_path / "data", COMPRESSORS[compression](TEXT))
+    assert ioutils.input_size(fname) == len(TEXT)
+
+
+def test_input_size_is_estimated(tmp_path):
+    ## bzip2 does not store the size
+    data = bz2.compress(TEXT)
+    fname = write(tmp_path / "data", data)
+    assert ioutils.input_size(fname) == len(data) * ioutils.COMPRESSION_RATIO
+
+
+def test_memmap_of_compressed_file(tmp_path):
+    x = np.arange(1000, dtype=np.int16)
+    fname = write(tmp_path / "data.bin", gzip.compress(x.tobytes()))
+    np.testing.assert_array_equal(ioutils.open_input_memmap(fname, np.int16), x)
+
+
+def test_input_path_keeps_extension(tmp_path):
+    fname = write(tmp_path / "rec.edf.gz", gzip.compress(TEXT))
+    with ioutils.input_path(fname) as path:
+        assert path.endswith(".edf")
+        with open(path, "rb") as file:
+            assert file.read() == TEXT
+
+
+def test_iter_blocks(tmp_path):
+    fname = write(tmp_path / "data.csv", TEXT)
+    with ioutils.open_input(fname, "r") as file:
+        blocks = list(ioutils.iter_blocks(file, ",", block_size=300))
+    assert [len(i) for i in blocks] == [300] * 6 + [200]
+    np.testing.assert_array_equal(np.concatenate(blocks)[:, 1], 2 * np.arange(2000))
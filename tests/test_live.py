@@ -0,0 +1,135 @@
+import json
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+from export2hdf5 import export_hdf5
+from export2hdf5 import utilities_live as liveutils
+
+HEADER = """------------ Data File Created By ActiGraph -----
+Serial Number: X
+Start Time 10:00:00
+Start Date 01.01.2017
+Epoch Period (hh:mm:ss) 00:00:00
+Download Time 10:00:00
+Download Date 02.01.2017
+Current Memory Address: 0
+Current Battery Voltage: 4
+Mode = 12
+Accelerometer X,Accelerometer Y,Accelerometer Z
+"""
+
+## Prints the lengths of the datasets in a file opened in SWMR mode
+READER = """
+import sys, json, h5py
+out = {}
+with h5py.File(sys.argv[1], "r", swmr=True) as fid:
+    fid.visititems(lambda name, obj: out.update({name : len(obj)}) if isinstance(obj, h5py.Dataset) else None)
+print(json.dumps(out))
+"""
+
+
+def read_swmr(fname):
+    """ Return the lengths of the datasets seen by a reader in another process. """
+    res = subprocess.run([sys.executable, "-c", READER, fname], capture_output=True, text=True, check=True)
+    return json.loads(res.stdout)
+
+
+@pytest.fixture
+def config(tmp_path):
+    """ A configuration with two Actigraph recordings and text. """
+    rng = np.random.default_rng(0)
+    datasets = []
+    for i, n in enumerate([3000, 5000]):
+        fname = tmp_path / ("acti_%d.csv" % i)
+        fname.write_text(HEADER + "".join("%.3f,%.3f,%.3f\n" % tuple(x) for x in rng.normal(size=(n, 3))))
+        datasets += [{"filename" : str(fname), "data_type" : "actigraph",
+                      "maps" : [{"path" : "Acc/Actigraph_%d" % i, "channels" : ["*"], "shared_group" : i,
+                                 "meta" : [{"channels" : ["*"], "info" : {"comment" : "device %d" % i}}]}]}]
+    note = tmp_path / "note.txt"
+    note.write_text("first line\nsecond line\n")
+    datasets += [{"filename" : str(note), "data_type" : "text", "maps" : [{"path" : "Notes/note"}]}]
+
+    return {"output" : {"filename" : str(tmp_path / "out.h5")}, "datasets" : datasets}
+
+
+def test_reader_follows_export(config):
+    readers = export_hdf5.get_readerlist()
+    seen = []
+
+    def read_actigraph(fname):
+        ## the second recording is read after the first one has been written
+        if fname.endswith("acti_1.csv"):
+            seen.append(read_swmr(config["output"]["filename"]))
+        return readers["actigraph"]["function"](fname)
+
+    readerlist = {"actigraph" : dict(readers["actigraph"], function=read_actigraph), "text" : readers["text"]}
+    export_hdf5.export_datasets(config, readerlist, live=True)
+
+    ## the first recording has been written, and the datasets of the
+    ## second one have been created
+    assert seen[0]["Acc/Actigraph_0/accelerometer_z/data"] == 3000
+    assert seen[0]["Acc/Actigraph_0/accelerometer_x/time"] == 3000
+    assert seen[0]["Acc/Actigraph_1/accelerometer_x"] == 0
+    assert seen[0]["Acc/Actigraph_1/time"] == 0
+    assert seen[0]["Notes/note"] == len("first line\nsecond line\n")
+    assert read_swmr(config["output"]["filename"])["Acc/Actigraph_1/accelerometer_x"] == 5000
+
+
+def test_live_output_as_in_export(config, tmp_path):
+    export_hdf5.export_datasets(config, export_hdf5.get_readerlist(), live=True)
+    fname_live = config["output"]["filename"]
+    config["output"]["filename"] = str(tmp_path / "ref.h5")
+    export_hdf5.export_datasets(config, export_hdf5.get_readerlist())
+
+    with h5py.File(fname_live, "r") as live, h5py.File(config["output"]["filename"], "r") as ref:
+        names = []
+        ref.visit(names.append)
+        for name in names:
+            assert name in live
+            if isinstance(ref[name], h5py.Dataset):
+                np.testing.assert_array_equal(live[name][:], ref[name][:])
+            for key, value in ref[name].attrs.items():
+                if key != "factor":
+                    np.testing.assert_array_equal(live[name].attrs[key], value)
+
+        ## the estimated stopping time is replaced
+        assert live["Acc/Actigraph_1"].attrs["time_stop"] == ref["Acc/Actigraph_1"].attrs["time_stop"]
+        assert live["Acc/Actigraph_1/accelerometer_y"].attrs["stats_count"] == 5000
+        assert live["Acc/Actigraph_0/accelerometer_x"].attrs["comment"] == "device 0"
+        assert live["Acc/Actigraph_0/accelerometer_x/time"].id == live["Acc/Actigraph_0/accelerometer_y/time"].id
+
+
+def test_modify_attr(tmp_path):
+    with h5py.File(str(tmp_path / "x.h5"), "w") as fid:
+        dset = fid.create_dataset("x", data=np.zeros(3))
+        dset.attrs["rate"] = 0
+        dset.attrs["name"] = ""
+        assert liveutils.modify_attr(dset, "name", "a longer name")
+        assert liveutils.modify_attr(dset, "rate", 25.0)
+        ## a fraction does not fit an integer, and new attributes cannot be added
+        assert not liveutils.modify_attr(dset, "rate", 0.5)
+        assert not liveutils.modify_attr(dset, "other", 1)
+        assert dset.attrs["name"] == "a longer name" and dset.attrs["rate"] == 25
+        assert "other" not in dset.attrs
+
+
+def test_live_writer(tmp_path):
+    fname = str(tmp_path / "live.h5")
+    with liveutils.LiveWriter(fname, "ECG/device", ["ecg"], meta={"sampling_rate" : 100}) as writer:
+        writer.append(np.arange(100) / 100, {"ecg" : np.ones(100)})
+        assert read_swmr(fname) == {"ECG/device/ecg" : 100, "ECG/device/time" : 100}
+        writer.append(np.arange(100, 150) / 100, {"ecg" : np.zeros(50)})
+        assert read_swmr(fname)["ECG/device/ecg"] == 150
+
+        with pytest.raises(ValueError):
+            writer.append(np.arange(10), {"ecg" : np.zeros(9)})
+        with pytest.raises(ValueError):
+            writer.append(np.arange(10), {"other" : np.zeros(10)})
+
+    with h5py.File(fname, "r") as fid:
+        assert fid["ECG/device"].attrs["sampling_rate"] == 100
+        np.testing.assert_allclose(fid["ECG/device/time"][:], np.arange(150) / 100)
@@ -0,0 +1,66 @@
+import json
+
+import h5py
+import pytest
+
+from export2hdf5 import export_hdf5
+from export2hdf5 import utilities_profile as profutils
+
+HEADER = """------------ Data File Created By ActiGraph -----
+Serial Number: X
+Start Time 10:00:00
+Start Date 01.01.2017
+Epoch Period (hh:mm:ss) 00:00:00
+Download Time 10:00:00
+Download Date 02.01.2017
+Current Memory Address: 0
+Current Battery Voltage: 4
+Mode = 12
+Accelerometer X,Accelerometer Y,Accelerometer Z
+"""
+
+
+@pytest.fixture
+def config(tmp_path):
+    """ A configuration with an Actigraph recording, and the name of
+    its configuration file. """
+    acti = tmp_path / "acti.csv"
+    acti.write_text(HEADER + "0.1,0.2,0.3\n" * 1000)
+    config = {"output" : {"filename" : str(tmp_path / "out.h5")},
+              "datasets" : [{"filename" : str(acti), "data_type" : "actigraph",
+                             "maps" : [{"path" : "Acc/Actigraph", "channels" : ["*"], "shared_group" : 1}]}]}
+    fname = tmp_path / "config.json"
+    fname.write_text(json.dumps(config))
+    return config, str(fname)
+
+
+def test_report(config):
+    config, fname = config
+    rep = export_hdf5.export_hdf5(fname, profile=True, profile_h5=True)
+
+    assert not profutils.enabled() and profutils.SAMPLER is None
+    maps = [i for i in rep["stages"] if i["stage"] == "map"]
+    assert [i["path"] for i in maps] == ["Acc/Actigraph"]
+    assert maps[0]["raw_bytes"] > 0 and maps[0]["peak_rss"] > 0
+    assert rep["total"]["bytes_in"] > 0
+    with h5py.File(config["output"]["filename"], "r") as fid:
+        assert fid["Acc/Actigraph"].attrs["profile_raw_bytes"] == maps[0]["raw_bytes"]
+
+
+def test_failed_export_stops_profiling(config):
+    config, fname = config
+    readers = export_hdf5.get_readerlist()
+
+    def fail(fname):
+        raise ValueError("broken file")
+
+    readerlist = {"actigraph" : dict(readers["actigraph"], function=fail)}
+    for i in range(2):
+        ## the output file is closed, so it can be created again
+        with pytest.raises(ValueError, match="broken file"):
+            export_hdf5.export_datasets(config, readerlist, profile=True)
+        assert not profutils.enabled() and profutils.SAMPLER is None
+        assert profutils.STACK == []
+
+    with h5py.File(config["output"]["filename"], "r") as fid:
+        assert len(fid) == 0
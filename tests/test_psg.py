@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_psg as psgutils
+
+EVENT = "<Event><Type>%s</Type><Location>x</Location><StartTime>%s</StartTime><StopTime>%s</StopTime></Event>"
+
+
+@pytest.fixture
+def fname(tmp_path):
+    """ A scoring file with a hypnogram of 20 epochs, arousals and other events. """
+    events = [("LIGHTS-OFF", 0, 0)]
+    for i in range(20):
+        events += [(["SLEEP-S0", "SLEEP-S1", "SLEEP-S2", "SLEEP-REM"][i % 4], 30 * i, 30 * (i + 1))]
+        if i % 5 == 0:
+            events += [("AROUSAL", 30 * i + 3, 30 * i + 8.5)]
+    events += [("LIGHTS-ON", 600, 600)]
+
+    start = np.datetime64("2017-01-01T22:00:00", "us")
+    text = "".join(EVENT % (t, start + np.timedelta64(int(a * 1e6), "us"), start + np.timedelta64(int(b * 1e6), "us"))
+                   for t, a, b in events)
+    fname = tmp_path / "psg.xml"
+    fname.write_text('<?xml version="1.0"?><EventExport><Events>' + text + "</Events></EventExport>")
+    return str(fname)
+
+
+def test_readers_parse_the_file_once(fname):
+    psgutils.parse_psg_xml_cached.cache_clear()
+
+    hypnogram = psgutils.read_hypnogram(fname)
+    arousal = psgutils.read_arousal_hdf5(fname)
+    events = psgutils.read_psg_events_hdf5(fname)
+
+    info = psgutils.parse_psg_xml_cached.cache_info()
+    assert (info.misses, info.hits) == (1, 2)
+
+    assert hypnogram["hypnogram"].length == 20
+    assert hypnogram["hypnogram"].data.tolist()[:4] == [-2, -4, -5, -3]
+    assert len(arousal["events"]) == 4
+    np.testing.assert_allclose(arousal["events"]["duration"], 5.5)
+    assert len(events["events"]) == 26
+
+
+def test_read_psg_events(fname):
+    res = psgutils.read_psg_events(fname, {"hypnogram" : psgutils.PSG_EVENT_FAMILIES["hypnogram"],
+                                           "lights" : ["LIGHTS-OFF", "LIGHTS-ON"],
+                                           "all" : None})
+    assert res["hypnogram"]["n_events"] == 20
+    assert res["lights"]["event_type"].tolist() == ["LIGHTS-OFF", "LIGHTS-ON"]
+    assert res["all"]["n_events"] == 26
+    np.testing.assert_allclose(res["hypnogram"]["duration"], 30)
+    assert psgutils.check_spacing(res["hypnogram"]["t_start"], 30)
+    assert not psgutils.check_spacing(res["all"]["t_start"], 30)
+
+
+def test_changed_file_is_parsed_again(fname, tmp_path):
+    n = psgutils.read_psg_events(fname, {"all" : None})["all"]["n_events"]
+    with open(fname) as file:
+        text = file.read()
+    with open(fname, "w") as file:
+        file.write(text.replace("<Type>AROUSAL</Type>", "<Type>OTHER</Type>"))
+    os.utime(fname, (0, os.path.getmtime(fname) + 10))
+
+    res = psgutils.read_psg_events(fname, {"arousal" : ["AROUSAL"], "all" : None})
+    assert res["arousal"]["n_events"] == 0
+    assert res["all"]["n_events"] == n
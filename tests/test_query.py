@@ -0,0 +1,112 @@
+import bisect
+
+import h5py
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_channels as chutils
+from export2hdf5 import utilities_h5 as h5utils
+from export2hdf5 import utilities_query as queryutils
+
+
+@pytest.fixture
+def fname(tmp_path):
+    """ A file with a regularly sampled shared group, irregularly
+    sampled channels and events. """
+    fname = str(tmp_path / "out.h5")
+    rng = np.random.default_rng(0)
+
+    regular = chutils.ChannelSet()
+    axis = regular.add_axis(sampling_rate=100.0, length=100000)
+    for name in ["a", "b"]:
+        regular.add_channel(name, rng.normal(size=100000), {"sampling_rate" : 100.0}, axis)
+
+    irregular = chutils.ChannelSet()
+    time = np.cumsum(rng.uniform(0.5, 1.5, size=50000))
+    irregular.add_channel("ibi", rng.normal(size=50000), {"sampling_rate" : 0}, time)
+
+    dtype = np.dtype([("onset", "f8"), ("code", "i4")])
+    events = np.zeros(20000, dtype=dtype)
+    events["onset"] = np.arange(20000) * 0.25
+    events["code"] = np.arange(20000)
+
+    with h5py.File(fname, "w") as fid:
+        h5utils.add_data_h5(fid, "EEG/device", regular, ["a", "b"], shared_group=True)
+        h5utils.add_data_h5(fid, "IBI/device", irregular, ["ibi"], shared_group=False)
+        h5utils.add_events_h5(fid, "Events/device", events, dtype)
+    return fname
+
+
+def test_chunk_cache_reads_and_evicts(tmp_path):
+    x = np.arange(10000, dtype=np.float32)
+    with h5py.File(str(tmp_path / "x.h5"), "w") as fid:
+        dset = fid.create_dataset("x", data=x, chunks=(100,))
+        cache = queryutils.ChunkCache(size=5 * 100 * 4)
+
+        np.testing.assert_array_equal(cache.read(dset, 150, 420), x[150:420])
+        assert cache.misses == 4 and cache.hits == 0
+        np.testing.assert_array_equal(cache.read(dset, 300, 310), x[300:310])
+        assert cache.hits == 1
+
+        ## the least recently used chunks are discarded
+        cache.read(dset, 1000, 1500)
+        assert cache.used <= cache.size
+        assert (dset.name, 1) not in cache.chunks
+        assert (dset.name, 14) in cache.chunks
+
+        assert len(cache.read(dset, 5, 5)) == 0
+
+
+def test_search_index():
+    values = np.sort(np.random.default_rng(1).uniform(0, 100, size=1000))
+    index = (values[::64], 64)
+    for t in [-1, 0, 3.3, 50, 99.99, 200]:
+        assert queryutils.search_index(values, t, index) == bisect.bisect_left(values, t)
+
+
+def test_list_channels(fname):
+    with queryutils.ExportReader(fname) as reader:
+        assert sorted(reader.list_channels("EEG/device")) == ["a", "b"]
+        assert reader.list_channels("IBI/device") == ["ibi"]
+
+
+def test_read_regular_window(fname):
+    with h5py.File(fname, "r") as fid:
+        a = fid["EEG/device/a"][:]
+        b = fid["EEG/device/b"][:]
+
+    with queryutils.ExportReader(fname) as reader:
+        assert reader.get_channel("EEG/device", "a")["sampling_rate"] == 100.0
+        time, data = reader.read("EEG/device", ["a", "b"], 10.0, 12.5)
+        np.testing.assert_allclose(time, np.arange(1000, 1250) / 100.0)
+        np.testing.assert_array_equal(data[:, 0], a[1000:1250])
+        np.testing.assert_array_equal(data[:, 1], b[1000:1250])
+
+        time, data = reader.read("EEG/device", "a", t1=0.05)
+        np.testing.assert_array_equal(data, a[:5])
+
+
+def test_read_irregular_window(fname):
+    with h5py.File(fname, "r") as fid:
+        time_all = fid["IBI/device/ibi/time"][:]
+        data_all = fid["IBI/device/ibi/data"][:]
+        assert "index" in fid["IBI/device/ibi"]
+
+    with queryutils.ExportReader(fname) as reader:
+        assert reader.get_channel("IBI/device", "ibi")["sampling_rate"] == 0
+        for t0, t1 in [(0, 10), (1234.5, 5678.9), (40000, 1e9)]:
+            mask = (time_all >= t0) & (time_all < t1)
+            time, data = reader.read("IBI/device", "ibi", t0, t1)
+            np.testing.assert_array_equal(time, time_all[mask])
+            np.testing.assert_array_equal(data, data_all[mask])
+
+
+def test_read_events(fname):
+    with queryutils.ExportReader(fname) as reader:
+        events = reader.read_events("Events/device", 100.0, 200.0)
+    np.testing.assert_array_equal(events["code"], np.arange(400, 800))
+
+
+def test_read_window(fname):
+    time, data = queryutils.read_window(fname, "EEG/device", "b", 1.0, 1.1)
+    assert len(time) == len(data) == 10
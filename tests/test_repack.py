@@ -0,0 +1,84 @@
+import h5py
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_repack as repackutils
+
+
+def make_file(fname, path, shuffle=False, level=4):
+    x = np.random.default_rng(0).normal(size=100000).astype(np.float32)
+    with h5py.File(fname, "w") as fid:
+        fid.attrs["source"] = fname
+        dset = fid.create_dataset(path + "/x/data", data=x, chunks=(4096,),
+                                  compression="gzip", compression_opts=level, shuffle=shuffle)
+        dset.attrs["sampling_rate"] = 100.0
+        fid.create_dataset(path + "/x/time", data=np.arange(len(x), dtype=np.float32) / 100, chunks=(4096,),
+                           compression="gzip", compression_opts=level, shuffle=shuffle)
+        fid[path + "/y/time"] = fid[path + "/x/time"]
+        fid.create_dataset(path + "/notes", data=["text"], dtype=h5py.string_dtype())
+    return x
+
+
+def test_direct_copy(tmp_path):
+    fname_in, fname_out = str(tmp_path / "in.h5"), str(tmp_path / "out.h5")
+    x = make_file(fname_in, "EEG")
+
+    counts = repackutils.merge_files([fname_in], fname_out)
+    assert counts == {"direct" : 2, "recompress" : 0, "h5py" : 1, "link" : 1}
+
+    with h5py.File(fname_in, "r") as src, h5py.File(fname_out, "r") as out:
+        np.testing.assert_array_equal(out["EEG/x/data"][:], x)
+        assert out["EEG/x/data"].attrs["sampling_rate"] == 100.0
+        assert out["EEG/x/data"].compression_opts == 4
+        ## the compressed chunks are copied as they are
+        assert src["EEG/x/data"].id.read_direct_chunk((0,)) == out["EEG/x/data"].id.read_direct_chunk((0,))
+        assert out["EEG/y/time"] == out["EEG/x/time"]
+        assert out["EEG/notes"].asstr()[0] == "text"
+
+
+def test_recompress(tmp_path):
+    fname_in, fname_out = str(tmp_path / "in.h5"), str(tmp_path / "out.h5")
+    x = make_file(fname_in, "EEG", shuffle=False, level=1)
+
+    counts = repackutils.merge_files([fname_in], fname_out, compression="gzip", level=9, shuffle=True, jobs=2)
+    assert counts["recompress"] == 2 and counts["direct"] == 0
+
+    with h5py.File(fname_out, "r") as out:
+        dset = out["EEG/x/data"]
+        assert dset.compression == "gzip" and dset.compression_opts == 9 and dset.shuffle
+        np.testing.assert_array_equal(dset[:], x)
+
+
+def test_other_filters_through_h5py(tmp_path):
+    fname_in, fname_out = str(tmp_path / "in.h5"), str(tmp_path / "out.h5")
+    x = make_file(fname_in, "EEG")
+
+    counts = repackutils.merge_files([fname_in], fname_out, compression="lzf")
+    assert counts["h5py"] == 3
+
+    with h5py.File(fname_out, "r") as out:
+        assert out["EEG/x/data"].compression == "lzf"
+        np.testing.assert_array_equal(out["EEG/x/data"][:], x)
+
+
+def test_merge(tmp_path):
+    fnames = [str(tmp_path / "a.h5"), str(tmp_path / "b.h5")]
+    make_file(fnames[0], "EEG")
+    make_file(fnames[1], "ECG")
+
+    repackutils.merge_files(fnames, str(tmp_path / "out.h5"))
+    with h5py.File(str(tmp_path / "out.h5"), "r") as out:
+        assert sorted(out) == ["ECG", "EEG"]
+        ## the later files override the attributes of the root
+        assert out.attrs["source"] == fnames[1]
+
+
+def test_merge_errors(tmp_path):
+    fnames = [str(tmp_path / "a.h5"), str(tmp_path / "b.h5")]
+    make_file(fnames[0], "EEG")
+    make_file(fnames[1], "EEG")
+
+    with pytest.raises(ValueError):
+        repackutils.merge_files(fnames, str(tmp_path / "out.h5"))
+    with pytest.raises(ValueError):
+        repackutils.merge_files(fnames, fnames[0])
@@ -0,0 +1,76 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_shards as shardutils
+
+
+def make_shard(fname, path, values, text=None):
+    with h5py.File(fname, "w") as fid:
+        grp = fid.create_group(path)
+        grp.attrs["device"] = "test"
+        dset = grp.create_dataset("x/data", data=values)
+        dset.attrs["sampling_rate"] = 10.0
+        grp.create_dataset("x/time", data=np.arange(len(values)) / 10.0)
+        ## a hard link, as for the time vectors shared by channels
+        grp.create_group("y")
+        grp["y/time"] = grp["x/time"]
+        if text is not None:
+            fid.create_dataset("Notes/text", data=[text], dtype=h5py.string_dtype())
+
+
+def test_shard_names():
+    names = shardutils.get_shard_names("/data/out.h5", 2)
+    assert names == ["/data/out_shards/out_0000.h5", "/data/out_shards/out_0001.h5"]
+
+
+def test_is_vlen_dtype():
+    assert not shardutils.is_vlen_dtype(np.dtype("f4"))
+    assert not shardutils.is_vlen_dtype(np.dtype([("onset", "f8"), ("code", "i4")]))
+    assert shardutils.is_vlen_dtype(h5py.string_dtype())
+    assert shardutils.is_vlen_dtype(np.dtype([("onset", "f8"), ("label", h5py.string_dtype())]))
+
+
+def test_build_master(tmp_path):
+    fname = str(tmp_path / "out.h5")
+    shards = shardutils.get_shard_names(fname, 2)
+    os.makedirs(shardutils.get_shard_dir(fname))
+    make_shard(shards[0], "EEG/device", np.arange(100, dtype=np.float32), text="notes")
+    make_shard(shards[1], "ECG/device", np.ones(50, dtype=np.float32))
+
+    shardutils.build_master(fname, shards).close()
+
+    ## the shards are referred to by relative paths
+    moved = tmp_path / "moved"
+    moved.mkdir()
+    shutil.move(fname, str(moved / "out.h5"))
+    shutil.move(shardutils.get_shard_dir(fname), str(moved / "out_shards"))
+
+    with h5py.File(str(moved / "out.h5"), "r") as fid:
+        dset = fid["EEG/device/x/data"]
+        assert dset.is_virtual
+        np.testing.assert_array_equal(dset[:], np.arange(100))
+        assert dset.attrs["sampling_rate"] == 10.0
+        assert fid["EEG/device"].attrs["device"] == "test"
+        np.testing.assert_array_equal(fid["ECG/device/x/data"][:], np.ones(50))
+
+        ## the hard link is kept
+        assert fid["EEG/device/y/time"] == fid["EEG/device/x/time"]
+
+        ## strings cannot be virtual and are external links
+        assert isinstance(fid.get("Notes/text", getlink=True), h5py.ExternalLink)
+        assert fid["Notes/text"].asstr()[0] == "notes"
+
+
+def test_conflicting_paths(tmp_path):
+    fname = str(tmp_path / "out.h5")
+    shards = shardutils.get_shard_names(fname, 2)
+    os.makedirs(shardutils.get_shard_dir(fname))
+    for i in shards:
+        make_shard(i, "EEG/device", np.zeros(10, dtype=np.float32))
+
+    with pytest.raises(ValueError):
+        shardutils.build_master(fname, shards)
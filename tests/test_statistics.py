@@ -0,0 +1,62 @@
+import h5py
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_statistics as statutils
+
+
+def accumulate(x, block_size):
+    acc = statutils.init_statistics()
+    for start in range(0, len(x), block_size):
+        statutils.update_statistics(acc, x[start:start + block_size])
+    return statutils.get_statistics(acc)
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 100, 10000])
+def test_blocks_match_whole_signal(block_size):
+    x = np.random.default_rng(0).normal(5.0, 2.0, size=1000)
+    stats = accumulate(x, block_size)
+
+    assert stats["count"] == 1000
+    assert stats["nan_count"] == 0
+    assert stats["min"] == x.min()
+    assert stats["max"] == x.max()
+    assert stats["mean"] == pytest.approx(x.mean(), rel=1e-12)
+    assert stats["std"] == pytest.approx(x.std(), rel=1e-12)
+
+
+def test_nan_values():
+    x = np.array([1.0, np.nan, 3.0, np.nan, np.nan])
+    stats = accumulate(x, 2)
+    assert stats["count"] == 2
+    assert stats["nan_count"] == 3
+    assert stats["mean"] == 2.0
+
+
+def test_clipping_counts():
+    x = np.array([0, 5, 5, 1, 0, 5, 2], dtype=np.float32)
+    stats = accumulate(x, 3)
+    assert (stats["min"], stats["min_count"]) == (0.0, 2)
+    assert (stats["max"], stats["max_count"]) == (5.0, 3)
+
+
+def test_flat_run_across_blocks():
+    x = np.array([1, 2, 2, 2, 2, 2, 3, 3, 1], dtype=np.float64)
+    for block_size in [1, 2, 4, 9]:
+        assert accumulate(x, block_size)["longest_flat"] == 5
+
+
+def test_empty_signal():
+    stats = statutils.get_statistics(statutils.init_statistics())
+    assert stats["count"] == 0
+    assert np.isnan(stats["mean"]) and np.isnan(stats["std"])
+
+
+def test_add_statistics(tmp_path):
+    acc = statutils.init_statistics()
+    statutils.update_statistics(acc, np.array([1.0, 2.0, 3.0]))
+    with h5py.File(str(tmp_path / "stats.h5"), "w") as fid:
+        dset = fid.create_dataset("x", data=np.zeros(3))
+        statutils.add_statistics(dset, acc)
+        assert dset.attrs[statutils.PREFIX + "mean"] == 2.0
+        assert dset.attrs[statutils.PREFIX + "count"] == 3
@@ -0,0 +1,70 @@
+import h5py
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_h5 as h5utils
+from export2hdf5 import utilities_query as queryutils
+
+LINES = ["line %d ä" % i for i in range(5000)]
+
+
+@pytest.fixture
+def fname(tmp_path, monkeypatch):
+    """ A file with text written in several blocks, and text written
+    as a variable-length string by earlier versions. """
+    monkeypatch.setattr(h5utils, "BLOCK_SIZE", 1000)
+    monkeypatch.setattr(h5utils, "TEXT_CHUNK_SIZE", 1000)
+    monkeypatch.setattr(h5utils, "LINE_INDEX_FACTOR", 100)
+
+    fname = str(tmp_path / "out.h5")
+    with h5py.File(fname, "w") as fid:
+        h5utils.add_text_h5(fid, "Notes/text", "\r\n".join(LINES) + "\r\n")
+        h5utils.add_text_h5(fid, "Notes/empty", "")
+        fid.create_dataset("Notes/old", data=["\n".join(LINES)], dtype=h5py.string_dtype())
+    return fname
+
+
+def test_text_is_written(fname):
+    text = "\r\n".join(LINES) + "\r\n"
+    with h5py.File(fname, "r") as fid:
+        dset = fid["Notes/text"]
+        assert h5utils.is_text_h5(dset) and h5utils.is_text_h5(fid["Notes/old"])
+        assert dset[:].tobytes() == text.encode("utf-8")
+
+        ## the index points at the start of every factor:th line
+        index = dset.attrs["line_index"]
+        factor = int(dset.attrs["line_index_factor"])
+        starts = [0] + [i + 1 for i, c in enumerate(dset[:]) if c == ord("\n")]
+        assert index.tolist() == starts[::factor][:len(index)]
+
+
+def test_line_index_is_thinned(tmp_path, monkeypatch):
+    monkeypatch.setattr(h5utils, "LINE_INDEX_FACTOR", 1)
+    monkeypatch.setattr(h5utils, "MAX_LINE_INDEX", 100)
+    with h5py.File(str(tmp_path / "out.h5"), "w") as fid:
+        h5utils.add_text_h5(fid, "text", "\n".join(LINES))
+        assert len(fid["text"].attrs["line_index"]) <= 100
+        assert fid["text"].attrs["line_index_factor"] == 64
+
+    with queryutils.ExportReader(str(tmp_path / "out.h5")) as reader:
+        assert reader.read_lines("text", 4321, 4323) == LINES[4321:4323]
+
+
+@pytest.mark.parametrize("path", ["Notes/text", "Notes/old"])
+def test_read_lines(fname, path):
+    with queryutils.ExportReader(fname) as reader:
+        assert reader.read_lines(path) == LINES
+        assert reader.read_lines(path, 0, 3) == LINES[:3]
+        assert reader.read_lines(path, 99, 101) == LINES[99:101]
+        assert reader.read_lines(path, 4990) == LINES[4990:]
+        assert reader.read_lines(path, 6000) == []
+
+
+def test_read_text(fname):
+    with queryutils.ExportReader(fname) as reader:
+        assert reader.read_text("Notes/empty") == ""
+        assert reader.read_lines("Notes/empty") == []
+        assert reader.read_text("Notes/text", 0, 9) == LINES[0]
+        ## the offsets are in bytes, and split characters are replaced
+        assert reader.read_text("Notes/text", 0, 8) == LINES[0][:7] + "\ufffd"
+        assert reader.read_text("Notes/old").split("\n") == LINES
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from export2hdf5 import utilities_channels as chutils
+from export2hdf5 import utilities_transform as transformutils
+
+
+def make_set(x, sampling_rate=1000.0):
+    data = chutils.ChannelSet()
+    data.add_channel("x", x, {"unit" : "uV"}, sampling_rate=sampling_rate)
+    return data
+
+
+def test_decimate_uses_antialiasing_filter():
+    pytest.importorskip("scipy")
+    x = np.arange(1001, dtype=np.float64)
+    out = transformutils.transform_channels(make_set(x), ["x"], {"decimate" : 10})
+    ch = out["x"]
+    assert ch.length == 101
+    assert ch.sampling_rate == 100.0
+    assert ch.meta["decimation"] == 10
+    assert "filter" in ch.meta
+
+
+def test_no_transform_keeps_samples():
+    x = np.random.default_rng(0).normal(size=1000)
+    out = transformutils.transform_channels(make_set(x), ["x"], {})
+    np.testing.assert_array_equal(out["x"].read(0, 1000), x)
+    assert "filter" not in out["x"].meta
+
+
+def test_fir_zero_phase_matches_whole_signal(monkeypatch):
+    pytest.importorskip("scipy")
+    x = np.random.default_rng(1).normal(size=5000)
+    transform = {"decimate" : 4, "filter" : "fir", "order" : 41}
+    filt = transformutils.design_filter(transform, 1000.0)
+    expected = np.convolve(x, filt["taps"], mode="same")[::4]
+
+    ## small blocks, so that the result depends on the joins of the blocks
+    monkeypatch.setattr(transformutils, "BLOCK_SIZE", 333)
+    out = transformutils.transform_channels(make_set(x), ["x"], transform)
+    y = out["x"].read(0, out["x"].length)
+
+    assert len(y) == len(expected)
+    np.testing.assert_allclose(y, expected, atol=1e-12)
+
+
+def test_iir_blocks_join(monkeypatch):
+    pytest.importorskip("scipy")
+    x = np.random.default_rng(2).normal(size=20000)
+    transform = {"filter" : "iir", "cutoff" : 50, "zero_phase" : 0}
+
+    whole = transformutils.transform_channels(make_set(x), ["x"], transform)["x"].read(0, 20000)
+    monkeypatch.setattr(transformutils, "BLOCK_SIZE", 1000)
+    blocks = transformutils.transform_channels(make_set(x), ["x"], transform)["x"].read(0, 20000)
+
+    np.testing.assert_allclose(blocks, whole, atol=1e-6)
+
+
+def test_shared_axis_is_kept():
+    pytest.importorskip("scipy")
+    data = chutils.ChannelSet()
+    axis = data.add_axis(sampling_rate=100.0, length=50)
+    data.add_channel("a", np.zeros(50), {}, axis)
+    data.add_channel("b", np.ones(50), {}, axis)
+
+    out = transformutils.transform_channels(data, ["a", "b"], {"decimate" : 5})
+    assert out["a"].axis is out["b"].axis
+    assert out["a"].axis.length == 10
+
+
+def test_irregular_channel_is_rejected():
+    data = chutils.ChannelSet()
+    data.add_channel("x", np.zeros(3), {}, np.array([0.0, 0.5, 2.0]))
+    with pytest.raises(ValueError):
+        transformutils.transform_channels(data, ["x"], {"decimate" : 2})
+
+
+def test_invalid_decimation():
+    with pytest.raises(ValueError):
+        transformutils.transform_channels(make_set(np.zeros(10)), ["x"], {"decimate" : 0})
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from export2hdf5 import export_hdf5
+
+HEADER = """------------ Data File Created By ActiGraph -----
+Serial Number: X
+Start Time 10:00:00
+Start Date 01.01.2017
+Epoch Period (hh:mm:ss) 00:00:00
+Download Time 10:00:00
+Download Date 02.01.2017
+Current Memory Address: 0
+Current Battery Voltage: 4
+Mode = 12
+Accelerometer X,Accelerometer Y,Accelerometer Z
+"""
+
+
+@pytest.fixture
+def fname(tmp_path):
+    """ A configuration file with a missing channel. """
+    acti = tmp_path / "acti.csv"
+    acti.write_text(HEADER + "0.1,0.2,0.3\n" * 100)
+    config = {"output" : {"filename" : str(tmp_path / "out.h5")},
+              "datasets" : [{"filename" : str(acti), "data_type" : "actigraph",
+                             "maps" : [{"path" : "Acc/All", "channels" : ["*"], "shared_group" : 1},
+                                       {"path" : "Acc/Some", "channels" : ["accelerometer_x", "accelerometer_w"],
+                                        "shared_group" : 1}]},
+                            {"filename" : str(tmp_path / "missing.csv"), "data_type" : "actigraph",
+                             "maps" : [{"path" : "Acc/Missing", "channels" : ["*"], "shared_group" : 1}]},
+                            {"filename" : str(acti), "data_type" : "unknown", "maps" : []}]}
+    fname = tmp_path / "config.json"
+    fname.write_text(json.dumps(config))
+    return str(fname)
+
+
+def read_samples(fname):
+    raise AssertionError("The samples were read.")
+
+
+def test_only_headers_are_read(fname, monkeypatch):
+    readers = export_hdf5.get_readerlist()
+    readerlist = {"actigraph" : dict(readers["actigraph"], function=read_samples)}
+    monkeypatch.setattr(export_hdf5, "get_readerlist", lambda: readerlist)
+
+    res = export_hdf5.validate_sources(fname)
+    assert len(res) == 3
+    assert res[0].startswith("Channel accelerometer_w not found in ")
+    assert res[1].startswith("Unable to read ")
+    assert res[2] == "Unknown data type: unknown"
+
+
+def test_reader_without_probe(fname, monkeypatch):
+    readers = export_hdf5.get_readerlist()
+    readerlist = {"actigraph" : dict(readers["actigraph"], probe=None)}
+    monkeypatch.setattr(export_hdf5, "get_readerlist", lambda: readerlist)
+
+    assert len(export_hdf5.validate_sources(fname)) == 3
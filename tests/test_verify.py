@@ -0,0 +1,103 @@
+import json
+
+import h5py
+import numpy as np
+import pytest
+
+from export2hdf5 import export_hdf5
+from export2hdf5 import utilities_verify as verifyutils
+
+HEADER = """------------ Data File Created By ActiGraph -----
+Serial Number: X
+Start Time 10:00:00
+Start Date 01.01.2017
+Epoch Period (hh:mm:ss) 00:00:00
+Download Time 10:00:00
+Download Date 02.01.2017
+Current Memory Address: 0
+Current Battery Voltage: 4
+Mode = 12
+Accelerometer X,Accelerometer Y,Accelerometer Z
+"""
+
+
+@pytest.fixture
+def config(tmp_path):
+    """ A configuration exporting Actigraph data and text, and the
+    exported file. """
+    x = np.random.default_rng(0).normal(size=(5000, 3))
+    acti = tmp_path / "acti.csv"
+    acti.write_text(HEADER + "".join("%.3f,%.3f,%.3f\n" % tuple(i) for i in x))
+    note = tmp_path / "note.txt"
+    note.write_text("first line\nsecond line\n")
+
+    config = {"output" : {"filename" : str(tmp_path / "out.h5")},
+              "datasets" : [{"filename" : str(acti), "data_type" : "actigraph",
+                             "maps" : [{"path" : "Acc/Actigraph", "channels" : ["*"], "shared_group" : 1}]},
+                            {"filename" : str(note), "data_type" : "text",
+                             "maps" : [{"path" : "Notes/note"}]}]}
+    fname = tmp_path / "config.json"
+    fname.write_text(json.dumps(config))
+    export_hdf5.export_hdf5(str(fname))
+    return config
+
+
+def test_export_passes(config):
+    rep = verifyutils.verify_export(config)
+    assert rep["passed"]
+    assert [i["path"] for i in rep["maps"]] == ["Acc/Actigraph", "Notes/note"]
+    assert rep["maps"][0]["samples"] == 4 * 5000
+
+
+def test_modified_output_fails(config):
+    with h5py.File(config["output"]["filename"], "a") as fid:
+        fid["Acc/Actigraph/accelerometer_y"][100] += 1
+        fid["Notes/note"][0] = ord("F")
+
+    rep = verifyutils.verify_export(config)
+    assert not rep["passed"]
+    assert rep["maps"][0]["channels"]["accelerometer_y"]["mismatches"] == 1
+    assert rep["maps"][1]["mismatches"] == 1
+
+
+def test_missing_channel_fails(config):
+    config["datasets"][0]["maps"][0]["channels"] = ["accelerometer_x", "accelerometer_w"]
+    rep = verifyutils.verify_export(config)
+    assert rep["maps"][0]["missing"] == ["accelerometer_w"]
+    assert rep["maps"][0]["mismatches"] == 0
+    assert not rep["passed"]
+
+
+def test_sampled_blocks(config):
+    assert verifyutils.choose_blocks(100, 0.1) == sorted(set(verifyutils.choose_blocks(100, 0.1)))
+    assert len(verifyutils.choose_blocks(100, 0.1)) == 10
+    assert verifyutils.choose_blocks(3, 0.1) == [0, 2]
+    assert verifyutils.choose_blocks(3, None) == [0, 1, 2]
+    assert verifyutils.verify_export(config, sample=0.5)["passed"]
+
+
+def test_large_integers_as_written(tmp_path):
+    ## integers above 2**24 are rounded in the float32 output
+    src = np.array([2**24 + 1, 2**31 - 1, -2**30 - 7, 3], dtype=np.int64)
+    with h5py.File(str(tmp_path / "x.h5"), "w") as fid:
+        dset = fid.create_dataset("x", data=src.astype(np.float32))
+        rep = verifyutils.verify_signal(lambda start, stop: src[start:stop], len(src), dset)
+    assert rep["mismatches"] == 0
+
+
+def test_compare_block():
+    src = np.array([1.0, np.nan, 3.0])
+    assert verifyutils.compare_block(src, src.astype(np.float32)) == (0, 0.0)
+    assert verifyutils.compare_block(src, np.array([1.0, 2.0, 3.0], dtype=np.float32))[0] == 1
+    assert verifyutils.compare_block(src, np.zeros(2, dtype=np.float32)) == (3, np.inf)
+
+
+def test_report_is_standard_json(tmp_path):
+    rep = {"output" : "out.h5", "passed" : False,
+           "maps" : [{"max_error" : np.inf, "channels" : {"x" : {"max_error" : float("nan")}}}]}
+    fname = str(tmp_path / "report.json")
+    verifyutils.write_report(rep, fname)
+    with open(fname) as file:
+        text = file.read()
+    assert "Infinity" not in text and "NaN" not in text
+    assert json.loads(text)["maps"][0]["max_error"] is None